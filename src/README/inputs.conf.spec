@@ -20,5 +20,63 @@ password = <value>
 clean_html = <value>
 * Indicates if the HTML content in the output to human readable text
 
+html_processing = <value>
+* How the HTML in the entries is processed; one of raw, sanitized, text or plaintext
+* raw leaves the HTML as it is in the feed, sanitized removes unsafe markup and makes links absolute, text converts the HTML to human readable text (markdown)
+* plaintext reduces the HTML to just its text (no links, formatting or wrapping; block elements like paragraphs are put on separate lines), which is much faster than text and works just as well for searching
+* Defaults to text if clean_html is enabled and sanitized otherwise; the feed is parsed with only the processing that the profile needs
+
 proxy = <value>
-* Defines the proxy through which connection will be made via
\ No newline at end of file
+* Defines the proxy through which connection will be made via
+
+batch_output = <value>
+* If true, all of the entries retrieved from a single poll of the feed will be written into one stash file instead of one file per entry
+
+max_events_per_file = <value>
+* The maximum number of entries to write into a single stash file when batch_output is enabled (0 for no limit)
+
+max_bytes_per_file = <value>
+* The approximate maximum size (in bytes) of a single stash file when batch_output is enabled (0 for no limit)
+* The size is in bytes of UTF-8, not characters; the header of the file isn't counted and a file always gets at least one entry even if the entry is larger than the limit
+
+output_format = <value>
+* The format that the entries are written in; one of kv or json (defaults to kv)
+* kv writes the fields as key/value pairs (sourcetype syndication); json writes each entry as a JSON object (sourcetype syndication_json) whose fields are extracted with KV_MODE = json at search time instead of KV_MODE = auto_escaped
+* json is no faster to write than kv (escaping the text of long entries costs about as much as not sorting the fields saves) and the events are slightly larger
+* The sourcetype of the input is used instead if one is set; the sourcetype of json entries ought to use KV_MODE = json
+
+worker_threads = <value>
+* The number of feeds that can be retrieved at the same time
+* The threads are shared by all of the inputs so this ought to be set in the default stanza; the largest value configured is used
+
+max_connections_per_host = <value>
+* The maximum number of feeds from the same host that can be retrieved at the same time
+
+connect_timeout = <value>
+* How long to wait for a connection to the feed server to be established (defaults to 30s)
+
+read_timeout = <value>
+* How long to wait for data from the feed server once connected (defaults to 1m)
+
+cycle_deadline = <value>
+* How long an input can wait to run before it is cancelled and rescheduled (defaults to 10m)
+* Inputs that are still running past the deadline are logged
+* This applies to all of the inputs so this ought to be set in the default stanza; the largest value configured is used
+
+ca_bundle = <value>
+* The path to a file of CA certificates to use for verifying HTTPS feed servers (the system's certificates are used if not provided)
+* Relative paths are relative to SPLUNK_HOME; the file is only loaded once per process
+
+conversion_cache_size = <value>
+* The maximum number of HTML conversions to keep in the cache in the checkpoint directory (defaults to 10000)
+* Entries whose HTML was already converted on an earlier poll (or by the feedstail search command) are loaded from the cache instead of being converted again; the least recently used conversions are removed once the cache is full
+* This applies to all of the inputs so this ought to be set in the default stanza; the largest value configured is used
+
+conversion_workers = <value>
+* The number of processes to convert the HTML of large feeds in so that the conversions can use more than one CPU (defaults to converting on the input's threads)
+* This applies to all of the inputs so this ought to be set in the default stanza; the largest value configured is used
+
+conversion_batch_size = <value>
+* The number of entries to send to the conversion processes at a time (defaults to 50)
+* Feeds with fewer entries than this are converted on the input's threads since sending them to the processes would cost more than it saves
+* This applies to all of the inputs so this ought to be set in the default stanza; the largest value configured is used
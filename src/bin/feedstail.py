@@ -3,10 +3,14 @@ This module provides a search command for retrieving information from RSS feeds.
 """
 
 import sys
+import os
+import sqlite3
 
 from splunk.util import normalizeBoolean
+from splunk.clilib.bundle_paths import make_splunkhome_path
 
 from syndication_app.search_command import SearchCommand
+from syndication_app.conversion_store import ConversionStore
 from syndication import SyndicationModularInput
 
 class FeedsTail(SearchCommand):
@@ -24,9 +28,33 @@ class FeedsTail(SearchCommand):
          # Initialize the class
         SearchCommand.__init__(self, run_in_preview=True, logger_name='feeds_tail_search_command')
 
+    def open_conversion_store(self):
+        """
+        Open the cache of HTML conversions that the modular input keeps in its checkpoint directory
+        (returns None if it cannot be opened). The size of the cache is left to the modular input.
+        """
+
+        checkpoint_dir = make_splunkhome_path(['var', 'lib', 'splunk', 'modinputs', 'syndication'])
+
+        if not os.path.isdir(checkpoint_dir):
+            return None
+
+        try:
+            return ConversionStore(os.path.join(checkpoint_dir, ConversionStore.FILE_NAME), max_entries=None, logger=self.logger)
+        except sqlite3.Error:
+            self.logger.exception("Unable to open the HTML conversion cache, checkpoint_dir=%s", checkpoint_dir)
+            return None
+
     def handle_results(self, results, session_key, in_preview):
 
-        results = SyndicationModularInput.get_feed(self.url, self.username, self.password, clean_html=self.clean_html, logger=self.logger)
+        conversion_store = self.open_conversion_store() if self.clean_html else None
+
+        try:
+            results = SyndicationModularInput.get_feed(self.url, username=self.username, password=self.password, clean_html=self.clean_html, logger=self.logger, conversion_store=conversion_store)
+        finally:
+            if conversion_store is not None:
+                conversion_store.close()
+
         self.output_results(results)
 
 if __name__ == '__main__':
@@ -36,6 +36,19 @@ __version__ = (2016, 9, 19)
 # TODO:
 # Support decoded entities with UNIFIABLE.
 
+try:
+    nochr = unicode('')
+    unicode_character = unichr
+except NameError:
+    nochr = str('')
+    unicode_character = chr
+
+# Non-breaking spaces are kept as a placeholder until the text is complete.
+# This is done once here rather than each time a converter is made so that
+# making converters doesn't modify the module's state.
+unifiable_n.pop(name2cp('nbsp'), None)
+config.UNIFIABLE['nbsp'] = '&nbsp_place_holder;'
+
 
 class HTML2Text(HTMLParser.HTMLParser):
     def __init__(self, out=None, baseurl='', bodywidth=config.BODY_WIDTH):
@@ -51,9 +64,6 @@ class HTML2Text(HTMLParser.HTMLParser):
         HTMLParser.HTMLParser.__init__(self, **kwargs)
 
         # Config options
-        self.split_next_td = False
-        self.td_count = 0
-        self.table_start = False
         self.unicode_snob = config.UNICODE_SNOB  # covered in cli
         self.escape_snob = config.ESCAPE_SNOB  # covered in cli
         self.links_each_paragraph = config.LINKS_EACH_PARAGRAPH
@@ -87,9 +97,23 @@ class HTML2Text(HTMLParser.HTMLParser):
         else:  # pragma: no cover
             self.out = out
 
+        self.absolute_url_matcher = re.compile(r'^[a-zA-Z+]+://')
+        self.baseurl = baseurl
+
+    def reset(self):
+        """
+        Clear the state of the document being processed so that the
+        converter can be re-used for another document (the options are
+        kept).
+        """
+        HTMLParser.HTMLParser.reset(self)
+
         # empty list to store output characters before they are "joined"
         self.outtextlist = []
 
+        self.split_next_td = False
+        self.td_count = 0
+        self.table_start = False
         self.quiet = 0
         self.p_p = 0  # number of newline character to print before next output
         self.outcount = 0
@@ -99,7 +123,6 @@ class HTML2Text(HTMLParser.HTMLParser):
         self.astack = []
         self.maybe_automatic_link = None
         self.empty_link = False
-        self.absolute_url_matcher = re.compile(r'^[a-zA-Z+]+://')
         self.acount = 0
         self.list = []
         self.blockquote = 0
@@ -118,13 +141,6 @@ class HTML2Text(HTMLParser.HTMLParser):
         self.abbr_title = None  # current abbreviation definition
         self.abbr_data = None  # last inner HTML (for abbr being defined)
         self.abbr_list = {}  # stack of abbreviations to write later
-        self.baseurl = baseurl
-
-        try:
-            del unifiable_n[name2cp('nbsp')]
-        except KeyError:
-            pass
-        config.UNIFIABLE['nbsp'] = '&nbsp_place_holder;'
 
     def feed(self, data):
         data = data.replace("</' + 'script>", "</ignore>")
@@ -140,6 +156,15 @@ class HTML2Text(HTMLParser.HTMLParser):
             return markdown
 
     def outtextf(self, s):
+        # The non-breaking spaces are substituted as the text is output
+        # rather than in another pass over all of the text in close()
+        if '&nbsp_place_holder;' in s:
+            if self.unicode_snob:
+                nbsp = unicode_character(name2cp('nbsp'))
+            else:
+                nbsp = unicode_character(32)
+            s = s.replace('&nbsp_place_holder;', nbsp)
+
         self.outtextlist.append(s)
         if s:
             self.lastWasNL = s[-1] == '\n'
@@ -147,27 +172,11 @@ class HTML2Text(HTMLParser.HTMLParser):
     def close(self):
         HTMLParser.HTMLParser.close(self)
 
-        try:
-            nochr = unicode('')
-            unicode_character = unichr
-        except NameError:
-            nochr = str('')
-            unicode_character = chr
-
         self.pbr()
         self.o('', 0, 'end')
 
         outtext = nochr.join(self.outtextlist)
 
-        if self.unicode_snob:
-            nbsp = unicode_character(name2cp('nbsp'))
-        else:
-            nbsp = unicode_character(32)
-        try:
-            outtext = outtext.replace(unicode('&nbsp_place_holder;'), nbsp)
-        except NameError:
-            outtext = outtext.replace('&nbsp_place_holder;', nbsp)
-
         # Clear self.outtextlist to avoid memory leak of its content to
         # the next handling.
         self.outtextlist = []
@@ -825,7 +834,9 @@ class HTML2Text(HTMLParser.HTMLParser):
             return text
 
         assert wrap, "Requires Python 2.3."
-        result = ''
+        # The paragraphs are collected in a list and joined at the end so
+        # that long documents take time in proportion to their length
+        result = []
         newlines = 0
         # I cannot think of a better solution for now.
         # To avoid the non-wrap behaviour for entire paras
@@ -835,14 +846,14 @@ class HTML2Text(HTMLParser.HTMLParser):
         for para in text.split("\n"):
             if len(para) > 0:
                 if not skipwrap(para, self.wrap_links):
-                    result += "\n".join(
+                    result.append("\n".join(
                         wrap(para, self.body_width, break_long_words=False)
-                    )
+                    ))
                     if para.endswith('  '):
-                        result += "  \n"
+                        result.append("  \n")
                         newlines = 1
                     else:
-                        result += "\n\n"
+                        result.append("\n\n")
                         newlines = 2
                 else:
                     # Warning for the tempted!!!
@@ -850,13 +861,13 @@ class HTML2Text(HTMLParser.HTMLParser):
                     # line.isspace()
                     # DOES NOT work! Explanations are welcome.
                     if not config.RE_SPACE.match(para):
-                        result += para + "\n"
+                        result.append(para + "\n")
                         newlines = 1
             else:
                 if newlines < 2:
-                    result += "\n"
+                    result.append("\n")
                     newlines += 1
-        return result
+        return nochr.join(result)
 
 
 def html2text(html, baseurl='', bodywidth=None):
@@ -276,6 +276,10 @@ def pad_tables_in_text(text, right_margin=1):
     """
     Provide padding for tables in the text
     """
+    # Nothing to pad (the text would be split and joined back as-is)
+    if config.TABLE_MARKER_FOR_PAD not in text:
+        return text
+
     lines = text.split('\n')
     table_buffer, altered_lines, table_widths, table_started = [], [], [], False
     new_lines = []
@@ -5,27 +5,43 @@ that Splunk can index it.
 
 import sys
 import time
+import calendar
 import re
 import os
 import logging
+import signal
+import socket
+import threading
+import sqlite3
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
 
 try:
-    from urllib.request import HTTPBasicAuthHandler, HTTPDigestAuthHandler, build_opener, ProxyHandler
+    from urllib.request import HTTPBasicAuthHandler, HTTPDigestAuthHandler, HTTPPasswordMgrWithPriorAuth, ProxyHandler
+    from urllib.error import URLError
 except:
-    from urllib2 import HTTPBasicAuthHandler, HTTPDigestAuthHandler, build_opener, ProxyHandler
+    from urllib2 import HTTPBasicAuthHandler, HTTPDigestAuthHandler, ProxyHandler, URLError
+    HTTPPasswordMgrWithPriorAuth = None
 from collections import OrderedDict
 
 path_to_mod_input_lib = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modular_input.zip')
 sys.path.insert(0, path_to_mod_input_lib)
-from modular_input import ModularInput, URLField, DurationField, BooleanField, Field
+from modular_input import ModularInput, URLField, DurationField, BooleanField, IntegerField, FilePathField, StaticListField, Field
 from modular_input.secure_password import get_secure_password
+from modular_input.server_info import ServerInfo
+from modular_input.exceptions import FieldValidationException
 from syndication_app.event_writer import StashNewWriter, utc
+from syndication_app import event_writer
+from syndication_app import http_client
+from syndication_app.conversion_store import ConversionStore
 
 path_to_app_lib = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'syndication_app')
 sys.path.insert(0, path_to_app_lib)
 import feedparser
-import html2text
+from syndication_app import html_converter
+
+# Make the requests that feedparser makes on its own use the shared SSL context too
+feedparser.http.SSL_CONTEXT = http_client.get_ssl_context()
 
 class SyndicationModularInput(ModularInput):
     """
@@ -34,6 +50,41 @@ class SyndicationModularInput(ModularInput):
 
     OUTPUT_USING_STASH = True
 
+    # The sourcetypes of the events for each output format (unless the input sets the sourcetype)
+    DEFAULT_SOURCETYPES = {
+        event_writer.OUTPUT_FORMAT_KV : "syndication",
+        event_writer.OUTPUT_FORMAT_JSON : "syndication_json"
+    }
+
+    # The parts of the feed state that are persisted in the checkpoint between runs
+    FEED_STATE_CHECKPOINT_FIELDS = ['etag', 'modified', 'auth_realm', 'auth_type', 'parser', 'strict_parser_tried', 'encoding']
+
+    # How often to try the strict parser again on feeds that it failed on (in seconds)
+    STRICT_PARSER_RETRY_INTERVAL = 86400
+
+    # The names of flattened fields (such as "content.0.value") by the name of the field they are
+    # in and their key or index; the entries of feeds have the same fields so the names are reused
+    flattened_names = {}
+
+    # The maximum number of names to keep in flattened_names
+    FLATTENED_NAMES_CACHE_SIZE = 10000
+
+    # The keys that FeedParserDicts return something other than the stored value for
+    FEED_PARSER_DICT_MAPPED_KEYS = frozenset(['category', 'enclosures', 'license']).union(feedparser.FeedParserDict.keymap)
+
+    # The realm and authentication type discovered for each feed URL
+    auth_info_cache = {}
+    auth_info_cache_lock = threading.Lock()
+
+    # The defaults for running the inputs concurrently
+    DEFAULT_WORKER_THREADS = 4
+    DEFAULT_MAX_CONNECTIONS_PER_HOST = 2
+
+    # The defaults for how long to wait on feed servers (in seconds)
+    DEFAULT_CONNECT_TIMEOUT = 30
+    DEFAULT_READ_TIMEOUT = 60
+    DEFAULT_CYCLE_DEADLINE = 600
+
     def __init__(self):
 
         scheme_args = {'title': "Syndication Feed (RSS, ATOM, RDF)",
@@ -49,11 +100,39 @@ class SyndicationModularInput(ModularInput):
                 Field("password", "Password", "The password to use for authenticating (only HTTP authentication supported)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
                 DurationField("interval", "Interval", "The interval defining how often to import the feed; can include time units (e.g. 15m for 15 minutes, 8h for 8 hours)", empty_allowed=False),
                 BooleanField("clean_html", "Convert HTML to Text", "Convert HTML to human readable text", empty_allowed=False),
-                URLField("proxy", "Proxy URL", "URL for proxy", empty_allowed=True, none_allowed=True, required_on_create=False, required_on_edit=False, require_https_on_cloud=True)
+                StaticListField("html_processing", "HTML processing", "How the HTML in entries is processed: raw (as it is in the feed), sanitized (unsafe markup removed and links made absolute), text (converted to human readable text) or plaintext (reduced to the text without any formatting, which is faster); defaults to text if clean_html is enabled and sanitized otherwise", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False, valid_values=html_converter.PROCESSING_PROFILES),
+                URLField("proxy", "Proxy URL", "URL for proxy", empty_allowed=True, none_allowed=True, required_on_create=False, required_on_edit=False, require_https_on_cloud=True),
+                BooleanField("batch_output", "Batch output", "Write all of the entries from a poll of the feed into a single stash file instead of one file per entry", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                IntegerField("max_events_per_file", "Maximum events per file", "The maximum number of entries to write into a single stash file when batching output (0 for no limit)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                IntegerField("max_bytes_per_file", "Maximum bytes per file", "The approximate maximum size of a single stash file when batching output (0 for no limit)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                StaticListField("output_format", "Output format", "The format the entries are written in: kv (key/value pairs) or json (a JSON object whose fields are extracted with KV_MODE=json at search time; it is no faster to write and slightly larger); defaults to kv", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False, valid_values=event_writer.OUTPUT_FORMATS),
+                IntegerField("worker_threads", "Worker threads", "The number of feeds that can be retrieved at the same time (applies to all inputs; the largest value configured is used)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                IntegerField("max_connections_per_host", "Maximum connections per host", "The maximum number of feeds from the same host that can be retrieved at the same time", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                DurationField("connect_timeout", "Connect timeout", "How long to wait for a connection to the feed server; can include time units (e.g. 30s)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                DurationField("read_timeout", "Read timeout", "How long to wait for data from the feed server once connected; can include time units (e.g. 1m)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                DurationField("cycle_deadline", "Cycle deadline", "How long an input can wait or run before it is cancelled and rescheduled (applies to all inputs; the largest value configured is used)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                IntegerField("conversion_workers", "Conversion workers", "The number of processes to convert the HTML of large feeds in (leave blank to convert on the input's threads; applies to all inputs; the largest value configured is used)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                IntegerField("conversion_batch_size", "Conversion batch size", "The number of entries to send to the conversion processes at a time; feeds with fewer entries are converted on the input's threads (applies to all inputs; the largest value configured is used)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                IntegerField("conversion_cache_size", "Conversion cache size", "The maximum number of HTML conversions to keep in the cache in the checkpoint directory so that entries that were already converted aren't converted again (applies to all inputs; the largest value configured is used)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False),
+                FilePathField("ca_bundle", "CA bundle", "The path to a file of CA certificates to use for verifying HTTPS feed servers (the system's certificates are used if not provided)", none_allowed=True, empty_allowed=True, required_on_create=False, required_on_edit=False)
                 ]
 
         ModularInput.__init__(self, scheme_args, args, logger_name='syndication_modular_input', logger_level=logging.INFO)
 
+        # This is the state of the inputs that are running on the worker threads
+        self.executor = None
+        self.running_stanzas = {}
+        self.running_hosts = {}
+        self.last_dispatched = {}
+        self.overrun_stanzas = set()
+        self.cycle_deadline = self.DEFAULT_CYCLE_DEADLINE
+        self.shutdown_requested = threading.Event()
+
+        # This is the cache of HTML conversions and the worker processes for converting that are
+        # shared by the inputs
+        self.conversion_store = None
+        self.conversion_pool = None
+
     @classmethod
     def get_updated_date(cls, entry):
 
@@ -69,7 +148,32 @@ class SyndicationModularInput(ModularInput):
         return None
 
     @classmethod
-    def get_realm_and_auth_type(cls, feed_url, username, password, logger=None):
+    def to_timestamp(cls, date):
+        """
+        Convert a date to the number of seconds since the epoch.
+
+        Arguments:
+        date -- A UTC time tuple (like feedparser provides) or a timestamp (which is returned as is)
+        """
+
+        if date is None or isinstance(date, (int, float)):
+            return date
+
+        return calendar.timegm(date)
+
+    @classmethod
+    def format_timestamp(cls, timestamp):
+        """
+        Format a timestamp for logging.
+
+        Arguments:
+        timestamp -- The number of seconds since the epoch
+        """
+
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+    @classmethod
+    def get_realm_and_auth_type(cls, feed_url, username, password, logger=None, ca_bundle=None):
         """
         Get the realm and authentication type for the given feed.
 
@@ -78,10 +182,11 @@ class SyndicationModularInput(ModularInput):
         username -- The username to use when authenticating
         password -- The password to use when authenticating
         logger -- A logger to log failure to parse the header messages
+        ca_bundle -- The path to a file of CA certificates for verifying HTTPS servers
         """
 
         # Perform request and get the realm and whether or not the view uses HTTP digest or basic authentication
-        d = feedparser.parse(feed_url)
+        d = feedparser.parse(feed_url, handlers=http_client.get_handlers(ca_bundle=ca_bundle))
 
         # Make sure we got a result
         if d is None or not hasattr(d, 'status'):
@@ -95,7 +200,20 @@ class SyndicationModularInput(ModularInput):
         if 'www-authenticate' not in d.headers:
             return None, None
 
-        auth_header = d.headers['www-authenticate']
+        return cls.parse_auth_header(d.headers['www-authenticate'], logger)
+
+    @classmethod
+    def parse_auth_header(cls, auth_header, logger=None):
+        """
+        Get the realm and authentication type from a WWW-Authenticate header.
+
+        Arguments:
+        auth_header -- The value of the WWW-Authenticate header
+        logger -- A logger to log failure to parse the header messages
+        """
+
+        if auth_header is None:
+            return None, None
 
         # Get the realm and whether it is using basic or digest authentication
         http_auth_re = re.compile("((Digest)|(Basic))( realm=[\"]?([^\"]*)[\"]?)?", re.IGNORECASE)
@@ -126,9 +244,35 @@ class SyndicationModularInput(ModularInput):
 
         realm, auth_type = cls.get_realm_and_auth_type(feed_url, username, password, logger)
 
+        return cls.make_auth_handler(feed_url, username, password, realm, auth_type)
+
+    @classmethod
+    def make_auth_handler(cls, feed_url, username, password, realm, auth_type):
+        """
+        Create a handler that will perform authentication for the given feed using a realm and
+        authentication type that is already known. Basic credentials are sent with the first
+        request so that the server doesn't need to challenge it.
+
+        Arguments:
+        feed_url -- The URL of the feed to retrieve (as a string)
+        username -- The username to use when authenticating
+        password -- The password to use when authenticating
+        realm -- The authentication realm
+        auth_type -- The authentication type ("Basic" or "Digest")
+        """
+
         # Make the associated auth handler
         if auth_type == None:
             return None
+        elif auth_type.lower() == "basic" and HTTPPasswordMgrWithPriorAuth is not None:
+            password_manager = HTTPPasswordMgrWithPriorAuth()
+            password_manager.add_password(realm=realm,
+                                          uri=feed_url,
+                                          user=username,
+                                          passwd=password,
+                                          is_authenticated=True)
+
+            return HTTPBasicAuthHandler(password_manager)
         elif auth_type.lower() == "basic":
             auth_handler = HTTPBasicAuthHandler()
         else:
@@ -142,6 +286,44 @@ class SyndicationModularInput(ModularInput):
 
         return auth_handler
 
+    @classmethod
+    def get_cached_auth_info(cls, feed_url, feed_state=None):
+        """
+        Get the realm and authentication type previously discovered for the given feed.
+
+        Arguments:
+        feed_url -- The URL of the feed to retrieve (as a string)
+        feed_state -- A dictionary with the state of the feed from the last run
+        """
+
+        with cls.auth_info_cache_lock:
+            if feed_url in cls.auth_info_cache:
+                return cls.auth_info_cache[feed_url]
+
+        if feed_state is not None and feed_state.get('auth_type', None):
+            return feed_state.get('auth_realm', None), feed_state['auth_type']
+
+        return None, None
+
+    @classmethod
+    def set_cached_auth_info(cls, feed_url, realm, auth_type, feed_state=None):
+        """
+        Remember the realm and authentication type for the given feed.
+
+        Arguments:
+        feed_url -- The URL of the feed to retrieve (as a string)
+        realm -- The authentication realm
+        auth_type -- The authentication type ("Basic" or "Digest")
+        feed_state -- A dictionary with the state of the feed that will be persisted
+        """
+
+        with cls.auth_info_cache_lock:
+            cls.auth_info_cache[feed_url] = (realm, auth_type)
+
+        if feed_state is not None:
+            feed_state['auth_realm'] = realm
+            feed_state['auth_type'] = auth_type
+
     @classmethod
     def get_proxy_handler(cls, proxy, logger=None):
         """
@@ -171,7 +353,69 @@ class SyndicationModularInput(ModularInput):
         return proxy_handler
 
     @classmethod
-    def get_feed(cls, feed_url, return_latest_date=False, include_later_than=None, logger=None, username=None, password=None, clean_html=True, proxy=None):
+    def fetch_feed(cls, feed_url, auth_handler=None, proxy_handler=None, feed_state=None, connect_timeout=None, read_timeout=None, ca_bundle=None, html_processing=None):
+        """
+        Retrieve and parse the feed. A socket.timeout will be raised if the server doesn't respond
+        in time.
+
+        Feeds that the strict XML parser failed on are parsed with the loose parser straight away
+        (instead of having the strict parser fail first every time) until the strict parser is
+        tried again after STRICT_PARSER_RETRY_INTERVAL. The parser is kept in feed_state['parser'].
+
+        The character encoding that the feed was found to be in is kept in feed_state['encoding'] and
+        is tried before detecting the encoding the next time (for feeds that declare the wrong one).
+
+        Arguments:
+        feed_url -- The URL of the feed to retrieve (as a string)
+        auth_handler -- The handler to use for authenticating (if needed)
+        proxy_handler -- The handler to use for connecting through a proxy (if needed)
+        feed_state -- A dictionary with the state of the feed from the last run
+        connect_timeout -- The number of seconds to wait for a connection to be established
+        read_timeout -- The number of seconds to wait for data from the server once connected
+        ca_bundle -- The path to a file of CA certificates for verifying HTTPS servers
+        html_processing -- The processing profile that the HTML will get (determines how much of the
+                           processing feedparser needs to do)
+        """
+
+        if feed_state is None:
+            feed_state = {}
+
+        # Let feedparser perform the request so that it handles compression and the conditional
+        # request headers regardless of whether authentication or a proxy are used
+        handlers = [handler for handler in (auth_handler, proxy_handler) if handler is not None]
+        handlers.extend(http_client.get_handlers(connect_timeout, read_timeout, ca_bundle=ca_bundle))
+
+        # Stream the feed so that large feeds don't need to be held in memory several times over
+        parse_options = html_converter.get_parse_options(html_processing)
+
+        if feed_state.get('parser', None) == 'loose' and time.time() - feed_state.get('strict_parser_tried', 0) < cls.STRICT_PARSER_RETRY_INTERVAL:
+            parser = 'loose'
+        else:
+            parser = None
+
+        d = feedparser.parse(feed_url, etag=feed_state.get('etag', None), modified=feed_state.get('modified', None), handlers=handlers, stream=True, parser=parser, encoding_hint=feed_state.get('encoding', None), **parse_options)
+
+        # Remember which parser worked (and when the strict one last failed)
+        if d.get('parser', None) is not None:
+            feed_state['parser'] = d['parser']
+
+            if parser is None and d['parser'] == 'loose':
+                feed_state['strict_parser_tried'] = time.time()
+
+        if d.get('encoding', None):
+            feed_state['encoding'] = d['encoding']
+
+        # feedparser reports connection failures as a malformed feed; raise timeouts so that the
+        # caller can tell that the feed wasn't retrieved
+        bozo_exception = d.get('bozo_exception', None)
+
+        if isinstance(bozo_exception, URLError) and isinstance(bozo_exception.reason, socket.timeout):
+            raise bozo_exception.reason
+
+        return d
+
+    @classmethod
+    def get_feed(cls, feed_url, return_latest_date=False, include_later_than=None, logger=None, username=None, password=None, clean_html=True, proxy=None, feed_state=None, connect_timeout=None, read_timeout=None, ca_bundle=None, html_processing=None, conversion_store=None, conversion_pool=None):
         """
         Get the feed results as a dictionary.
 
@@ -183,95 +427,306 @@ class SyndicationModularInput(ModularInput):
         username -- The username to use when authenticating
         password -- The password to use when authenticating
         clean_html -- If true, HTML will be convrted to something human readable
+        proxy -- The proxy to use (as a parsed URL)
+        feed_state -- A dictionary with the state of the feed from the last run (ETag and
+                      Last-Modified); it will be updated with the state from this run and
+                      'not_modified' will be set if the server reported that the feed didn't change
+        connect_timeout -- The number of seconds to wait for a connection to be established
+        read_timeout -- The number of seconds to wait for data from the server once connected
+        ca_bundle -- The path to a file of CA certificates for verifying HTTPS servers
+        html_processing -- How the HTML is processed (raw, sanitized or text); overrides clean_html
+        conversion_store -- The ConversionStore to load HTML that was already converted from
+        conversion_pool -- The html_converter.ConversionPool to convert the HTML of large feeds in
+        """
+
+        if feed_state is None:
+            feed_state = {}
+
+        entries = list(cls.iter_feed(feed_url, include_later_than, logger, username, password, clean_html, proxy, feed_state, connect_timeout, read_timeout, ca_bundle, html_processing, conversion_store, conversion_pool))
+
+        # Return the latest date if requested
+        if return_latest_date:
+            return entries, feed_state.get('latest_date', None)
+        else:
+            return entries
+
+    @classmethod
+    def iter_feed(cls, feed_url, include_later_than=None, logger=None, username=None, password=None, clean_html=True, proxy=None, feed_state=None, connect_timeout=None, read_timeout=None, ca_bundle=None, html_processing=None, conversion_store=None, conversion_pool=None, sort_fields=True):
+        """
+        Get the feed results, yielding each entry (flattened into a dictionary) as soon as it has
+        been processed. The feed isn't retrieved until the first entry is requested.
+
+        The date of the latest entry is kept in feed_state['latest_date'] (and as a timestamp in
+        feed_state['latest_timestamp']) and is complete once all of the entries have been consumed.
+        Each entry's timestamp is included as '_time' so that it doesn't need to be parsed from the
+        flattened date again. The number of HTML conversions done and the number that
+        were shared between fields with the same HTML are kept in feed_state['html_conversions']
+        and feed_state['html_conversions_reused'] (and the number that were loaded from the
+        conversion store in feed_state['html_conversions_stored']).
+
+        Arguments:
+        feed_url -- The URL of the feed to retrieve (as a string)
+        include_later_than -- Only return the feeds that are after this date (a UTC time tuple or a
+                              timestamp)
+        logger -- The logger to log the data to
+        username -- The username to use when authenticating
+        password -- The password to use when authenticating
+        clean_html -- If true, HTML will be convrted to something human readable
+        proxy -- The proxy to use (as a parsed URL)
+        feed_state -- A dictionary with the state of the feed from the last run (ETag and
+                      Last-Modified); it will be updated with the state from this run and
+                      'not_modified' will be set if the server reported that the feed didn't change
+        connect_timeout -- The number of seconds to wait for a connection to be established
+        read_timeout -- The number of seconds to wait for data from the server once connected
+        ca_bundle -- The path to a file of CA certificates for verifying HTTPS servers
+        html_processing -- How the HTML is processed (raw, sanitized or text); overrides clean_html
+        conversion_store -- The ConversionStore to load HTML that was already converted from
+        conversion_pool -- The html_converter.ConversionPool to convert the HTML of large feeds in
+        sort_fields -- If true, the fields of each entry are sorted by name (for the output formats
+                       that write the fields in order)
         """
 
         auth_handler = None
+        include_later_than = cls.to_timestamp(include_later_than)
+        log_dates = logger is not None and logger.isEnabledFor(logging.DEBUG)
         proxy_handler = None
 
-        # Get an authentication handler if needed
+        if feed_state is None:
+            feed_state = {}
+
+        feed_state['not_modified'] = False
+        feed_state['latest_date'] = None
+        feed_state['latest_timestamp'] = None
+        feed_state['html_conversions'] = 0
+        feed_state['html_conversions_reused'] = 0
+        feed_state['html_conversions_stored'] = 0
+
+        html_processing = html_converter.get_processing_profile(html_processing, clean_html)
+        conversion_cache = html_converter.ConversionCache(conversion_store)
+
+        # Get an authentication handler if the feed was found to need one before
         if username is not None and password is not None:
-            auth_handler = cls.get_auth_handler(feed_url, username, password, logger)
+            realm, auth_type = cls.get_cached_auth_info(feed_url, feed_state)
+            auth_handler = cls.make_auth_handler(feed_url, username, password, realm, auth_type)
 
         # Get a proxy handler if needed
         if proxy is not None:
             proxy_handler = cls.get_proxy_handler(proxy, logger)
 
         # Parse the feed
-        if auth_handler is not None:
-            opener = build_opener(auth_handler)
-            feed = opener.open(feed_url)
-            d = feedparser.parse(feed)
-        elif proxy_handler is not None:
-            opener = build_opener(proxy_handler)
-            feed = opener.open(feed_url)
-            d = feedparser.parse(feed)
-        else:
-            d = feedparser.parse(feed_url)
+        d = cls.fetch_feed(feed_url, auth_handler, proxy_handler, feed_state, connect_timeout, read_timeout, ca_bundle, html_processing)
+
+        # Authenticate using the realm the server asked for if it rejected the request
+        if username is not None and password is not None and d is not None and d.get('status', None) == 401:
+            realm, auth_type = cls.parse_auth_header(d.get('headers', {}).get('www-authenticate', None), logger)
+
+            if auth_type is not None:
+                if logger is not None:
+                    logger.debug("Feed requires authentication, url=\"%s\", realm=\"%s\", auth_type=%s", feed_url, realm, auth_type)
+
+                cls.set_cached_auth_info(feed_url, realm, auth_type, feed_state)
+                auth_handler = cls.make_auth_handler(feed_url, username, password, realm, auth_type)
+                d = cls.fetch_feed(feed_url, auth_handler, proxy_handler, feed_state, connect_timeout, read_timeout, ca_bundle, html_processing)
 
-        entries = []
-        latest_date = None
+        latest_timestamp = None
+
+        # Stop if the feed didn't change since the last time it was retrieved
+        if d is not None and d.get('status', None) == 304:
+            feed_state['not_modified'] = True
+
+            if logger is not None:
+                logger.debug("Feed was not modified since it was last retrieved, url=\"%s\"", feed_url)
 
         # Stop if we didn't get a result
-        if d is None or not hasattr(d, 'entries'):
+        elif d is None or not hasattr(d, 'entries'):
             logger.warn("No entries returned from the feed, url=\"%s\"", feed_url)
         else:
-            for entry in d.entries:
+            # Remember the validators so that the next request can be conditional
+            feed_state['etag'] = d.get('etag', None)
+            feed_state['modified'] = d.get('modified', None)
+
+            # Let go of each entry once it has been processed so that the converted and flattened
+            # copies of all of the entries aren't kept around at the same time
+            entries = d.entries
+            d['entries'] = []
+            entries.reverse()
+
+            # Convert the HTML of large feeds in the worker processes a batch at a time
+            if conversion_pool is not None and html_processing in html_converter.TEXT_PROFILES and len(entries) >= conversion_pool.batch_size:
+                prefetch_in = 0
+            else:
+                prefetch_in = None
+
+            while entries:
+                if prefetch_in == 0:
+                    try:
+                        cls.prefetch_conversions(entries[-conversion_pool.batch_size:], conversion_cache, conversion_pool, html_processing, include_later_than)
+                        prefetch_in = conversion_pool.batch_size
+                    except Exception as exception:
+                        if logger is not None:
+                            logger.warn("Unable to convert the entries in the worker processes, they will be converted inline, url=\"%s\", error=%s", feed_url, str(exception))
+
+                        conversion_cache.prefetched = {}
+                        prefetch_in = None
+
+                if prefetch_in is not None:
+                    prefetch_in -= 1
+
+                entry = entries.pop()
 
                 # Get the updated or published date
                 entry_date = cls.get_updated_date(entry)
+                entry_timestamp = None
 
                 # Perform the operations that are based on the date
                 if entry_date is not None:
+                    entry_timestamp = calendar.timegm(entry_date)
 
                     # If this is the latest one, then save it
-                    if latest_date is None or entry_date > latest_date:
-                        latest_date = entry_date
+                    if latest_timestamp is None or entry_timestamp > latest_timestamp:
+                        latest_timestamp = entry_timestamp
+                        feed_state['latest_date'] = entry_date
+                        feed_state['latest_timestamp'] = entry_timestamp
 
                     # If the item is earlier than the date we are to include, then skip it
-                    if include_later_than is not None and entry_date <= include_later_than:
+                    if include_later_than is not None and entry_timestamp <= include_later_than:
 
-                        if logger is not None:
-                            logger.debug("Skipping entry with date=%r, since it's not later than latest_date=%r, title=\"%s\"", time.strftime('%Y-%m-%dT%H:%M:%SZ', entry_date), time.strftime('%Y-%m-%dT%H:%M:%SZ', include_later_than), entry.title)
+                        if log_dates:
+                            logger.debug("Skipping entry with date=%r, since it's not later than latest_date=%r, title=\"%s\"", cls.format_timestamp(entry_timestamp), cls.format_timestamp(include_later_than), entry.title)
 
                         continue
 
-                    elif logger is not None and include_later_than is not None:
-                        logger.debug("Including entry with date=%r, since it's later than latest_date=%r, title=\"%s\"", time.strftime('%Y-%m-%dT%H:%M:%SZ', entry_date), time.strftime('%Y-%m-%dT%H:%M:%SZ', include_later_than), entry.title)
+                    elif log_dates and include_later_than is not None:
+                        logger.debug("Including entry with date=%r, since it's later than latest_date=%r, title=\"%s\"", cls.format_timestamp(entry_timestamp), cls.format_timestamp(include_later_than), entry.title)
 
-                    elif logger is not None and include_later_than is None:
-                        logger.debug("Including entry with date=%r, since there is no checkpoint date, title=\"%s\"", time.strftime('%Y-%m-%dT%H:%M:%SZ', entry_date), entry.title)
+                    elif log_dates and include_later_than is None:
+                        logger.debug("Including entry with date=%r, since there is no checkpoint date, title=\"%s\"", cls.format_timestamp(entry_timestamp), entry.title)
 
-                # Clean up the HTML if requested
-                if clean_html:
+                # Convert the HTML to text if requested
+                if html_processing in html_converter.TEXT_PROFILES:
+                    cls.clean_entry_html(entry, logger, conversion_cache, html_processing)
+                    conversion_cache.clear()
 
-                    # Clean up the content
-                    try:
-                        if entry.get('content', None) and entry['content'][0].get('type', 'text/html') == 'text/html' and entry['content'][0].get('value', None):
-                            entry['content'][0]['value'] = html2text.html2text(entry['content'][0]['value'])
-                    except:
-                        logger.warn("Unable to convert the HTML content, field=%s", "value")
+                    feed_state['html_conversions'] = conversion_cache.misses
+                    feed_state['html_conversions_reused'] = conversion_cache.hits
+                    feed_state['html_conversions_stored'] = conversion_cache.stored_hits
 
-                    # Clean up the summary
-                    try:
-                        if entry.get('summary', None):
-                            entry['summary'] = html2text.html2text(entry['summary'])
-                    except:
-                        logger.warn("Unable to convert the HTML content, field=%s", "summary")
+                result = cls.flatten(entry, sort=sort_fields)
 
-                    # Clean up the summary_detail
-                    try:
-                        if entry.get('summary_detail', None) and entry['summary_detail'].get('type', 'text/html') == 'text/html' and entry['summary_detail'].get('value', None):
-                            entry['summary_detail']['value'] = html2text.html2text(entry['summary_detail']['value'])
-                    except:
-                        logger.warn("Unable to convert the HTML content, field=%s", "summary_detail")
+                if entry_timestamp is not None:
+                    result['_time'] = entry_timestamp
 
-                entries.append(cls.flatten(entry, sort=True))
+                yield result
 
-        # Return the latest date if requested
-        if return_latest_date:
-            return entries, latest_date
-        else:
-            return entries
+            # Save the new conversions so that they don't need to be done on the next poll
+            conversion_cache.commit()
+
+    @classmethod
+    def prefetch_conversions(cls, entries, conversion_cache, conversion_pool, html_processing, include_later_than=None):
+        """
+        Do the HTML conversions that the given entries need in the worker processes of the
+        conversion pool. The results are put in the conversion cache so that clean_entry_html()
+        uses them.
+
+        Arguments:
+        entries -- The entries that will be converted next
+        conversion_cache -- The html_converter.ConversionCache the entries will be converted with
+        conversion_pool -- The html_converter.ConversionPool to do the conversions in
+        html_processing -- The profile the entries will be converted with
+        include_later_than -- Entries that aren't after this timestamp are skipped (and not converted)
+        """
+
+        # Find out which conversions are needed without changing the entries
+        conversion_cache.start_recording()
+
+        try:
+            for entry in entries:
+                entry_date = cls.get_updated_date(entry)
+
+                if entry_date is None or include_later_than is None or calendar.timegm(entry_date) > include_later_than:
+                    cls.clean_entry_html(entry, conversion_cache=conversion_cache, html_processing=html_processing)
+        finally:
+            keys = conversion_cache.stop_recording()
+
+        conversion_cache.prefetched = conversion_pool.convert(keys) if keys else {}
+
+    @classmethod
+    def is_html_detail(cls, detail):
+        """
+        Determine if the content described by the given detail dictionary (like summary_detail) is
+        HTML.
+
+        Arguments:
+        detail -- The dictionary describing the content (may be None)
+        """
+
+        return detail is None or detail.get('type', 'text/html') in html_converter.HTML_TYPES
+
+    @classmethod
+    def clean_entry_html(cls, entry, logger=None, conversion_cache=None, html_processing=html_converter.PROCESSING_TEXT):
+        """
+        Convert the HTML in the entry to human readable (or plain) text. The feed must have been parsed with
+        html_converter.RAW_HTML_ELEMENTS so that the HTML is still as it was in the feed; it is
+        resolved, sanitized and converted in one pass. HTML that isn't converted to text is
+        resolved and sanitized like feedparser would have done.
+
+        Fields with the same HTML (like the summary and summary_detail) are only converted once.
+
+        Arguments:
+        entry -- The feed entry to clean up
+        logger -- The logger to log conversion failures to
+        conversion_cache -- The html_converter.ConversionCache to share conversions through (a new
+                            one is used if None)
+        html_processing -- The profile to convert with (text for markdown or plaintext for just
+                           the text)
+        """
+
+        if conversion_cache is None:
+            conversion_cache = html_converter.ConversionCache()
+
+        plain_text = html_processing == html_converter.PROCESSING_PLAIN_TEXT
+
+        def convert(html, base_uri):
+            if plain_text:
+                return conversion_cache.html_to_plain_text(html)
+            else:
+                return conversion_cache.html_to_text(html, base_uri)
+
+        summary_detail = entry.get('summary_detail', None)
+        summary_base = summary_detail.get('base', '') if summary_detail else ''
+
+        # Clean up the content
+        for index, content in enumerate(entry.get('content', None) or []):
+            try:
+                if not content.get('value', None) or not cls.is_html_detail(content):
+                    continue
+
+                if index == 0 and content.get('type', 'text/html') == 'text/html':
+                    content['value'] = convert(content['value'], content.get('base', ''))
+                else:
+                    content['value'] = conversion_cache.process_html(content['value'], content.get('base', ''), content.get('type', 'text/html'))
+            except:
+                logger.warn("Unable to convert the HTML content, field=%s", "value")
+
+        # Clean up the summary
+        try:
+            if entry.get('summary', None):
+                if cls.is_html_detail(summary_detail):
+                    entry['summary'] = convert(entry['summary'], summary_base)
+                elif not plain_text:
+                    entry['summary'] = conversion_cache.html_to_text(entry['summary'], sanitize=False)
+        except:
+            logger.warn("Unable to convert the HTML content, field=%s", "summary")
+
+        # Clean up the summary_detail
+        try:
+            if summary_detail and summary_detail.get('value', None) and cls.is_html_detail(summary_detail):
+                if summary_detail.get('type', 'text/html') == 'text/html':
+                    summary_detail['value'] = convert(summary_detail['value'], summary_base)
+                else:
+                    summary_detail['value'] = conversion_cache.process_html(summary_detail['value'], summary_base, summary_detail.get('type', 'text/html'))
+        except:
+            logger.warn("Unable to convert the HTML content, field=%s", "summary_detail")
 
     @classmethod
     def flatten(cls, item, dictionary=None, name=None, sort=False):
@@ -291,50 +746,82 @@ class SyndicationModularInput(ModularInput):
         if name is None:
             name = ""
 
-        iterative_name = name
+        get_flattened_name = cls.flattened_names.get
+        mapped_keys = cls.FEED_PARSER_DICT_MAPPED_KEYS
 
-        if len(iterative_name) > 0:
-            iterative_name = name + "."
+        # The items left to flatten (in reverse order) along with their names
+        pending = [(name, item)]
+        push = pending.append
 
-        # Python 2+3 basestring
-        try:
-            basestring
-        except NameError:
-            basestring = str
+        while pending:
+            name, item = pending.pop()
+            item_type = type(item)
 
-        # Handle dictionaries
-        if isinstance(item, dict):
-            for key in item:
-                cls.flatten(item[key], dictionary, iterative_name + key)
+            # Handle strings (the most common value)
+            if item_type is str:
+                dictionary[name] = item
 
-        # Handle date
-        elif item.__class__.__name__ == "struct_time":
-            dictionary[name] = time.strftime('%Y-%m-%dT%H:%M:%SZ', item)
+            # Handle dictionaries (FeedParserDicts map some keys to other ones when accessed)
+            elif isinstance(item, dict):
+                if item_type is dict or (item_type is feedparser.FeedParserDict and mapped_keys.isdisjoint(item)):
+                    children = list(dict.items(item))
+                else:
+                    children = [(key, item[key]) for key in item]
 
-        # Handle arrays
-        elif not isinstance(item, basestring) and isinstance(item, (list, tuple)):
-            index = 0
+                children.reverse()
 
-            for entry in item:
-                cls.flatten(entry, dictionary, iterative_name + str(index))
+                for key, value in children:
+                    push((get_flattened_name((name, key)) or cls.get_flattened_name(name, key), value))
 
-                index = index + 1
+            # Handle date
+            elif item_type is time.struct_time:
+                dictionary[name] = time.strftime('%Y-%m-%dT%H:%M:%SZ', item)
 
-        # Handle plain values
-        elif item in [True, False, None]:
-            dictionary[name] = item
+            # Handle arrays
+            elif isinstance(item, (list, tuple)) and not isinstance(item, str):
+                for index in range(len(item) - 1, -1, -1):
+                    push((get_flattened_name((name, index)) or cls.get_flattened_name(name, index), item[index]))
 
-        # Handle string values
-        else:
-            dictionary[name] = str(item)
+            # Handle plain values
+            elif item_type in (bool, type(None), int):
+                dictionary[name] = item
+
+            # Handle string values
+            else:
+                dictionary[name] = str(item)
 
         # Sort the dictionary
         if sort:
-            dictionary = OrderedDict(sorted(dictionary.items(), key=lambda x: x[0]))
+            dictionary = OrderedDict(sorted(dictionary.items()))
 
         return dictionary
 
-    def save_checkpoint(self, checkpoint_dir, stanza, last_run, last_entry_date):
+    @classmethod
+    def get_flattened_name(cls, name, key):
+        """
+        Get the name of a flattened field, remembering it so that the same name is used for the
+        field of the other entries.
+
+        Arguments:
+        name -- The name of the field that the value is in ("" if it is at the top level)
+        key -- The key or index of the value within the field
+        """
+
+        # Use the index of list items (the name is remembered under the index itself since that is
+        # what it is looked up by)
+        if len(name) > 0:
+            flattened_name = name + "." + str(key)
+        else:
+            flattened_name = str(key)
+
+        if len(cls.flattened_names) >= cls.FLATTENED_NAMES_CACHE_SIZE:
+            cls.flattened_names.clear()
+
+        cls.flattened_names[(name, key)] = flattened_name
+
+        return flattened_name
+
+    def save_checkpoint(self, checkpoint_dir, stanza, last_run, last_entry_date, feed_state=None):
         """
         Save the checkpoint state.
 
@@ -342,23 +829,70 @@ class SyndicationModularInput(ModularInput):
         checkpoint_dir -- The directory where checkpoints ought to be saved
         stanza -- The stanza of the input being used
         last_run -- The time when the analysis was last performed
-        last_entry_date -- The date of the last entry that was imported
+        last_entry_date -- The date of the last entry that was imported (a timestamp or a UTC time
+                           tuple)
+        feed_state -- The state of the feed (as populated by get_feed()) to persist
         """
 
+        data = { 'last_run' : last_run }
+
         if last_entry_date is not None:
-            self.save_checkpoint_data(checkpoint_dir, stanza, { 'last_run' : last_run,
-                                                                'last_entry_date' : time.mktime(last_entry_date)
-                                                               })
-        else:
-            self.save_checkpoint_data(checkpoint_dir, stanza, { 'last_run' : last_run })
+            data['last_entry_timestamp'] = self.to_timestamp(last_entry_date)
+
+        if feed_state is not None:
+            for field in self.FEED_STATE_CHECKPOINT_FIELDS:
+                if feed_state.get(field, None) is not None:
+                    data[field] = feed_state[field]
+
+        self.save_checkpoint_data(checkpoint_dir, stanza, data)
+
+    @classmethod
+    def get_feed_state(cls, checkpoint_data):
+        """
+        Get the feed state from the checkpoint data.
+
+        Arguments:
+        checkpoint_data -- The checkpoint data loaded for the input
+        """
+
+        feed_state = {}
+
+        if checkpoint_data is not None:
+            for field in cls.FEED_STATE_CHECKPOINT_FIELDS:
+                if checkpoint_data.get(field, None) is not None:
+                    feed_state[field] = checkpoint_data[field]
+
+        return feed_state
+
+    @classmethod
+    def get_last_entry_timestamp(cls, checkpoint_data):
+        """
+        Get the timestamp of the last entry that was imported from the checkpoint data (or None if
+        it doesn't have one).
+
+        Arguments:
+        checkpoint_data -- The checkpoint data loaded for the input
+        """
+
+        if checkpoint_data is None:
+            return None
+
+        if checkpoint_data.get('last_entry_timestamp', None) is not None:
+            return checkpoint_data['last_entry_timestamp']
+
+        # Older checkpoints have the date as if the UTC time was local time
+        if checkpoint_data.get('last_entry_date', None) is not None:
+            return calendar.timegm(time.localtime(checkpoint_data['last_entry_date']))
+
+        return None
 
     @classmethod
     def get_timestamp(cls, event):
         try:
-            if "updated_parsed" in list(event.keys()):
-                return datetime.fromtimestamp(time.mktime(time.strptime(event["updated_parsed"], "%Y-%m-%dT%H:%M:%SZ")))
-            elif "published_parsed" in list(event.keys()):
-                return datetime.fromtimestamp(time.mktime(time.strptime(event["published_parsed"], "%Y-%m-%dT%H:%M:%SZ")))
+            if "updated_parsed" in event:
+                return datetime.strptime(event["updated_parsed"], "%Y-%m-%dT%H:%M:%SZ")
+            elif "published_parsed" in event:
+                return datetime.strptime(event["published_parsed"], "%Y-%m-%dT%H:%M:%SZ")
             return datetime.now(utc)
         except ValueError:
             return datetime.now(utc)
@@ -369,13 +903,21 @@ class SyndicationModularInput(ModularInput):
         interval = cleaned_params["interval"]
         feed_url = cleaned_params["url"]
         include_only_changed = cleaned_params.get("include_only_changed", True)
-        sourcetype = cleaned_params.get("sourcetype", "syndication")
+        output_format = cleaned_params.get("output_format", None) or event_writer.OUTPUT_FORMAT_KV
+        sourcetype = cleaned_params.get("sourcetype", None) or self.DEFAULT_SOURCETYPES[output_format]
         username = cleaned_params.get("username", None)
         password = cleaned_params.get("password", None)
         host = cleaned_params.get("host", None)
         index = cleaned_params.get("index", "default")
         clean_html = cleaned_params.get("clean_html", False)
+        html_processing = cleaned_params.get("html_processing", None) or None
         proxy = cleaned_params.get("proxy", None)
+        batch_output = cleaned_params.get("batch_output", False)
+        max_events_per_file = cleaned_params.get("max_events_per_file", None)
+        max_bytes_per_file = cleaned_params.get("max_bytes_per_file", None)
+        connect_timeout = cleaned_params.get("connect_timeout", None) or self.DEFAULT_CONNECT_TIMEOUT
+        read_timeout = cleaned_params.get("read_timeout", None) or self.DEFAULT_READ_TIMEOUT
+        ca_bundle = cleaned_params.get("ca_bundle", None) or None
         source = stanza
 
         # Don't allow proxies on Splunk Cloud
@@ -395,22 +937,34 @@ class SyndicationModularInput(ModularInput):
 
 
             # Try to load the last entry date from the checkpoint data
-            if include_only_changed and checkpoint_data is not None and 'last_entry_date' in checkpoint_data:
-                last_entry_date = time.localtime(checkpoint_data['last_entry_date'])
-                self.logger.debug("Loaded latest entry date from checkpoint, last_entry_date=%s", time.strftime('%Y-%m-%dT%H:%M:%SZ', last_entry_date))
+            if include_only_changed:
+                last_entry_date = self.get_last_entry_timestamp(checkpoint_data)
             else:
                 last_entry_date = None
 
+            if last_entry_date is not None:
+                self.logger.debug("Loaded latest entry date from checkpoint, last_entry_date=%s", self.format_timestamp(last_entry_date))
+
             # Get the time that the input last ran
             if checkpoint_data is not None and 'last_ran' in checkpoint_data:
                 last_ran = checkpoint_data['last_ran']
             else:
                 last_ran = None
 
+            # Load the state of the feed from the last run
+            feed_state = self.get_feed_state(checkpoint_data)
+
+            # Use the ETag and Last-Modified values so that unchanged feeds aren't downloaded again.
+            # This is only done when importing changed entries since otherwise every entry is
+            # expected to be imported on each run.
+            if not include_only_changed:
+                feed_state.pop('etag', None)
+                feed_state.pop('modified', None)
+
             # Don't scan the URL if the URL is unencrypted and the host is on Cloud
             if self.is_on_cloud(input_config.session_key) and not feed_url.scheme == "https":
                 self.logger.warn("The URL for the given feed will not be read because the host is running on Splunk Cloud and the URL isn't using encryption, url=%s", feed_url.geturl())
-                self.save_checkpoint(input_config.checkpoint_dir, stanza, self.get_non_deviated_last_run(last_ran, interval, stanza), last_entry_date)
+                self.save_checkpoint(input_config.checkpoint_dir, stanza, self.get_non_deviated_last_run(last_ran, interval, stanza), last_entry_date, feed_state)
 
             else:
 
@@ -424,59 +978,415 @@ class SyndicationModularInput(ModularInput):
                         self.logger.debug("Successfully loaded the secure password for input=%s", stanza)
 
                 # Get the feed information
-                results = None
-                last_entry_date_retrieved = None
+                result_count = None
+
+                started = time.time()
 
                 try:
-                    results, last_entry_date_retrieved = self.get_feed(feed_url.geturl(), return_latest_date=True, include_later_than=last_entry_date, logger=self.logger, username=username, password=password, clean_html=clean_html, proxy=proxy)
+                    entries = self.iter_feed(feed_url.geturl(), include_later_than=last_entry_date, logger=self.logger, username=username, password=password, clean_html=clean_html, proxy=proxy, feed_state=feed_state,
+                                             connect_timeout=connect_timeout, read_timeout=read_timeout, ca_bundle=ca_bundle, html_processing=html_processing, conversion_store=self.conversion_store, conversion_pool=self.conversion_pool,
+                                             sort_fields=output_format == event_writer.OUTPUT_FORMAT_KV)
+
+                    # Write the entries as they are retrieved
+                    result_count = self.write_entries(entries, stanza, index, source, sourcetype, host, batch_output, max_events_per_file, max_bytes_per_file, output_format)
+                except socket.timeout:
+                    self.logger.warn("Timed out while retrieving the feed, it will be retried on the next run, url=%s, elapsed=%.1fs", feed_url.geturl(), time.time() - started)
                 except:
                     self.logger.exception("Unable to get the feed, url=%s", feed_url.geturl())
-                    result = None
+
+                last_entry_date_retrieved = feed_state.get('latest_timestamp', None)
 
                 if last_entry_date_retrieved is not None:
-                    self.logger.debug("Latest date from feed retrieved, last_entry_date_retrieved=%i", time.mktime(last_entry_date_retrieved))
+                    self.logger.debug("Latest date from feed retrieved, last_entry_date_retrieved=%i", last_entry_date_retrieved)
                 else:
                     self.logger.debug("Latest date from feed was not retrieved")
 
-                # Process the results
-                if results is not None:
-                    self.logger.info("Successfully retrieved feed entries, count=%i, url=%s", len(results), feed_url.geturl())
+                if feed_state.get('html_conversions_reused', 0) > 0 or feed_state.get('html_conversions_stored', 0) > 0:
+                    self.logger.debug("Converted the HTML of the entries, conversions=%i, conversions_reused=%i, conversions_stored=%i, url=%s", feed_state['html_conversions'], feed_state['html_conversions_reused'], feed_state['html_conversions_stored'], feed_url.geturl())
 
-                    # Output the event
-                    for result in results:
-                        # Send the event
-                        if self.OUTPUT_USING_STASH:
-                            # Get the time
-                            result['_time'] = self.get_timestamp(result)
+                # Process the results
+                if result_count is not None and feed_state.get('not_modified', False):
+                    self.logger.info("Feed was not modified since it was last retrieved, url=%s", feed_url.geturl())
 
-                            # Write the event as a stash new file
-                            writer = StashNewWriter(index=index, source_name=source, file_extension=".stash_syndication_input", sourcetype=sourcetype, host=host)
-                            self.logger.debug("Wrote stash file=%s", writer.write_event(result))
+                    # Save the checkpoint so that we remember when we last tried to get the feed
+                    self.save_checkpoint(input_config.checkpoint_dir, stanza, self.get_non_deviated_last_run(last_ran, interval, stanza), last_entry_date, feed_state)
 
-                        else:
-                            #self.logger.debug("Generating event, count=%i, url=%s", len(results), feed_url.geturl())
-                            self.output_event(result, stanza, index=index, source=source, sourcetype=sourcetype, host=host, unbroken=True, close=True)
+                elif result_count is not None:
+                    self.logger.info("Successfully retrieved feed entries, count=%i, url=%s", result_count, feed_url.geturl())
 
                     # Show a warning if no results were loaded but the last entry date is being updated (that shouldn't happen)
-                    if len(results) == 0 and last_entry_date_retrieved is not None and last_entry_date is not None and last_entry_date_retrieved > last_entry_date:
-                        self.logger.warn("Latest entry date changed even though no entries were loaded, last_entry_date=$s, last_entry_date_retrieved=%s", last_entry_date, last_entry_date_retrieved)
+                    if result_count == 0 and last_entry_date_retrieved is not None and last_entry_date is not None and last_entry_date_retrieved > last_entry_date:
+                        self.logger.warn("Latest entry date changed even though no entries were loaded, last_entry_date=%s, last_entry_date_retrieved=%s", last_entry_date, last_entry_date_retrieved)
 
                     # Handle the case where no last_entry_date could be loaded
                     if last_entry_date is None:
-                        if results == None:
-                            self.logger.warn("Latest entry date was not found, no results found")
-                        else:
-                            result_count = len(results)
-                            last_entry_date = time.localtime()
-                        
-                            self.logger.warn("Latest entry date was not found, result_count=$i", result_count)
+                        last_entry_date = time.time()
+
+                        self.logger.warn("Latest entry date was not found, result_count=%i", result_count)
 
                     # Set the last last_entry_date to the lastest entry retrieved
                     elif last_entry_date_retrieved is not None and last_entry_date_retrieved > last_entry_date:
                         last_entry_date = last_entry_date_retrieved
 
                     # Save the checkpoint so that we remember when we last tried to get the feed
-                    self.save_checkpoint(input_config.checkpoint_dir, stanza, self.get_non_deviated_last_run(last_ran, interval, stanza), last_entry_date)
+                    self.save_checkpoint(input_config.checkpoint_dir, stanza, self.get_non_deviated_last_run(last_ran, interval, stanza), last_entry_date, feed_state)
+
+    def add_timestamps(self, results):
+        """
+        Set the _time field of each of the results as they are consumed.
+
+        Arguments:
+        results -- An iterable of the flattened feed entries
+        """
+
+        for result in results:
+            if '_time' not in result:
+                result['_time'] = self.get_timestamp(result)
+
+            yield result
+
+    def write_entries(self, results, stanza, index, source, sourcetype, host, batch_output=False, max_events_per_file=None, max_bytes_per_file=None, output_format=event_writer.OUTPUT_FORMAT_KV):
+        """
+        Write out the feed entries as they are provided and return how many were written. The entries
+        are only made available for indexing once they have all been written; if getting them fails,
+        the exception is raised and none of them are indexed.
+
+        Arguments:
+        results -- An iterable of the flattened feed entries
+        stanza -- The name of the input
+        index -- The index to send the events to
+        source -- The source of the events
+        sourcetype -- The sourcetype of the events
+        host -- The host of the events
+        batch_output -- If true, the entries will be written into as few stash files as possible
+        max_events_per_file -- The maximum number of entries to write into a stash file when batching
+        max_bytes_per_file -- The maximum size of a stash file when batching
+        output_format -- The format to write the stash events in (see event_writer.OUTPUT_FORMATS)
+        """
+
+        result_count = 0
+
+        # Output the events as stash files (a file per entry unless batching). The files are only
+        # made available for indexing once all of the entries have been written so that none of
+        # them are indexed if retrieving the feed fails part of the way through (the checkpoint
+        # isn't saved then so they will all be retrieved again).
+        if self.OUTPUT_USING_STASH:
+            if batch_output:
+                writer = StashNewWriter(index=index, source_name=source, file_extension=".stash_syndication_input", sourcetype=sourcetype, host=host,
+                                        max_events_per_file=max_events_per_file, max_bytes_per_file=max_bytes_per_file, output_format=output_format)
+            else:
+                writer = StashNewWriter(index=index, source_name=source, file_extension=".stash_syndication_input", sourcetype=sourcetype, host=host,
+                                        max_events_per_file=1, output_format=output_format)
+
+            for result in writer.write_events_batched(self.add_timestamps(results)):
+                self.logger.debug("Wrote stash file=%s", result)
+
+            result_count = writer.events_written
+
+        # Output the events once they have all been retrieved (for the same reason)
+        else:
+            for result in list(results):
+                result_count += 1
+                self.output_event(result, stanza, index=index, source=source, sourcetype=sourcetype, host=host, unbroken=True, close=True)
+
+        return result_count
+
+    @classmethod
+    def get_feed_host(cls, cleaned_params):
+        """
+        Get the host that the feed will be retrieved from.
+
+        Arguments:
+        cleaned_params -- The parameters of the input
+        """
+
+        feed_url = cleaned_params.get("url", None)
+
+        if feed_url is None or feed_url.hostname is None:
+            return None
+
+        return feed_url.hostname.lower()
+
+    @classmethod
+    def get_global_setting(cls, stanzas, name, default):
+        """
+        Get a setting that applies to all of the inputs. The largest value configured across the
+        inputs is used.
+
+        Arguments:
+        stanzas -- A list of tuples containing the stanza name and the cleaned parameters
+        name -- The name of the setting
+        default -- The value to use if none of the inputs configure the setting
+        """
+
+        value = None
+
+        for _, cleaned_params in stanzas:
+            if cleaned_params.get(name, None) and (value is None or cleaned_params[name] > value):
+                value = cleaned_params[name]
+
+        if value is None:
+            return default
+
+        return value
+
+    @classmethod
+    def get_worker_count(cls, stanzas):
+        """
+        Get the number of worker threads to use for running the given inputs. The largest value
+        configured across the inputs is used since the threads are shared by all of them.
+
+        Arguments:
+        stanzas -- A list of tuples containing the stanza name and the cleaned parameters
+        """
+
+        return cls.get_global_setting(stanzas, "worker_threads", cls.DEFAULT_WORKER_THREADS)
+
+    def run_stanza(self, stanza, cleaned_params, input_config):
+        """
+        Run the input for the given stanza; this is called on a worker thread.
+
+        Arguments:
+        stanza -- The name of the stanza
+        cleaned_params -- The arguments following validation and conversion to Python objects.
+        input_config -- A dictionary that provides configuration data like session keys
+        """
+
+        try:
+            self.run(stanza, cleaned_params, input_config)
+        except Exception:
+            self.logger.exception("Unable to run the input, stanza=%s", stanza)
+
+    def reap_stanzas(self):
+        """
+        Forget about the inputs that have finished running so that they can be run again.
+        """
+
+        for stanza, (future, host, _, _) in list(self.running_stanzas.items()):
+            if future.done():
+                del self.running_stanzas[stanza]
+                self.running_hosts[host] -= 1
+                self.overrun_stanzas.discard(stanza)
+
+    def enforce_deadline(self, deadline):
+        """
+        Cancel the inputs that have been waiting to run for longer than the deadline so that they
+        are rescheduled on a later cycle. Inputs that are already running can't be stopped so
+        these are logged (their socket timeouts will end them).
+
+        Arguments:
+        deadline -- The number of seconds that an input may wait or run
+        """
+
+        for stanza, (future, host, started, feed_url) in list(self.running_stanzas.items()):
+            elapsed = time.time() - started
+
+            if elapsed <= deadline:
+                continue
+
+            if future.cancel():
+                self.logger.warn("Input was cancelled since it didn't run before the deadline, it will be rescheduled, stanza=%s, url=%s, elapsed=%.1fs", stanza, feed_url, elapsed)
+                del self.running_stanzas[stanza]
+                self.running_hosts[host] -= 1
+
+            elif stanza not in self.overrun_stanzas:
+                self.logger.warn("Input is still running after the deadline, stanza=%s, url=%s, elapsed=%.1fs", stanza, feed_url, elapsed)
+                self.overrun_stanzas.add(stanza)
+
+    def open_conversion_store(self, checkpoint_dir, max_entries):
+        """
+        Open the cache of HTML conversions in the checkpoint directory (unless it is already open).
+        The inputs will convert the HTML without the cache if it cannot be opened.
+
+        Arguments:
+        checkpoint_dir -- The directory where checkpoints ought to be saved
+        max_entries -- The maximum number of conversions to keep
+        """
+
+        if self.conversion_store is not None:
+            self.conversion_store.max_entries = max_entries
+            return
+
+        try:
+            self.conversion_store = ConversionStore(os.path.join(checkpoint_dir, ConversionStore.FILE_NAME), max_entries, self.logger)
+        except sqlite3.Error:
+            self.logger.exception("Unable to open the HTML conversion cache, checkpoint_dir=%s", checkpoint_dir)
+
+    def dispatch_stanzas(self, input_config, log_exception_and_continue=False):
+        """
+        Submit the inputs that are due to run to the worker threads. Inputs that are still running
+        from a previous cycle are skipped and inputs whose host already has the maximum number of
+        connections are deferred to a later cycle.
+
+        Arguments:
+        input_config -- A dictionary that provides configuration data like session keys
+        log_exception_and_continue -- If true, exceptions will not be thrown for invalid
+                                      configurations and instead the stanza will be skipped.
+        """
+
+        self.reap_stanzas()
+
+        # Validate the inputs
+        stanzas = []
+
+        for stanza, conf in input_config.configuration.items():
+            try:
+                stanzas.append((stanza, self.validate_parameters(stanza, conf)))
+
+            except FieldValidationException as exception:
+                if log_exception_and_continue:
+                    self.logger.error("The input stanza '%s' is invalid: %s" % (stanza, str(exception)))
+                else:
+                    raise exception
+
+        self.cycle_deadline = self.get_global_setting(stanzas, "cycle_deadline", self.DEFAULT_CYCLE_DEADLINE)
+        self.enforce_deadline(self.cycle_deadline)
+
+        # Keep as many idle connections to a host as there can be inputs using it at the same time
+        http_client.CONNECTION_POOL.max_idle_per_host = self.get_global_setting(stanzas, "max_connections_per_host", self.DEFAULT_MAX_CONNECTIONS_PER_HOST)
+        http_client.CONNECTION_POOL.evict_idle()
+
+        self.open_conversion_store(input_config.checkpoint_dir, self.get_global_setting(stanzas, "conversion_cache_size", ConversionStore.DEFAULT_MAX_ENTRIES))
+
+        # Start the pool for converting HTML in worker processes if any were requested
+        conversion_workers = self.get_global_setting(stanzas, "conversion_workers", 0)
+
+        if self.conversion_pool is None and conversion_workers > 0:
+            conversion_batch_size = self.get_global_setting(stanzas, "conversion_batch_size", html_converter.ConversionPool.DEFAULT_BATCH_SIZE)
+            self.logger.info("Converting HTML in worker processes, count=%i, batch_size=%i", conversion_workers, conversion_batch_size)
+            self.conversion_pool = html_converter.ConversionPool(conversion_workers, conversion_batch_size)
+
+        # Make the worker threads
+        if self.executor is None:
+            worker_count = self.get_worker_count(stanzas)
+            self.logger.info("Starting worker threads, count=%i", worker_count)
+            self.executor = ThreadPoolExecutor(max_workers=worker_count)
+
+        # Give the inputs that have waited the longest the first chance at a busy host
+        stanzas.sort(key=lambda stanza_and_params: self.last_dispatched.get(stanza_and_params[0], 0))
+
+        for stanza, cleaned_params in stanzas:
+
+            # Don't run an input again while it is still running
+            if stanza in self.running_stanzas:
+                continue
+
+            if not self.needs_another_run(input_config.checkpoint_dir, stanza, cleaned_params["interval"]):
+                continue
+
+            # Defer the input if its host is busy
+            host = self.get_feed_host(cleaned_params)
+            max_connections_per_host = cleaned_params.get("max_connections_per_host", None) or self.DEFAULT_MAX_CONNECTIONS_PER_HOST
+
+            if self.running_hosts.get(host, 0) >= max_connections_per_host:
+                self.logger.debug("Deferring the input since the host is busy, stanza=%s, host=%s", stanza, host)
+                continue
+
+            future = self.executor.submit(self.run_stanza, stanza, cleaned_params, input_config)
+            self.running_stanzas[stanza] = (future, host, time.time(), cleaned_params["url"].geturl())
+            self.last_dispatched[stanza] = time.time()
+            self.running_hosts[host] = self.running_hosts.get(host, 0) + 1
+
+    def wait_for_stanzas(self, timeout=None):
+        """
+        Wait for the running inputs to complete.
+
+        Arguments:
+        timeout -- The number of seconds to wait before cancelling the inputs that haven't started
+        """
+
+        wait([future for future, _, _, _ in self.running_stanzas.values()], timeout=timeout)
+        self.reap_stanzas()
+
+        if timeout is not None:
+            self.enforce_deadline(timeout)
+
+    def handle_shutdown_signal(self, signum, frame):
+        """
+        Request that the input stop once the running inputs complete.
+        """
+
+        self.logger.info("Shutdown was requested, signal=%i", signum)
+        self.shutdown_requested.set()
+
+    def do_shutdown(self):
+        """
+        Stop running new inputs and wait for the ones that are running to complete.
+        """
+
+        self.shutdown_requested.set()
+
+        if self.executor is not None:
+            self.logger.info("Waiting for the running inputs to complete, count=%i", len(self.running_stanzas))
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            self.reap_stanzas()
+
+        http_client.CONNECTION_POOL.close()
+
+        if self.conversion_store is not None:
+            self.conversion_store.close()
+            self.conversion_store = None
+
+        if self.conversion_pool is not None:
+            self.conversion_pool.close()
+            self.conversion_pool = None
+
+    def do_run(self, in_stream=sys.stdin, log_exception_and_continue=False):
+        """
+        Read the config from standard input and run the inputs on a pool of worker threads so that
+        a slow feed doesn't hold up the others.
+
+        in_stream -- The stream to get the input from (defaults to standard input)
+        log_exception_and_continue -- If true, exceptions will not be thrown for invalid
+                                      configurations and instead the stanza will be skipped.
+        """
+
+        # Run the modular import
+        input_config = self.read_config(in_stream)
+
+        if input_config is None:
+            self.logger.error("Did not receive an input configuration stream from Splunk, input will not run")
+            return
+
+        # Drain the running inputs when Splunk asks us to stop
+        try:
+            signal.signal(signal.SIGTERM, self.handle_shutdown_signal)
+        except ValueError:
+            # Signal handlers can only be set from the main thread
+            pass
+
+        while not self.shutdown_requested.is_set():
+
+            # If Splunk is no longer the parent process, then it has shut down and this input
+            # needs to terminate
+            if hasattr(os, 'getppid') and os.getppid() == 1:
+                self.logger.warn("Modular input is no longer running under Splunk; script will now exit")
+                self.do_shutdown()
+                sys.exit(2)
+
+            # Stop if the host is running SHC and this isn't the captain
+            if ServerInfo.is_shc_captain(input_config.session_key) == False:
+                self.logger.debug("The input will be skipped for now since is not the SHC captain")
+
+            # Ok, we are clear to run
+            else:
+                # Initialize the document that will be used to output the results
+                self.document = self._create_document()
+
+                self.dispatch_stanzas(input_config, log_exception_and_continue)
+
+                # Stop if the input is not running in single instance mode and allow Splunk to manage
+                # scheduling this input
+                if not self.use_single_instance:
+                    self.wait_for_stanzas(self.cycle_deadline)
+                    self.logger.info("Successfully executed all of the inputs")
+                    break
+
+            # Sleep for a bit
+            self.shutdown_requested.wait(self.sleep_interval)
+
+        self.do_shutdown()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,181 @@
+"""
+This module provides a cache on disk of the results of converting the HTML in feed entries so that
+entries that were already converted on an earlier poll don't need to be converted again. The
+results are kept in a SQLite database (normally in the checkpoint directory of the input) and are
+looked up by a hash of the HTML and the settings it was converted with. The least recently used
+results are removed once the cache has more than the maximum number of entries.
+
+Here is a sample of using the store:
+
+store = ConversionStore(os.path.join(checkpoint_dir, ConversionStore.FILE_NAME))
+
+key = store.make_key(('text', html, base_uri))
+text = store.get(key)
+
+if text is None:
+    text = html_to_text(html, base_uri)
+    store.put(key, text)
+
+store.commit()
+
+The store can be shared by multiple threads. Results that are put in the store (and the times
+that results were used) are kept in memory until commit() is called so that a feed's entries can
+be written in one transaction.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+class ConversionStore(object):
+    """
+    A least-recently-used cache of HTML conversions that is kept in a SQLite database.
+    """
+
+    # The name of the file that the store is kept in (within the checkpoint directory)
+    FILE_NAME = 'html_conversions.db'
+
+    # The default for the maximum number of results to keep
+    DEFAULT_MAX_ENTRIES = 10000
+
+    # How long to wait for another process to release the database (in seconds)
+    LOCK_TIMEOUT = 10
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, logger=None):
+        """
+        Open the store, creating it if necessary. sqlite3.Error will be raised if the database
+        cannot be opened.
+
+        Arguments:
+        path -- The path of the database file
+        max_entries -- The maximum number of results to keep (None to leave the size to whatever
+                       else uses the store)
+        logger -- The logger to log failures to read from or write to the store to
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+        self.logger = logger
+        self.lock = threading.Lock()
+
+        # The results that haven't been written and the times that results were last used
+        self.pending = {}
+        self.last_used = {}
+
+        self.connection = sqlite3.connect(path, timeout=self.LOCK_TIMEOUT, check_same_thread=False)
+
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS conversions (key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS conversions_last_used ON conversions (last_used)")
+
+    @classmethod
+    def make_key(cls, parts):
+        """
+        Make the key for the conversion described by the given parts (the HTML and the settings
+        used for converting it).
+
+        Arguments:
+        parts -- A tuple of the values that determine the result of the conversion
+        """
+
+        key = hashlib.sha256()
+
+        for part in parts:
+            key.update(str(part).encode('utf-8'))
+            key.update(b'\0')
+
+        return key.hexdigest()
+
+    def get(self, key):
+        """
+        Get the result with the given key (or None if it isn't in the store).
+
+        Arguments:
+        key -- The key of the conversion (from make_key())
+        """
+
+        with self.lock:
+            value = self.pending.get(key, None)
+
+            if value is None and self.connection is not None:
+                try:
+                    row = self.connection.execute("SELECT value FROM conversions WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as exception:
+                    self.log_error("Unable to read from the HTML conversion cache", exception)
+                    row = None
+
+                if row is not None:
+                    value = row[0]
+
+            if value is not None:
+                self.last_used[key] = time.time()
+
+            return value
+
+    def put(self, key, value):
+        """
+        Add a result to the store (it will be written when commit() is called).
+
+        Arguments:
+        key -- The key of the conversion (from make_key())
+        value -- The result of the conversion
+        """
+
+        with self.lock:
+            self.pending[key] = value
+            self.last_used[key] = time.time()
+
+    def commit(self):
+        """
+        Write the results that were added and remove the least recently used ones if the store is
+        over the maximum size.
+        """
+
+        with self.lock:
+            pending = self.pending
+            last_used = self.last_used
+
+            self.pending = {}
+            self.last_used = {}
+
+            if self.connection is None or (not pending and not last_used):
+                return
+
+            try:
+                with self.connection:
+                    self.connection.executemany("INSERT OR REPLACE INTO conversions (key, value, last_used) VALUES (?, ?, ?)",
+                                                [(key, value, last_used[key]) for key, value in pending.items()])
+
+                    self.connection.executemany("UPDATE conversions SET last_used = ? WHERE key = ?",
+                                                [(used, key) for key, used in last_used.items() if key not in pending])
+
+                    if self.max_entries is not None:
+                        count = self.connection.execute("SELECT COUNT(*) FROM conversions").fetchone()[0]
+
+                        if count > self.max_entries:
+                            self.connection.execute("DELETE FROM conversions WHERE key IN (SELECT key FROM conversions ORDER BY last_used LIMIT ?)",
+                                                    (count - self.max_entries,))
+
+            except sqlite3.Error as exception:
+                self.log_error("Unable to write to the HTML conversion cache", exception)
+
+    def close(self):
+        """
+        Write the pending results and close the database.
+        """
+
+        self.commit()
+
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def log_error(self, message, exception):
+        """
+        Log a failure to use the database; the conversions are done again if the cache fails.
+        """
+
+        if self.logger is not None:
+            self.logger.warn("%s, path=%s, error=%s", message, self.path, str(exception))
@@ -7,12 +7,20 @@ from event_writer import StashNewWriter
 
 writer = StashNewWriter(index='summary', source_name='test_of_event_writer')
 writer.write_event({'message': 'here is an event'})
+
+The events can be written as JSON objects instead of key/value pairs by using the JSON output
+format:
+
+writer = StashNewWriter(index='summary', source_name='test_of_event_writer', output_format=OUTPUT_FORMAT_JSON)
 """
 
-from datetime import datetime, timedelta, tzinfo
+from datetime import timedelta, tzinfo
+import calendar
+import json
 import time
 import random
 import re
+import os
 from splunk.clilib.bundle_paths import make_splunkhome_path
 
 try:
@@ -38,6 +46,15 @@ class UTC(tzinfo):
 
 utc = UTC()
 
+# The formats that the events can be written in
+OUTPUT_FORMAT_KV = 'kv'
+OUTPUT_FORMAT_JSON = 'json'
+
+OUTPUT_FORMATS = [OUTPUT_FORMAT_KV, OUTPUT_FORMAT_JSON]
+
+# The encoder for the JSON events; the events are written on a single line without the extra spaces
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(',', ':'))
+
 class EventWriter(object):
     """
     The event writer class provides a mechanism for writing out events directly to Splunk.
@@ -64,6 +81,9 @@ class EventWriter(object):
         "timeendpos"    : "orig_timeendpos"
     }
 
+    # The field that the date of the event is put in for events written as JSON
+    JSON_TIME_FIELD = "timestamp"
+
     def get_basic_fields(self, event):
         """
         Get a list of the fields that must be included in every event. A new dictionary will be
@@ -108,81 +128,176 @@ class EventWriter(object):
 
         Arguments:
         result -- a Splunk search result
-        event_time -- The time of the event (defaults to the current time)
+        event_time -- The time of the event as the number of seconds since the epoch or as a
+                      datetime (naive ones are taken to be in UTC); defaults to the current time
         ignore_empty_fields -- Do not include arguments whose value is empty
         """
 
-        # Populate the event time if not provided
-        if event_time is None:
-            if '_time' in result:
-                event_time = result['_time']
-            else:
-                event_time = datetime.now(utc)
+        return ''.join(self.event_to_parts(result, event_time, ignore_empty_fields))
 
-        # Get the timestamp formatted correctly for Splunk (e.g. 05/13/2011 14:35:00)
-        try:
-            date_str = event_time.strftime("%m/%d/%Y %H:%M:%S UTC")
-        except:
-            # Yikes, that couldn't be parsed; ues the current time then
-            date_str = datetime.now(utc).strftime("%m/%d/%Y %H:%M:%S UTC")
+    def event_to_parts(self, result, event_time=None, ignore_empty_fields=True, parts=None):
+        """
+        Produces the strings that make up the event from event_to_string() so that they can be
+        joined or written out without concatenating them one field at a time. The list of strings is
+        returned.
+
+        Arguments:
+        result -- a Splunk search result
+        event_time -- The time of the event as the number of seconds since the epoch or as a
+                      datetime (naive ones are taken to be in UTC); defaults to the current time
+        ignore_empty_fields -- Do not include arguments whose value is empty
+        parts -- The list to add the strings to (a new one is used if None)
+        """
+
+        if parts is None:
+            parts = []
+
+        timestamp, date_str = self.get_event_time(result, event_time)
 
         # Start the event with the date
-        event = date_str
+        parts.append(date_str)
 
         # Get the fields that should be included with every event
         basic_fields = self.get_basic_fields(result)
 
-        # Set the time to the current time
-        basic_fields["_time"] = time.mktime(event_time.timetuple())
+        # Set the time of the event
+        basic_fields["_time"] = timestamp
 
         for key in basic_fields:
-            event = event + ", %s=\"%s\"" % (key, basic_fields[key])
+            parts.append(", %s=\"%s\"" % (key, basic_fields[key]))
+
+        convert_special_fields = self.convert_special_fields
+        escape_value = self.escape_value
+        append = parts.append
 
         # Add the event fields
-        for key in result:
+        for key, result_value in result.items():
 
             # Escape special fields that Splunk will overwrite
-            converted_key = self.convert_special_fields(key)
+            converted_key = convert_special_fields(key)
 
             # Do not include fields whose name is empty or none since this indicates that the field
-            # should not be included at all
-            if converted_key is None or len(converted_key) == 0:
-                pass #Do nothing, this field will be excluded
-
-            # Make sure the field is not an underscore field (these are meta fields that should not
-            # be included)
-            elif converted_key.startswith("_"):
-                pass #Do nothing, this field will be excluded
+            # should not be included at all; underscore fields are meta fields that should not be
+            # included either
+            if not converted_key or converted_key.startswith("_"):
+                continue
 
             # The field has a single value, write it out
-            elif not isinstance(result[key], list) or isinstance(result[key], basestring):
+            if not isinstance(result_value, list):
+                values = (result_value,)
+
+            # The field name has multiple values, write out multiple key/value pairs accordingly.
+            else:
+                values = result_value
 
-                result_value = str(result[key])
+            for value in values:
+
+                if type(value) is not str:
+                    value = str(value)
 
                 # If the field is blank then do not include it if we are supposed to exclude it
-                if len(result_value) <= 0 and ignore_empty_fields == True:
-                    pass # Ignore this field and continue to the next field value
-                else:
-                     #TODO: need to figure out if field names must be escaped
-                    event = event + ", %s=\"%s\"" % (converted_key, self.escape_value(result_value))
+                if len(value) <= 0 and ignore_empty_fields:
+                    continue
 
-            # The field name has multiple values, write out multiple key/value pairs accordingly.
+                #TODO: need to figure out if field names must be escaped
+                append(", %s=\"%s\"" % (converted_key, escape_value(value)))
+
+        # Return the parts of the resulting event
+        return parts
+
+    def event_to_json(self, result, event_time=None, ignore_empty_fields=True):
+        """
+        Produces a JSON object on a single line that represents a single event (for the stash). The
+        date of the event is the first field so that Splunk can find it at the start of the event.
+        The fields are named and excluded the same way as with event_to_string() and fields with
+        multiple values are written as lists.
+
+        Arguments:
+        result -- a Splunk search result
+        event_time -- The time of the event as the number of seconds since the epoch or as a
+                      datetime (naive ones are taken to be in UTC); defaults to the current time
+        ignore_empty_fields -- Do not include arguments whose value is empty
+        """
+
+        event = {self.JSON_TIME_FIELD: self.get_event_time(result, event_time)[1]}
+
+        # Get the fields that should be included with every event
+        for key, value in self.get_basic_fields(result).items():
+            event[key] = str(value)
+
+        convert_special_fields = self.convert_special_fields
+
+        # Add the event fields
+        for key, result_value in result.items():
+
+            # Escape special fields that Splunk will overwrite
+            converted_key = convert_special_fields(key)
+
+            # Exclude the fields that event_to_string() would
+            if not converted_key or converted_key.startswith("_"):
+                continue
+
+            # Don't let a field replace the date of the event
+            if converted_key == self.JSON_TIME_FIELD:
+                converted_key = "orig_" + converted_key
+
+            # The field has a single value
+            if not isinstance(result_value, list):
+                value = result_value if type(result_value) is str else str(result_value)
+
+                # If the field is blank then do not include it if we are supposed to exclude it
+                if len(value) <= 0 and ignore_empty_fields:
+                    continue
+
+                event[converted_key] = value
+
+            # The field has multiple values, write them out as a list
             else:
-                values = result[key]
+                values = [str(value) for value in result_value]
 
-                # Add each value as a separate field
-                for value in values:
+                if ignore_empty_fields:
+                    values = [value for value in values if len(value) > 0]
 
-                    value = str(value)
+                    if len(values) == 0:
+                        continue
+
+                event[converted_key] = values
+
+        return JSON_ENCODER.encode(event)
+
+    def get_event_time(self, result, event_time=None):
+        """
+        Get the time of the event as the number of seconds since the epoch and formatted for Splunk
+        (e.g. 05/13/2011 14:35:00 UTC). A tuple of the two is returned.
 
-                    # If the field is blank then do not include it if we are supposed to exclude it
-                    if len(value) <= 0 and ignore_empty_fields:
-                        pass # Ignore this field and continue to the next field value
-                    else:
-                        event = event + ", %s=\"%s\"" % (converted_key, self.escape_value(value))
+        Arguments:
+        result -- a Splunk search result
+        event_time -- The time of the event as the number of seconds since the epoch or as a
+                      datetime (naive ones are taken to be in UTC); defaults to the _time field of
+                      the result or the current time
+        """
 
-        # Return the resulting event
-        return event
+        # Populate the event time if not provided
+        if event_time is None:
+            if '_time' in result:
+                event_time = result['_time']
+            else:
+                event_time = time.time()
+
+        # Get the timestamp formatted correctly for Splunk (e.g. 05/13/2011 14:35:00)
+        if isinstance(event_time, (int, float)):
+            timestamp = event_time
+            date_str = time.strftime("%m/%d/%Y %H:%M:%S UTC", time.gmtime(event_time))
+        else:
+            try:
+                date_str = event_time.strftime("%m/%d/%Y %H:%M:%S UTC")
+                timestamp = calendar.timegm(event_time.utctimetuple())
+            except:
+                # Yikes, that couldn't be parsed; ues the current time then
+                timestamp = time.time()
+                date_str = time.strftime("%m/%d/%Y %H:%M:%S UTC", time.gmtime(timestamp))
+
+        return timestamp, date_str
 
     def flush(self):
         """
@@ -202,6 +317,11 @@ class EventWriter(object):
         Arguments:
         value -- The string value to be escaped
         """
+
+        # Most values have nothing to escape; they are returned as they are
+        if '"' not in value and '\\' not in value:
+            return value
+
         return value.replace('\\', '\\\\').replace('"', '\\"')
 
     def convert_special_fields(self, name):
@@ -214,19 +334,15 @@ class EventWriter(object):
         name -- field name to convert
         """
 
-        # If the field is a special field, then change the name
-        try:
-            # Convert the old tag fields
-            if name.startswith("tag::"):
-                return "orig_" + name
-            elif name.startswith("date_"):
-                return None
-            else:
-                return self.SPECIAL_FIELDS_MAP[name]
-        except KeyError:
-            # The field was not found. This indicates that it does not need to be converted so
-            # return the original.
-            return name
+        # Convert the old tag fields
+        if name.startswith("tag::"):
+            return "orig_" + name
+        elif name.startswith("date_"):
+            return None
+
+        # If the field is a special field, then change the name; fields that aren't found don't
+        # need to be converted so the original is returned
+        return self.SPECIAL_FIELDS_MAP.get(name, name)
 
 class StashNewWriter(EventWriter):
     """
@@ -237,6 +353,10 @@ class StashNewWriter(EventWriter):
     # This is the line-breaker for stash new
     LINE_BREAKER = "==##~~##~~  1E8N3D4E6V5E7N2T9 ~~##~~##=="
 
+    # Stash files are written under this extension (outside of the spool directory) until they are
+    # complete
+    TEMP_FILE_EXTENSION = ".tmp"
+
     # Below is a sample of stash new file:
     """
     ***SPLUNK*** index=summary source="Some Search"
@@ -245,7 +365,8 @@ class StashNewWriter(EventWriter):
     ==##~~##~~  1E8N3D4E6V5E7N2T9 ~~##~~##==
     """
 
-    def __init__(self, index, source_name, file_extension=".stash_new", sourcetype=None, host=None):
+    def __init__(self, index, source_name, file_extension=".stash_new", sourcetype=None, host=None,
+                 max_events_per_file=None, max_bytes_per_file=None, output_format=OUTPUT_FORMAT_KV):
         """
         Constructor for the stash writer,=.
 
@@ -255,12 +376,21 @@ class StashNewWriter(EventWriter):
         file_extension -- the extension of the stash file (usually .stash_new)
         sourcetype -- the sourcetype to use for the event
         host -- the host to assign the event to
+        max_events_per_file -- the maximum number of events to put in a single file when writing
+                               batches (None or 0 means no limit)
+        max_bytes_per_file -- the approximate maximum size of a single file in bytes (the events are
+                              written as UTF-8) when writing batches (None or 0 means no limit)
+        output_format -- the format to write the events in (OUTPUT_FORMAT_KV or OUTPUT_FORMAT_JSON)
         """
         self.index = index
         self.source_name = source_name
         self.file_extension = file_extension
         self.sourcetype = sourcetype
         self.host = host
+        self.max_events_per_file = max_events_per_file
+        self.max_bytes_per_file = max_bytes_per_file
+        self.output_format = output_format
+        self.events_written = 0
 
     def make_fields_list(self, fields_dict):
         """
@@ -317,46 +447,186 @@ class StashNewWriter(EventWriter):
 
         return stash_file
 
-    def write_events(self, array_of_events, is_raw_string=False):
+    def get_temp_file_name(self, stash_file):
         """
-        Writes the provided events (as dictionaries) to a stash file and returns the name of the
-        file written.
+        Get the name that the given stash file is written under until it is complete. This is
+        outside of the spool directory since Splunk's input on the spool would index (and delete)
+        an incomplete file whatever it is named; it is on the same filesystem so that the file can
+        be renamed into place.
 
         Arguments:
-        array_of_events -- an array of Splunk search results
-        is_raw_string -- indicates if the events should be written as raw strings
+        stash_file -- the final name of the stash file
+        """
+
+        return make_splunkhome_path(["var", "run", "splunk", os.path.basename(stash_file) + self.TEMP_FILE_EXTENSION])
+
+    def open_stash_file(self):
+        """
+        Open a new stash file and write the header to it. The file is written under a temporary
+        name outside of the spool directory so that Splunk doesn't pick it up before it is complete;
+        call close_stash_file() to make it available for indexing.
+
+        Returns a tuple of the final file name and the file handle.
         """
 
-        # Open the stash file
         stash_file = self.get_file_name()
-        stash_file_h = open(stash_file, 'a')
+        stash_file_h = open(self.get_temp_file_name(stash_file), 'a', encoding='utf-8')
 
         # Write the header
         stash_file_h.write(self.get_header())
 
-        # Write the line_breaker
-        stash_file_h.write(self.LINE_BREAKER)
-        stash_file_h.write("\n")
+        return stash_file, stash_file_h
+
+    def close_stash_file(self, stash_file, stash_file_h):
+        """
+        Close a stash file opened by open_stash_file() and move it into place so that it can be
+        indexed.
+
+        Arguments:
+        stash_file -- the final name of the stash file
+        stash_file_h -- the handle of the open file
+        """
+
+        stash_file_h.close()
+        os.rename(stash_file_h.name, stash_file)
+
+    def serialize_event(self, event, is_raw_string=False):
+        """
+        Convert the event to the string that will be written to the stash file (including the
+        line-breaker that precedes it).
+
+        Arguments:
+        event -- a Splunk search result
+        is_raw_string -- indicates if the event is a raw string
+        """
+
+        return ''.join(self.serialize_event_parts(event, is_raw_string))
+
+    def serialize_event_parts(self, event, is_raw_string=False):
+        """
+        Convert the event to the list of strings that will be written to the stash file (including
+        the line-breaker that precedes it). The strings can be written to the file as they are
+        without joining them first.
+
+        Arguments:
+        event -- a Splunk search result
+        is_raw_string -- indicates if the event is a raw string
+        """
+
+        parts = [self.LINE_BREAKER, "\n"]
 
         if self.sourcetype is not None:
-            stash_file_h.write('sourcetype=\"' + self.sourcetype + '\"')
+            parts.append('sourcetype=\"' + self.sourcetype + '\"')
 
-        # Write out the events
-        for event in array_of_events:
+        if is_raw_string:
+            parts.append(event)
+        elif self.output_format == OUTPUT_FORMAT_JSON:
+            parts.append(self.event_to_json(event))
+        else:
+            self.event_to_parts(event, parts=parts)
 
-            if is_raw_string:
-                stash_file_h.write(event)
-            else:
-                stash_file_h.write(self.event_to_string(event))
+        parts.append("\n")
+
+        return parts
+
+    def write_events(self, array_of_events, is_raw_string=False):
+        """
+        Writes the provided events (as dictionaries) to a stash file and returns the name of the
+        file written.
+
+        Arguments:
+        array_of_events -- an array of Splunk search results
+        is_raw_string -- indicates if the events should be written as raw strings
+        """
 
-            stash_file_h.write("\n")
+        # Open the stash file
+        stash_file, stash_file_h = self.open_stash_file()
+
+        # Write out the events
+        for event in array_of_events:
+            stash_file_h.writelines(self.serialize_event_parts(event, is_raw_string))
 
         # Close the file
-        stash_file_h.close()
+        self.close_stash_file(stash_file, stash_file_h)
 
         # Return the file name.
         return stash_file
 
+    def write_events_batched(self, array_of_events, is_raw_string=False):
+        """
+        Writes the provided events (as dictionaries) to as few stash files as the limits on the
+        events and bytes per file allow. Returns the list of the files written; the number of events
+        written is stored in events_written.
+
+        The files are only moved into the spool directory once all of the events have been written.
+        If getting the events fails part of the way through, the files are removed and the exception
+        is raised so that none of the events are indexed (they would otherwise be indexed again when
+        the events are written on the next try).
+
+        Arguments:
+        array_of_events -- an iterable of Splunk search results
+        is_raw_string -- indicates if the events should be written as raw strings
+        """
+
+        # The files written so far (as tuples of the final name and the file handle)
+        written_files = []
+        stash_file_h = None
+        events_in_file = 0
+        bytes_in_file = 0
+        self.events_written = 0
+
+        try:
+            for event in array_of_events:
+                event_parts = self.serialize_event_parts(event, is_raw_string)
+
+                # Get the size of the event in the file (only parts that aren't ASCII need to be
+                # encoded to find out)
+                event_length = 0
+
+                for part in event_parts:
+                    event_length += len(part) if part.isascii() else len(part.encode('utf-8'))
+
+                # Start a new file if this event would put the current one over the limits
+                if stash_file_h is not None:
+                    if self.max_events_per_file and events_in_file >= self.max_events_per_file:
+                        stash_file_h.close()
+                        stash_file_h = None
+
+                    elif self.max_bytes_per_file and (bytes_in_file + event_length) > self.max_bytes_per_file:
+                        stash_file_h.close()
+                        stash_file_h = None
+
+                if stash_file_h is None:
+                    stash_file, stash_file_h = self.open_stash_file()
+                    written_files.append((stash_file, stash_file_h))
+                    events_in_file = 0
+                    bytes_in_file = 0
+
+                stash_file_h.writelines(event_parts)
+                events_in_file += 1
+                bytes_in_file += event_length
+                self.events_written += 1
+
+        # Remove the files written if the events couldn't all be written
+        except:
+            self.events_written = 0
+
+            for stash_file, stash_file_h in written_files:
+                stash_file_h.close()
+
+                try:
+                    os.remove(stash_file_h.name)
+                except OSError:
+                    pass
+
+            raise
+
+        # Move the files into place
+        for stash_file, stash_file_h in written_files:
+            self.close_stash_file(stash_file, stash_file_h)
+
+        return [stash_file for stash_file, stash_file_h in written_files]
+
 class CachedWriter(EventWriter):
     """
     Stores the events in an variable so that they can be programmatically returned (useful for
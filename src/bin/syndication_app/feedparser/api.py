@@ -26,13 +26,16 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import codecs
 import io
+import re
+import tempfile
 import urllib.error
 import urllib.parse
 import xml.sax
 
 from .datetimes import registerDateHandler, _parse_date
-from .encodings import convert_to_utf8
+from .encodings import convert_to_utf8, is_ascii_compatible
 from .exceptions import *
 from .html import _BaseHTMLProcessor
 from . import http
@@ -53,6 +56,16 @@ PREFERRED_XML_PARSERS = ["drv_libxml2"]
 
 _XML_AVAILABLE = True
 
+# When a feed is streamed, it is read and parsed this many bytes at a time.
+# The raw document is also kept in a temporary file (in memory until it is
+# larger than STREAM_SPOOL_SIZE) in case it needs to be parsed again by the
+# loose parser.
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_SPOOL_SIZE = 1024 * 1024
+
+# Match the start of the first element; everything before it is the prolog.
+RE_FIRST_ELEMENT = re.compile(br'<\w')
+
 SUPPORTED_VERSIONS = {
     '': 'unknown',
     'rss090': 'RSS 0.90',
@@ -136,6 +149,24 @@ def _open_resource(url_file_stream_or_string, etag, modified, agent, referrer, h
     return url_file_stream_or_string
 
 
+def _open_resource_stream(url_file_stream_or_string, etag, modified, agent, referrer, handlers, request_headers, result):
+    """URL or stream --> object with a read(size) method
+
+    This is like _open_resource() except that the document isn't read.
+    None is returned for sources that can't be streamed (file names and
+    strings).
+    """
+
+    if hasattr(url_file_stream_or_string, 'read'):
+        return url_file_stream_or_string
+
+    if isinstance(url_file_stream_or_string, str) \
+       and urllib.parse.urlparse(url_file_stream_or_string)[0] in ('http', 'https', 'ftp', 'file', 'feed'):
+        return http.get_stream(url_file_stream_or_string, etag, modified, agent, referrer, handlers, request_headers, result)
+
+    return None
+
+
 LooseFeedParser = type(
     'LooseFeedParser',
     (_LooseFeedParser, _FeedParserMixin, _BaseHTMLProcessor, object),
@@ -149,7 +180,7 @@ StrictFeedParser = type(
 )
 
 
-def parse(url_file_stream_or_string, etag=None, modified=None, agent=None, referrer=None, handlers=None, request_headers=None, response_headers=None, resolve_relative_uris=None, sanitize_html=None):
+def parse(url_file_stream_or_string, etag=None, modified=None, agent=None, referrer=None, handlers=None, request_headers=None, response_headers=None, resolve_relative_uris=None, sanitize_html=None, stream=False, raw_html_elements=None, parser=None, encoding_hint=None):
     """Parse a feed from a URL, file, stream, or string.
 
     :param url_file_stream_or_string:
@@ -192,6 +223,26 @@ def parse(url_file_stream_or_string, etag=None, modified=None, agent=None, refer
         Should feedparser skip HTML sanitization? Only disable this if you know
         what you are doing!  Defaults to the value of
         :data:`feedparser.SANITIZE_HTML`, which is ``True``.
+    :param bool stream:
+        Should the document be read and parsed a chunk at a time instead of
+        all at once? This keeps memory use down for large feeds. Only URLs and
+        file-like objects can be streamed. Defaults to ``False``.
+    :param raw_html_elements:
+        Names of the entry elements (such as ``content`` and ``summary``)
+        whose HTML should be left as it is instead of being resolved and
+        sanitized, for callers that process the HTML themselves.
+    :type raw_html_elements: :class:`set` of :class:`str`
+    :param str parser:
+        The parser to use: ``'loose'`` skips the strict XML parser (for
+        documents that are known to be malformed). By default the strict
+        parser is tried first and the loose one is used if it fails. The
+        parser that was used is reported in the ``parser`` key of the
+        result.
+    :param str encoding_hint:
+        The character encoding that an earlier copy of the document was
+        found to be in (the ``encoding`` key of its result). It is tried
+        before the encoding is detected, which saves detecting the
+        encoding again for documents that declare the wrong one.
 
     :return: A :class:`FeedParserDict`.
     """
@@ -212,8 +263,12 @@ def parse(url_file_stream_or_string, etag=None, modified=None, agent=None, refer
         headers={},
     )
 
+    stream_source = None
     try:
-        data = _open_resource(url_file_stream_or_string, etag, modified, agent, referrer, handlers, request_headers, result)
+        if stream:
+            stream_source = _open_resource_stream(url_file_stream_or_string, etag, modified, agent, referrer, handlers, request_headers, result)
+        if stream_source is None:
+            data = _open_resource(url_file_stream_or_string, etag, modified, agent, referrer, handlers, request_headers, result)
     except urllib.error.URLError as error:
         result.update({
             'bozo': True,
@@ -221,16 +276,26 @@ def parse(url_file_stream_or_string, etag=None, modified=None, agent=None, refer
         })
         return result
 
+    if stream_source is not None:
+        try:
+            _parse_stream(stream_source, result, response_headers, resolve_relative_uris, sanitize_html, raw_html_elements, parser, encoding_hint)
+        finally:
+            if stream_source is not url_file_stream_or_string:
+                stream_source.close()
+        return result
+
     if not data:
         return result
 
     # overwrite existing headers using response_headers
     result['headers'].update(response_headers or {})
 
-    data = convert_to_utf8(result['headers'], data, result)
-    use_strict_parser = result['encoding'] and True or False
+    _parse_data(data, result, resolve_relative_uris, sanitize_html, raw_html_elements, parser=parser, encoding_hint=encoding_hint)
+    return result
 
-    result['version'], data, entities = replace_doctype(data)
+
+def _get_base(result):
+    """Get the base URI and language to parse the document with."""
 
     # Ensure that baseuri is an absolute URI using an acceptable URI scheme.
     contentloc = result['headers'].get('content-location', '')
@@ -241,22 +306,63 @@ def parse(url_file_stream_or_string, etag=None, modified=None, agent=None, refer
     if isinstance(baselang, bytes) and baselang is not None:
         baselang = baselang.decode('utf-8', 'ignore')
 
-    if not _XML_AVAILABLE:
+    return baseuri, baselang
+
+
+def _make_strict_parser(baseuri, baselang, resolve_relative_uris, sanitize_html, raw_html_elements):
+    """Create the strict feed parser and the SAX parser that drives it."""
+
+    feedparser = StrictFeedParser(baseuri, baselang, 'utf-8')
+    feedparser.resolve_relative_uris = resolve_relative_uris
+    feedparser.sanitize_html = sanitize_html
+    if raw_html_elements:
+        feedparser.raw_html_elements = frozenset(raw_html_elements)
+    saxparser = xml.sax.make_parser(PREFERRED_XML_PARSERS)
+    saxparser.setFeature(xml.sax.handler.feature_namespaces, 1)
+    try:
+        # disable downloading external doctype references, if possible
+        saxparser.setFeature(xml.sax.handler.feature_external_ges, 0)
+    except xml.sax.SAXNotSupportedException:
+        pass
+    saxparser.setContentHandler(feedparser)
+    saxparser.setErrorHandler(feedparser)
+    return feedparser, saxparser
+
+
+def _set_parsed(result, feedparser):
+    """Copy what the feed parser found into the result."""
+
+    result['feed'] = feedparser.feeddata
+    result['entries'] = feedparser.entries
+    result['version'] = result['version'] or feedparser.version
+    result['namespaces'] = feedparser.namespaces_in_use
+    result['parser'] = 'strict' if isinstance(feedparser, StrictFeedParser) else 'loose'
+
+
+def _parse_data(data, result, resolve_relative_uris, sanitize_html, raw_html_elements=None, strict_error=None, parser=None, encoding_hint=None):
+    """Parse the whole document.
+
+    If strict_error is given, the strict parser has already failed with it
+    and the loose parser is used straight away (as it is if parser is
+    'loose').
+    """
+
+    data = convert_to_utf8(result['headers'], data, result, encoding_hint)
+    use_strict_parser = result['encoding'] and True or False
+
+    result['version'], data, entities = replace_doctype(data)
+
+    baseuri, baselang = _get_base(result)
+
+    if not _XML_AVAILABLE or parser == 'loose':
+        use_strict_parser = 0
+    if use_strict_parser and strict_error is not None:
+        result['bozo'] = 1
+        result['bozo_exception'] = strict_error
         use_strict_parser = 0
     if use_strict_parser:
         # initialize the SAX parser
-        feedparser = StrictFeedParser(baseuri, baselang, 'utf-8')
-        feedparser.resolve_relative_uris = resolve_relative_uris
-        feedparser.sanitize_html = sanitize_html
-        saxparser = xml.sax.make_parser(PREFERRED_XML_PARSERS)
-        saxparser.setFeature(xml.sax.handler.feature_namespaces, 1)
-        try:
-            # disable downloading external doctype references, if possible
-            saxparser.setFeature(xml.sax.handler.feature_external_ges, 0)
-        except xml.sax.SAXNotSupportedException:
-            pass
-        saxparser.setContentHandler(feedparser)
-        saxparser.setErrorHandler(feedparser)
+        feedparser, saxparser = _make_strict_parser(baseuri, baselang, resolve_relative_uris, sanitize_html, raw_html_elements)
         source = xml.sax.xmlreader.InputSource()
         source.setByteStream(io.BytesIO(data))
         try:
@@ -269,9 +375,114 @@ def parse(url_file_stream_or_string, etag=None, modified=None, agent=None, refer
         feedparser = LooseFeedParser(baseuri, baselang, 'utf-8', entities)
         feedparser.resolve_relative_uris = resolve_relative_uris
         feedparser.sanitize_html = sanitize_html
+        if raw_html_elements:
+            feedparser.raw_html_elements = frozenset(raw_html_elements)
         feedparser.feed(data.decode('utf-8', 'replace'))
-    result['feed'] = feedparser.feeddata
-    result['entries'] = feedparser.entries
-    result['version'] = result['version'] or feedparser.version
-    result['namespaces'] = feedparser.namespaces_in_use
-    return result
+    _set_parsed(result, feedparser)
+
+
+def _read_spool(stream, spool):
+    """Read the rest of the stream into the spool and return all of it."""
+
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        spool.write(chunk)
+    spool.seek(0)
+    return spool.read()
+
+
+def _parse_stream(stream, result, response_headers, resolve_relative_uris, sanitize_html, raw_html_elements=None, parser=None, encoding_hint=None):
+    """Parse the document while it is being read.
+
+    The prolog is read first so that the encoding and the doctype can be
+    handled the same way _parse_data() does.  The rest of the document is
+    then decoded and fed to an incremental SAX parser one chunk at a time.
+    Documents that can't be handled this way (ones that aren't in an
+    ASCII-compatible encoding, change encoding part way through or that the
+    strict parser rejects) are parsed from the spooled copy by _parse_data(),
+    as are documents that are to be parsed with the loose parser and ones
+    that an encoding hint says aren't in the encoding they declare.
+    """
+
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_SIZE)
+    try:
+        head = b''
+        match = None
+        while match is None and len(head) < STREAM_SPOOL_SIZE:
+            chunk = stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            spool.write(chunk)
+            head += chunk
+            match = RE_FIRST_ELEMENT.search(head)
+
+        if not head:
+            return
+
+        # overwrite existing headers using response_headers
+        result['headers'].update(response_headers or {})
+
+        if match is None or not _XML_AVAILABLE or not is_ascii_compatible(head) or parser == 'loose':
+            _parse_data(_read_spool(stream, spool), result, resolve_relative_uris, sanitize_html, raw_html_elements, parser=parser, encoding_hint=encoding_hint)
+            return
+
+        # Keep the name of the first element in the head (replace_doctype() looks for it)
+        split = match.start() + 2
+        head, rest = head[:split], head[split:]
+
+        bozo_state = {key: result[key] for key in ('bozo', 'bozo_exception') if key in result}
+
+        def restore_bozo_state():
+            result.pop('bozo_exception', None)
+            result.update(bozo_state)
+
+        data = convert_to_utf8(result['headers'], head, result)
+        encoding = result['encoding']
+
+        # Don't trust an encoding that was only guessed from the prolog (or
+        # that the document was found not to be in before)
+        if (not encoding or isinstance(result.get('bozo_exception'), (CharacterEncodingOverride, CharacterEncodingUnknown))
+                or (encoding_hint and encoding_hint.lower() != encoding.lower())):
+            restore_bozo_state()
+            _parse_data(_read_spool(stream, spool), result, resolve_relative_uris, sanitize_html, raw_html_elements, encoding_hint=encoding_hint)
+            return
+
+        result['version'], data, entities = replace_doctype(data)
+
+        baseuri, baselang = _get_base(result)
+        feedparser, saxparser = _make_strict_parser(baseuri, baselang, resolve_relative_uris, sanitize_html, raw_html_elements)
+
+        if not isinstance(saxparser, xml.sax.xmlreader.IncrementalParser):
+            restore_bozo_state()
+            _parse_data(_read_spool(stream, spool), result, resolve_relative_uris, sanitize_html, raw_html_elements, encoding_hint=encoding_hint)
+            return
+
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            saxparser.prepareParser(xml.sax.xmlreader.InputSource())
+            saxparser.feed(data)
+            chunk = rest
+            while True:
+                if chunk:
+                    saxparser.feed(decoder.decode(chunk).encode('utf-8'))
+                chunk = stream.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                spool.write(chunk)
+            saxparser.feed(decoder.decode(b'', True).encode('utf-8'))
+            saxparser.close()
+        except UnicodeDecodeError:
+            # The rest of the document isn't in the encoding that the prolog is in
+            restore_bozo_state()
+            _parse_data(_read_spool(stream, spool), result, resolve_relative_uris, sanitize_html, raw_html_elements, encoding_hint=encoding_hint)
+            return
+        except xml.sax.SAXException as e:
+            restore_bozo_state()
+            _parse_data(_read_spool(stream, spool), result, resolve_relative_uris, sanitize_html, raw_html_elements, strict_error=feedparser.exc or e, encoding_hint=encoding_hint)
+            return
+
+        _set_parsed(result, feedparser)
+    finally:
+        spool.close()
@@ -25,6 +25,8 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import functools
+
 from .asctime import _parse_date_asctime
 from .greek import _parse_date_greek
 from .hungarian import _parse_date_hungarian
@@ -36,17 +38,47 @@ from .w3dtf import _parse_date_w3dtf
 
 _date_handlers = []
 
+# The number of recently parsed date strings to remember the results of
+# (feeds repeat the same dates every time they are polled)
+DATE_CACHE_SIZE = 4096
+
+# Handlers that only parse dates that start with a number; they are skipped
+# for dates that start with a name (such as the day name of RFC 822 dates)
+_numeric_date_handlers = frozenset([
+    _parse_date_w3dtf,
+    _parse_date_iso8601,
+    _parse_date_hungarian,
+    _parse_date_nate,
+    _parse_date_onblog,
+])
+
 
 def registerDateHandler(func):
     """Register a date handler function (takes string, returns 9-tuple date in GMT)"""
     _date_handlers.insert(0, func)
+    _parse_date_cached.cache_clear()
+
+
+def _starts_with_name(date_string):
+    """Tell whether the date starts with a word (such as a day name)"""
+    prefix = date_string[:2]
+    return prefix.isascii() and prefix.isalpha()
 
 
 def _parse_date(date_string):
     """Parses a variety of date formats into a 9-tuple in GMT"""
     if not date_string:
         return None
+    return _parse_date_cached(date_string)
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_date_cached(date_string):
+    """Parse the date with the first handler that accepts it"""
+    named = _starts_with_name(date_string)
     for handler in _date_handlers:
+        if named and handler in _numeric_date_handlers:
+            continue
         try:
             date9tuple = handler(date_string)
         except (KeyError, OverflowError, ValueError, AttributeError):
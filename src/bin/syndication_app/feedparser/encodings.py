@@ -62,6 +62,15 @@ ZERO_BYTES = '\x00\x00'
 # Match the opening XML declaration.
 # Example: <?xml version="1.0" encoding="utf-8"?>
 RE_XML_DECLARATION = re.compile(r'^<\?xml[^>]*?>')
+RE_XML_DECLARATION_BYTES = re.compile(br'^<\?xml[^>]*?>')
+
+# Match an XML declaration that already declares the document to be UTF-8.
+RE_UTF8_DECLARATION = re.compile(br'''^<\?xml\s+version\s*=\s*(['"])1\.0\1\s+encoding\s*=\s*(['"])utf-?8\2\s*\?>$''', re.IGNORECASE)
+
+# Names of the encodings whose data can be used as it is (once it has been
+# checked) instead of being decoded and encoded as UTF-8 again.
+UTF8_ENCODINGS = frozenset(('utf-8', 'utf8', 'utf_8', 'u8'))
+ASCII_ENCODINGS = frozenset(('us-ascii', 'ascii', '646'))
 
 # Capture the value of the XML processing instruction's encoding attribute.
 # Example: <?xml version="1.0" encoding="utf-8"?>
@@ -92,11 +101,25 @@ def parse_content_type(line: str) -> t.Tuple[str, str]:
     return mime_type, charset_value
 
 
-def convert_to_utf8(http_headers, data, result):
+def is_ascii_compatible(data):
+    """Check whether the document's BOM (or lack of one) allows it to be
+    scanned for ASCII markup before its encoding is known.
+
+    data is the first few bytes of the document"""
+
+    if data[:4] in (codecs.BOM_UTF32_BE, codecs.BOM_UTF32_LE, EBCDIC_MARKER,
+                    UTF16BE_MARKER, UTF16LE_MARKER, UTF32BE_MARKER, UTF32LE_MARKER):
+        return False
+    return data[:2] not in (codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE)
+
+
+def convert_to_utf8(http_headers, data, result, encoding_hint=None):
     """Detect and convert the character encoding to UTF-8.
 
     http_headers is a dictionary
-    data is a raw string (not Unicode)"""
+    data is a raw string (not Unicode)
+    encoding_hint is the encoding that worked for an earlier copy of the
+    document (if any); it is tried before the encoding is detected"""
 
     # This is so much trickier than it sounds, it's not even funny.
     # According to RFC 3023 ('XML Media Types'), if the HTTP Content-Type
@@ -259,8 +282,9 @@ def convert_to_utf8(http_headers, data, result):
     # determine character encoding
     known_encoding = 0
     tried_encodings = []
-    # try: HTTP encoding, declared XML encoding, encoding sniffed from BOM
-    for proposed_encoding in (rfc3023_encoding, xml_encoding, bom_encoding,
+    # try: HTTP encoding, declared XML encoding, encoding sniffed from BOM,
+    # the encoding that worked last time
+    for proposed_encoding in (rfc3023_encoding, xml_encoding, bom_encoding, encoding_hint,
                               lazy_chardet_encoding, 'utf-8', 'windows-1252', 'iso-8859-2'):
         if callable(proposed_encoding):
             proposed_encoding = proposed_encoding(data)
@@ -269,6 +293,24 @@ def convert_to_utf8(http_headers, data, result):
         if proposed_encoding in tried_encodings:
             continue
         tried_encodings.append(proposed_encoding)
+        if proposed_encoding.lower() in UTF8_ENCODINGS or (proposed_encoding.lower() in ASCII_ENCODINGS and data.isascii()):
+            # Data that is already UTF-8 only needs to be checked; decoding
+            # it and encoding it again would give the same bytes
+            try:
+                if not data.isascii():
+                    data.decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+            known_encoding = 1
+            new_declaration = b'''<?xml version='1.0' encoding='utf-8'?>'''
+            match = RE_XML_DECLARATION_BYTES.match(data)
+            if match:
+                # Documents that already declare UTF-8 are left as they are
+                if not RE_UTF8_DECLARATION.match(match.group(0)):
+                    data = new_declaration + data[match.end():]
+            else:
+                data = new_declaration + b'\n' + data
+            break
         try:
             data = data.decode(proposed_encoding)
         except (UnicodeDecodeError, LookupError):
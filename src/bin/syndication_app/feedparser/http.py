@@ -43,6 +43,11 @@ from .urls import convert_to_idn
 # want to send an Accept header, set this to None.
 ACCEPT_HEADER = "application/atom+xml,application/rdf+xml,application/rss+xml,application/x-netcdf,application/xml;q=0.9,text/xml;q=0.2,*/*;q=0.1"
 
+# SSL context to use for HTTPS requests when none of the handlers passed in
+# handle HTTPS themselves.  If this is None, urllib creates a new default
+# context for every request.
+SSL_CONTEXT = None
+
 
 class _FeedURLHandler(urllib.request.HTTPDigestAuthHandler, urllib.request.HTTPRedirectHandler, urllib.request.HTTPDefaultErrorHandler):
     def http_error_default(self, req, fp, code, msg, headers):
@@ -121,7 +126,7 @@ def _build_urllib2_request(url, agent, accept_header, etag, modified, referrer,
     return request
 
 
-def get(url, etag=None, modified=None, agent=None, referrer=None, handlers=None, request_headers=None, result=None):
+def _open(url, etag, modified, agent, referrer, handlers, request_headers, result):
     if handlers is None:
         handlers = []
     elif not isinstance(handlers, list):
@@ -166,15 +171,47 @@ def get(url, etag=None, modified=None, agent=None, referrer=None, handlers=None,
 
     # try to open with urllib2 (to use optional headers)
     request = _build_urllib2_request(url, agent, ACCEPT_HEADER, etag, modified, referrer, auth, request_headers)
+    if SSL_CONTEXT is not None and not any(isinstance(h, urllib.request.HTTPSHandler) or h is urllib.request.HTTPSHandler for h in handlers):
+        handlers = handlers + [urllib.request.HTTPSHandler(context=SSL_CONTEXT)]
     opener = urllib.request.build_opener(*tuple(handlers + [_FeedURLHandler()]))
     opener.addheaders = []  # RMK - must clear so we only send our custom User-Agent
     f = opener.open(request)
-    data = f.read()
-    f.close()
 
     # lowercase all of the HTTP headers for comparisons per RFC 2616
     result['headers'] = {k.lower(): v for k, v in f.headers.items()}
 
+    # save HTTP headers
+    if 'etag' in result['headers']:
+        etag = result['headers'].get('etag', '')
+        if isinstance(etag, bytes):
+            etag = etag.decode('utf-8', 'ignore')
+        if etag:
+            result['etag'] = etag
+    if 'last-modified' in result['headers']:
+        modified = result['headers'].get('last-modified', '')
+        if modified:
+            result['modified'] = modified
+            result['modified_parsed'] = _parse_date(modified)
+    if isinstance(f.url, bytes):
+        result['href'] = f.url.decode('utf-8', 'ignore')
+    else:
+        result['href'] = f.url
+    result['status'] = getattr(f, 'status', None) or 200
+
+    # Stop processing if the server sent HTTP 304 Not Modified.
+    if getattr(f, 'code', 0) == 304:
+        result['version'] = ''
+        result['debug_message'] = 'The feed has not changed since you last checked, ' + \
+            'so the server sent no data.  This is a feature, not a bug!'
+
+    return f
+
+
+def get(url, etag=None, modified=None, agent=None, referrer=None, handlers=None, request_headers=None, result=None):
+    f = _open(url, etag, modified, agent, referrer, handlers, request_headers, result)
+    data = f.read()
+    f.close()
+
     # if feed is gzip-compressed, decompress it
     if data and 'gzip' in result['headers'].get('content-encoding', ''):
         try:
@@ -200,28 +237,83 @@ def get(url, etag=None, modified=None, agent=None, referrer=None, handlers=None,
                 result['bozo'] = True
                 result['bozo_exception'] = e
 
-    # save HTTP headers
-    if 'etag' in result['headers']:
-        etag = result['headers'].get('etag', '')
-        if isinstance(etag, bytes):
-            etag = etag.decode('utf-8', 'ignore')
-        if etag:
-            result['etag'] = etag
-    if 'last-modified' in result['headers']:
-        modified = result['headers'].get('last-modified', '')
-        if modified:
-            result['modified'] = modified
-            result['modified_parsed'] = _parse_date(modified)
-    if isinstance(f.url, bytes):
-        result['href'] = f.url.decode('utf-8', 'ignore')
-    else:
-        result['href'] = f.url
-    result['status'] = getattr(f, 'status', None) or 200
+    return data
 
-    # Stop processing if the server sent HTTP 304 Not Modified.
-    if getattr(f, 'code', 0) == 304:
-        result['version'] = ''
-        result['debug_message'] = 'The feed has not changed since you last checked, ' + \
-            'so the server sent no data.  This is a feature, not a bug!'
 
-    return data
+class _DecompressingReader(object):
+    """Read a response body in chunks, decompressing it as it arrives.
+
+    This does the same as the decompression in get() but without holding
+    the whole compressed and decompressed body in memory.  Errors are
+    reported in the result the same way.
+    """
+
+    def __init__(self, f, content_encoding, result):
+        self.f = f
+        self.result = result
+        self.done = False
+        self.raw_deflate_allowed = False
+        if 'gzip' in content_encoding:
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif 'deflate' in content_encoding:
+            self.decompressor = zlib.decompressobj()
+            # The data may have no headers and no checksum.
+            self.raw_deflate_allowed = True
+        else:
+            self.decompressor = None
+
+    def _fail(self, e):
+        self.result['bozo'] = True
+        self.result['bozo_exception'] = e
+        self.done = True
+
+    def _decompress(self, chunk, size):
+        try:
+            data = self.decompressor.decompress(chunk, size)
+        except zlib.error as e:
+            if not self.raw_deflate_allowed:
+                self._fail(e)
+                return b''
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            self.raw_deflate_allowed = False
+            return self._decompress(chunk, size)
+        self.raw_deflate_allowed = False
+        # gzip allows several members to be concatenated
+        if self.decompressor.eof and self.decompressor.unused_data:
+            unused_data = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data += self._decompress(unused_data, size)
+        return data
+
+    def read(self, size):
+        """Return some of the decompressed body, or b'' at the end."""
+        while not self.done:
+            if self.decompressor is not None and self.decompressor.unconsumed_tail:
+                # Limiting the output of the decompressor leaves some input for the next read
+                chunk = self.decompressor.unconsumed_tail
+            else:
+                chunk = self.f.read(size)
+                if not chunk:
+                    self.done = True
+                    if self.decompressor is not None and not self.decompressor.eof:
+                        self._fail(EOFError('Compressed file ended before the end-of-stream marker was reached'))
+                    return b''
+                if self.decompressor is None:
+                    return chunk
+            data = self._decompress(chunk, size)
+            if data:
+                return data
+        return b''
+
+    def close(self):
+        self.f.close()
+
+
+def get_stream(url, etag=None, modified=None, agent=None, referrer=None, handlers=None, request_headers=None, result=None):
+    """Open the URL and return a reader for the (decompressed) body.
+
+    Unlike get(), the body isn't read here; call read(size) on the returned
+    object until it returns b'' and then close() it.
+    """
+    f = _open(url, etag, modified, agent, referrer, handlers, request_headers, result)
+    return _DecompressingReader(f, result['headers'].get('content-encoding', ''), result)
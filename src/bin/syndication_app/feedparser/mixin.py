@@ -162,6 +162,10 @@ class _FeedParserMixin(
         'text/html',
     }
 
+    # Entry elements whose embedded markup is left as it is (neither resolved
+    # nor sanitized) because the caller processes it itself.
+    raw_html_elements = frozenset()
+
     def __init__(self):
         if not self._matchnamespaces:
             for k, v in self.namespaces.items():
@@ -537,6 +541,8 @@ class _FeedParserMixin(
             pass
 
         is_htmlish = self.map_content_type(self.contentparams.get('type', 'text/html')) in self.html_types
+        if is_htmlish and self.inentry and element in self.raw_html_elements:
+            is_htmlish = False
         # resolve relative URIs within embedded markup
         if is_htmlish and self.resolve_relative_uris:
             if element in self.can_contain_relative_uris:
@@ -0,0 +1,646 @@
+"""
+This module converts the HTML in feed entries to human readable text in a single pass. Normally,
+feedparser resolves the relative URIs in the HTML (one parse) and sanitizes it (a second parse)
+before html2text converts it to text (a third parse). The converter here does all three while
+html2text walks the HTML once.
+
+Feeds need to be parsed with the elements that will be converted listed in raw_html_elements so
+that feedparser leaves the HTML for the converter:
+
+d = feedparser.parse(url, raw_html_elements=RAW_HTML_ELEMENTS)
+text = html_to_text(d.entries[0].summary, d.entries[0].summary_detail.base)
+
+The converters are kept for each thread and are reset between documents rather than being made
+again for each piece of HTML.
+
+Note that this module expects the directory of this module to be on the path (like syndication.py
+does) so that feedparser can be imported.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import html2text
+from html2text.compat import HTMLParser
+from feedparser.sanitizer import _HTMLSanitizer, _sanitize_html
+from feedparser.urls import make_safe_absolute_uri, resolve_relative_uris
+
+# The entry elements that feedparser ought to leave the HTML of as-is for the converter
+RAW_HTML_ELEMENTS = frozenset(['content', 'summary', 'description'])
+
+# The content types that feedparser would have resolved and sanitized
+HTML_TYPES = frozenset(['text/html', 'application/xhtml+xml'])
+
+# The attributes that contain URIs that html2text outputs
+URI_ATTRIBUTES = frozenset(['href', 'src'])
+
+# The version of the conversion; this ought to be incremented when the output of the conversion
+# changes so that results that were stored by an earlier version aren't used
+CONVERSION_VERSION = 1
+
+# The ways that the HTML in entries can be processed:
+#   raw -- left as it was in the feed
+#   sanitized -- unsafe markup removed and relative URIs made absolute (feedparser's default)
+#   text -- converted to human readable text (markdown)
+#   plaintext -- reduced to the plain text (faster than text but without any formatting)
+PROCESSING_RAW = 'raw'
+PROCESSING_SANITIZED = 'sanitized'
+PROCESSING_TEXT = 'text'
+PROCESSING_PLAIN_TEXT = 'plaintext'
+
+PROCESSING_PROFILES = [PROCESSING_RAW, PROCESSING_SANITIZED, PROCESSING_TEXT, PROCESSING_PLAIN_TEXT]
+
+# The profiles that convert the HTML to text
+TEXT_PROFILES = frozenset([PROCESSING_TEXT, PROCESSING_PLAIN_TEXT])
+
+# The elements that start a new line in plain text
+BLOCK_ELEMENTS = frozenset(['address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd',
+                            'div', 'dl', 'dt', 'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3',
+                            'h4', 'h5', 'h6', 'header', 'hr', 'li', 'nav', 'ol', 'p', 'pre',
+                            'section', 'table', 'tr', 'ul'])
+
+# The elements that are separated from the text around them by a space in plain text
+CELL_ELEMENTS = frozenset(['td', 'th'])
+
+def get_processing_profile(html_processing=None, clean_html=True):
+    """
+    Get the processing profile to use, falling back to the one that matches the clean_html option
+    if a profile wasn't selected.
+
+    Arguments:
+    html_processing -- The name of the profile (may be None)
+    clean_html -- If true, HTML is to be converted to text
+    """
+
+    if html_processing:
+        return html_processing
+    elif clean_html:
+        return PROCESSING_TEXT
+    else:
+        return PROCESSING_SANITIZED
+
+def get_parse_options(html_processing):
+    """
+    Get the cheapest arguments for feedparser.parse() that produce the output for the given
+    processing profile.
+
+    Arguments:
+    html_processing -- The name of the profile
+    """
+
+    # Don't resolve or sanitize anything since the HTML is to be left as-is
+    if html_processing == PROCESSING_RAW:
+        return {'resolve_relative_uris': False, 'sanitize_html': False}
+
+    # Leave the HTML that will be converted to the converter which does everything in one pass
+    elif html_processing in TEXT_PROFILES:
+        return {'raw_html_elements': RAW_HTML_ELEMENTS}
+
+    else:
+        return {}
+
+class SanitizingHTML2Text(html2text.HTML2Text):
+    """
+    Converts HTML to text while applying the allow-list of feedparser's sanitizer and resolving
+    relative URIs in the same parse.
+    """
+
+    def __init__(self, baseurl='', bodywidth=html2text.config.BODY_WIDTH):
+        # The URIs are resolved here (using feedparser's rules) so that html2text doesn't need to
+        html2text.HTML2Text.__init__(self, baseurl='', bodywidth=bodywidth)
+
+        self.base_uri = baseurl or ''
+
+    def reset(self):
+        html2text.HTML2Text.reset(self)
+
+        self.unacceptable_depth = 0
+
+        # Text is collected until the next tag that isn't dropped so that the text on either side
+        # of a dropped tag is handled as one piece (like it would be once the tag was removed)
+        self.pending_data = []
+
+    def flush_data(self):
+        """
+        Convert the text collected since the last tag.
+        """
+
+        if self.pending_data:
+            data = ''.join(self.pending_data)
+            self.pending_data = []
+            html2text.HTML2Text.handle_data(self, data)
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in _HTMLSanitizer.acceptable_elements:
+            # Drop the content of elements like script and style, not just the tags
+            if tag in _HTMLSanitizer.unacceptable_elements_with_end_tag:
+                self.unacceptable_depth += 1
+
+            return
+
+        clean_attrs = []
+
+        for key, value in attrs:
+            if key not in _HTMLSanitizer.acceptable_attributes:
+                continue
+
+            # Make the URI absolute and drop links with schemes that aren't allowed (javascript:)
+            if key in URI_ATTRIBUTES and value is not None:
+                # Like feedparser, keep the original if it can't be resolved
+                value = make_safe_absolute_uri(self.base_uri, value.strip()) or value
+
+                if key == 'href':
+                    value = make_safe_absolute_uri(value)
+
+            clean_attrs.append((key, value))
+
+        self.flush_data()
+        html2text.HTML2Text.handle_starttag(self, tag, clean_attrs)
+
+    def handle_endtag(self, tag):
+        if tag not in _HTMLSanitizer.acceptable_elements:
+            if tag in _HTMLSanitizer.unacceptable_elements_with_end_tag and self.unacceptable_depth > 0:
+                self.unacceptable_depth -= 1
+
+            return
+
+        self.flush_data()
+        html2text.HTML2Text.handle_endtag(self, tag)
+
+    def handle_data(self, data, entity_char=False):
+        if self.unacceptable_depth > 0:
+            return
+
+        if entity_char:
+            self.flush_data()
+            html2text.HTML2Text.handle_data(self, data, entity_char)
+        else:
+            self.pending_data.append(data)
+
+    def close(self):
+        # Parse what is left and convert the text that was collected before finishing up
+        HTMLParser.HTMLParser.close(self)
+        self.flush_data()
+
+        return html2text.HTML2Text.close(self)
+
+    def handle_pi(self, data):
+        pass
+
+class PlainTextConverter(HTMLParser.HTMLParser):
+    """
+    Reduces HTML to its text: the tags are removed, the entities are decoded, the whitespace is
+    collapsed and block elements (like paragraphs) are put on lines of their own. This is much
+    less work than rendering the HTML as markdown and the text is just as good for searching.
+    """
+
+    def __init__(self):
+        HTMLParser.HTMLParser.__init__(self, convert_charrefs=True)
+
+    def reset(self):
+        HTMLParser.HTMLParser.reset(self)
+
+        self.lines = []
+        self.line = []
+        self.unacceptable_depth = 0
+        self.pre = 0
+
+    def end_line(self):
+        """
+        Finish the current line.
+        """
+
+        if self.line:
+            line = ' '.join(''.join(self.line).split())
+            self.line = []
+
+            if line:
+                self.lines.append(line)
+
+    def handle_starttag(self, tag, attrs):
+        # Drop the content of elements like script and style (like feedparser's sanitizer)
+        if tag in _HTMLSanitizer.unacceptable_elements_with_end_tag:
+            self.unacceptable_depth += 1
+
+        elif tag in BLOCK_ELEMENTS:
+            self.end_line()
+
+            if tag == 'pre':
+                self.pre += 1
+
+        elif tag in CELL_ELEMENTS:
+            self.line.append(' ')
+
+        elif tag == 'img':
+            alt = dict(attrs).get('alt', None)
+
+            if alt and self.unacceptable_depth == 0:
+                self.line.append(' %s ' % alt)
+
+    def handle_endtag(self, tag):
+        if tag in _HTMLSanitizer.unacceptable_elements_with_end_tag:
+            if self.unacceptable_depth > 0:
+                self.unacceptable_depth -= 1
+
+        elif tag in BLOCK_ELEMENTS:
+            self.end_line()
+
+            if tag == 'pre' and self.pre > 0:
+                self.pre -= 1
+
+        elif tag in CELL_ELEMENTS:
+            self.line.append(' ')
+
+    def handle_data(self, data):
+        if self.unacceptable_depth > 0:
+            return
+
+        # Keep the line breaks of preformatted text
+        if self.pre:
+            lines = data.split('\n')
+
+            for line in lines[:-1]:
+                self.line.append(line)
+                self.end_line()
+
+            data = lines[-1]
+
+        self.line.append(data)
+
+    def convert(self, html):
+        """
+        Get the plain text of the HTML.
+
+        Arguments:
+        html -- The HTML to convert
+        """
+
+        self.feed(html)
+        self.close()
+        self.end_line()
+
+        return '\n'.join(self.lines)
+
+# The converters that were made by each thread
+_thread_converters = threading.local()
+
+def get_thread_converters():
+    """
+    Get the dictionary of the converters that belong to the calling thread.
+    """
+
+    converters = getattr(_thread_converters, 'converters', None)
+
+    if converters is None:
+        converters = {}
+        _thread_converters.converters = converters
+
+    return converters
+
+def get_converter(base_uri='', bodywidth=None, sanitize=True):
+    """
+    Get a converter that is ready to convert a document. The converter belongs to the calling
+    thread and is re-used by the next call from the same thread so it must not be kept.
+
+    Arguments:
+    base_uri -- The URI that relative URIs in the HTML are relative to
+    bodywidth -- The width to wrap the text at (uses html2text's default if None)
+    sanitize -- If true, the converter sanitizes the HTML and resolves relative URIs
+    """
+
+    if bodywidth is None:
+        bodywidth = html2text.config.BODY_WIDTH
+
+    converters = get_thread_converters()
+    converter = converters.get((sanitize, bodywidth), None)
+
+    if converter is None:
+        if sanitize:
+            converter = SanitizingHTML2Text(bodywidth=bodywidth)
+        else:
+            converter = html2text.HTML2Text(bodywidth=bodywidth)
+
+        converters[(sanitize, bodywidth)] = converter
+    else:
+        # Clear whatever is left from the last document (even if converting it failed)
+        converter.reset()
+
+    if sanitize:
+        converter.base_uri = base_uri or ''
+    else:
+        converter.baseurl = base_uri or ''
+
+    return converter
+
+def html_to_text(html, base_uri='', bodywidth=None, sanitize=True):
+    """
+    Convert the (unprocessed) HTML from a feed to text.
+
+    Arguments:
+    html -- The HTML to convert
+    base_uri -- The URI that relative URIs in the HTML are relative to
+    bodywidth -- The width to wrap the text at (uses html2text's default if None)
+    sanitize -- If false, the HTML is converted as-is (like html2text.html2text() does)
+    """
+
+    converter = get_converter(base_uri, bodywidth, sanitize)
+
+    # Same as feedparser does to the sanitized HTML
+    if sanitize:
+        html = html.strip().replace('\r\n', '\n')
+
+    return converter.handle(html)
+
+def has_markup(html):
+    """
+    Determine if the HTML has any tags or entities.
+
+    Arguments:
+    html -- The HTML to check
+    """
+
+    return '<' in html or '&' in html
+
+def html_to_plain_text(html):
+    """
+    Reduce the (unprocessed) HTML from a feed to plain text (see PlainTextConverter).
+
+    Arguments:
+    html -- The HTML to convert
+    """
+
+    # Skip parsing if there is no markup (only the whitespace needs to be collapsed)
+    if not has_markup(html):
+        return ' '.join(html.split())
+
+    converters = get_thread_converters()
+    converter = converters.get('plain', None)
+
+    if converter is None:
+        converter = PlainTextConverter()
+        converters['plain'] = converter
+    else:
+        converter.reset()
+
+    return converter.convert(html)
+
+def process_html(html, base_uri='', content_type='text/html'):
+    """
+    Resolve the relative URIs in and sanitize HTML the way that feedparser would have. This is
+    for HTML that was left raw by feedparser but isn't going to be converted to text.
+
+    Arguments:
+    html -- The HTML to process
+    base_uri -- The URI that relative URIs in the HTML are relative to
+    content_type -- The content type of the HTML
+    """
+
+    html = resolve_relative_uris(html, base_uri or '', 'utf-8', content_type)
+    return _sanitize_html(html, 'utf-8', content_type)
+
+def convert_key(key):
+    """
+    Do the conversion described by a key of the ConversionCache.
+
+    Arguments:
+    key -- A tuple of the kind of conversion followed by its arguments
+    """
+
+    kind = key[0]
+
+    if kind == 'text':
+        return html_to_text(key[1], key[2], None, key[3])
+    elif kind == 'plain':
+        return html_to_plain_text(key[1])
+    else:
+        return process_html(key[1], key[2], key[3])
+
+def convert_batch(keys):
+    """
+    Do the conversions described by a list of keys of the ConversionCache (this is what the worker
+    processes of the ConversionPool run).
+
+    Arguments:
+    keys -- The keys of the conversions to do
+    """
+
+    return [convert_key(key) for key in keys]
+
+class ConversionCache(object):
+    """
+    Converts each distinct piece of HTML once and shares the result with the other fields that
+    have the same HTML (feedparser sets the summary and summary_detail to the same string, and the
+    content of RSS items often repeats it too). The cache ought to be cleared after each entry so
+    that the HTML of the entries that were already processed isn't kept.
+
+    Results that aren't in the cache are looked up in the store (a ConversionStore) if one is
+    provided so that the HTML that was converted on an earlier poll isn't converted again.
+
+    The conversions for a batch of entries can be done ahead of time (see ConversionPool) by
+    recording the conversions that the entries need (see start_recording()) and then providing
+    the results in prefetched.
+    """
+
+    def __init__(self, store=None):
+        self.results = {}
+        self.store = store
+
+        # The results that were converted ahead of time
+        self.prefetched = {}
+
+        # The conversions that are needed (while recording)
+        self.recorded = None
+
+        # The number of conversions that were done, re-used from this cache and loaded from the store
+        self.misses = 0
+        self.hits = 0
+        self.stored_hits = 0
+
+    def get_store_key(self, key):
+        """
+        Get the key of the result in the store.
+        """
+
+        return self.store.make_key(key + (CONVERSION_VERSION, html2text.config.BODY_WIDTH))
+
+    def get(self, key):
+        """
+        Get the result for the key, doing the conversion if needed. While recording, the
+        conversion is recorded and the HTML is returned unchanged.
+
+        Arguments:
+        key -- A tuple of the kind of conversion followed by its arguments (see convert_key())
+        """
+
+        if self.recorded is not None:
+            if key not in self.results and (self.store is None or self.store.get(self.get_store_key(key)) is None):
+                self.recorded[key] = True
+
+            return key[1]
+
+        try:
+            result = self.results[key]
+            self.hits += 1
+            return result
+        except KeyError:
+            pass
+
+        result = None
+
+        if self.store is not None:
+            store_key = self.get_store_key(key)
+            result = self.store.get(store_key)
+
+        if result is not None:
+            self.stored_hits += 1
+        else:
+            result = self.prefetched.get(key, None)
+
+            if result is None:
+                result = convert_key(key)
+
+            self.misses += 1
+
+            if self.store is not None:
+                self.store.put(store_key, result)
+
+        self.results[key] = result
+
+        return result
+
+    def start_recording(self):
+        """
+        Start recording the conversions that are needed instead of doing them.
+        """
+
+        self.recorded = {}
+
+    def stop_recording(self):
+        """
+        Stop recording and return the keys of the conversions that are needed (in the order they
+        were first needed).
+        """
+
+        keys = list(self.recorded.keys())
+        self.recorded = None
+
+        return keys
+
+    def html_to_text(self, html, base_uri='', sanitize=True):
+        """
+        Convert the HTML to text (see html_to_text()).
+
+        Arguments:
+        html -- The HTML to convert
+        base_uri -- The URI that relative URIs in the HTML are relative to
+        sanitize -- If false, the HTML is converted as-is
+        """
+
+        return self.get(('text', html, base_uri or '', sanitize))
+
+    def html_to_plain_text(self, html):
+        """
+        Reduce the HTML to plain text (see html_to_plain_text()).
+
+        Arguments:
+        html -- The HTML to convert
+        """
+
+        # Text without markup is cheaper to convert than to look up
+        if not has_markup(html):
+            return html if self.recorded is not None else html_to_plain_text(html)
+
+        return self.get(('plain', html))
+
+    def process_html(self, html, base_uri='', content_type='text/html'):
+        """
+        Resolve the relative URIs in and sanitize the HTML (see process_html()).
+
+        Arguments:
+        html -- The HTML to process
+        base_uri -- The URI that relative URIs in the HTML are relative to
+        content_type -- The content type of the HTML
+        """
+
+        return self.get(('html', html, base_uri or '', content_type))
+
+    def clear(self):
+        """
+        Forget the results (the counts are kept).
+        """
+
+        self.results = {}
+
+    def commit(self):
+        """
+        Write the new results to the store (if there is one).
+        """
+
+        if self.store is not None:
+            self.store.commit()
+
+class ConversionPool(object):
+    """
+    Converts batches of HTML in worker processes so that the conversions for a large feed can be
+    spread across the CPUs. The processes are started when they are first needed.
+    """
+
+    # The default for the number of entries that are converted at a time
+    DEFAULT_BATCH_SIZE = 50
+
+    def __init__(self, workers, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Set up the pool.
+
+        Arguments:
+        workers -- The number of worker processes
+        batch_size -- The number of entries to convert at a time; feeds with fewer entries are
+                      converted inline since sending them to the processes costs more than it saves
+        """
+
+        self.workers = workers
+        self.batch_size = batch_size
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        """
+        Get the executor that runs the worker processes, starting it if necessary.
+        """
+
+        with self.lock:
+            if self.executor is None:
+                # The processes are spawned rather than forked since the input runs several threads
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+            return self.executor
+
+    def convert(self, keys):
+        """
+        Do the conversions in the worker processes and return a dictionary of the results.
+
+        Arguments:
+        keys -- The keys of the conversions (see convert_key())
+        """
+
+        # Give each worker an equal share of the conversions
+        chunk_size = max((len(keys) + self.workers - 1) // self.workers, 1)
+        chunks = [keys[index:index + chunk_size] for index in range(0, len(keys), chunk_size)]
+
+        results = {}
+
+        for chunk, chunk_results in zip(chunks, self.get_executor().map(convert_batch, chunks)):
+            results.update(zip(chunk, chunk_results))
+
+        return results
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
@@ -0,0 +1,436 @@
+"""
+This module provides the urllib handlers that are used for retrieving feeds. They can be passed to
+feedparser (via the handlers argument) so that the connections it makes have timeouts and are kept
+alive in a pool so that later requests to the same host don't need to connect again. HTTPS
+connections share one SSL context per CA bundle and resume earlier TLS sessions where the server
+allows it so that the full handshake isn't repeated on every poll.
+
+Here is a sample of using the handlers with feedparser:
+
+from http_client import get_handlers
+
+d = feedparser.parse(url, handlers=get_handlers(connect_timeout=30, read_timeout=60))
+"""
+
+import http.client
+import ssl
+import threading
+import time
+import urllib.request
+from urllib.error import URLError
+
+class TimeoutHTTPConnection(http.client.HTTPConnection):
+    """
+    A HTTP connection that uses one timeout for connecting and another for reading the response.
+    """
+
+    def __init__(self, host, connect_timeout=None, read_timeout=None, **kwargs):
+        http.client.HTTPConnection.__init__(self, host, **kwargs)
+
+        if connect_timeout is not None:
+            self.timeout = connect_timeout
+
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+
+        if self.read_timeout is not None:
+            self.sock.settimeout(self.read_timeout)
+
+    def set_read_timeout(self, read_timeout):
+        """
+        Change the read timeout (used when a connection is re-used for another request).
+        """
+
+        self.read_timeout = read_timeout
+
+        if self.sock is not None and read_timeout is not None:
+            self.sock.settimeout(read_timeout)
+
+# The SSL contexts (one per CA bundle) that are shared by everything in this process
+SSL_CONTEXTS = {}
+SSL_CONTEXTS_LOCK = threading.Lock()
+
+def get_ssl_context(ca_bundle=None):
+    """
+    Get the SSL context to use for HTTPS connections. The context (and the CA bundle it loads) is
+    created once and then shared.
+
+    Arguments:
+    ca_bundle -- The path to a file of CA certificates (uses the system's certificates if None)
+    """
+
+    with SSL_CONTEXTS_LOCK:
+        context = SSL_CONTEXTS.get(ca_bundle, None)
+
+        if context is None:
+            context = ssl.create_default_context(cafile=ca_bundle)
+
+            # Same as the defaults that http.client uses for the contexts it makes
+            context.set_alpn_protocols(['http/1.1'])
+
+            if context.post_handshake_auth is not None:
+                context.post_handshake_auth = True
+
+            SSL_CONTEXTS[ca_bundle] = context
+
+        return context
+
+class TLSSessionCache(object):
+    """
+    Keeps the last TLS session for each host so that new connections can resume it instead of
+    doing a full handshake.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get the session for the given key (or None if there isn't one).
+
+        Arguments:
+        key -- The key identifying the context and host the session belongs to
+        """
+
+        with self.lock:
+            return self.sessions.get(key, None)
+
+    def put(self, key, session):
+        """
+        Remember the session for the given key.
+
+        Arguments:
+        key -- The key identifying the context and host the session belongs to
+        session -- The ssl.SSLSession to keep
+        """
+
+        with self.lock:
+            self.sessions[key] = session
+
+    def clear(self):
+        """
+        Forget all of the sessions.
+        """
+
+        with self.lock:
+            self.sessions = {}
+
+# This is the TLS session cache that is shared by everything in this process
+TLS_SESSIONS = TLSSessionCache()
+
+class TimeoutHTTPSConnection(http.client.HTTPSConnection):
+    """
+    A HTTPS connection that uses one timeout for connecting (including the TLS handshake) and
+    another for reading the response. The TLS session is resumed from the last connection to the
+    same host if possible.
+    """
+
+    def __init__(self, host, connect_timeout=None, read_timeout=None, **kwargs):
+        http.client.HTTPSConnection.__init__(self, host, **kwargs)
+
+        if connect_timeout is not None:
+            self.timeout = connect_timeout
+
+        self.read_timeout = read_timeout
+
+    def get_session_key(self):
+        """
+        Get the key that identifies the TLS sessions that this connection can resume. Sessions can
+        only be used with the context that created them.
+        """
+
+        return (self._context, self._tunnel_host or self.host, self.port)
+
+    def connect(self):
+        # Same as HTTPSConnection.connect() but with the session to resume
+        http.client.HTTPConnection.connect(self)
+
+        server_hostname = self._tunnel_host or self.host
+
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname,
+                                              session=TLS_SESSIONS.get(self.get_session_key()))
+
+        self.remember_session()
+
+        if self.read_timeout is not None:
+            self.sock.settimeout(self.read_timeout)
+
+    def remember_session(self):
+        """
+        Store the TLS session so that later connections can resume it. TLS 1.3 servers send the
+        session ticket after the handshake so this ought to be called again once a response was
+        read.
+        """
+
+        session = getattr(self.sock, 'session', None)
+
+        if session is not None:
+            TLS_SESSIONS.put(self.get_session_key(), session)
+
+    def close(self):
+        try:
+            self.remember_session()
+        except (OSError, ValueError):
+            pass
+
+        http.client.HTTPSConnection.close(self)
+
+    def set_read_timeout(self, read_timeout):
+        """
+        Change the read timeout (used when a connection is re-used for another request).
+        """
+
+        self.read_timeout = read_timeout
+
+        if self.sock is not None and read_timeout is not None:
+            self.sock.settimeout(read_timeout)
+
+class PooledHTTPResponse(http.client.HTTPResponse):
+    """
+    A HTTP response that returns its connection to the pool once it has been read and closed.
+    """
+
+    release_callback = None
+
+    def close(self):
+        # The response was completely read if the underlying file was already closed
+        fully_read = self.fp is None
+
+        http.client.HTTPResponse.close(self)
+
+        release_callback = self.release_callback
+        self.release_callback = None
+
+        if release_callback is not None:
+            release_callback(fully_read and not self.will_close)
+
+class ConnectionPool(object):
+    """
+    Keeps idle HTTP connections so that they can be re-used for later requests to the same host.
+    """
+
+    # The defaults for how many idle connections to keep and for how long
+    DEFAULT_MAX_IDLE_PER_HOST = 2
+    DEFAULT_IDLE_TIMEOUT = 30
+
+    def __init__(self, max_idle_per_host=DEFAULT_MAX_IDLE_PER_HOST, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """
+        Set up the connection pool.
+
+        Arguments:
+        max_idle_per_host -- The maximum number of idle connections to keep for each host
+        idle_timeout -- The number of seconds that an idle connection is kept before it is closed
+        """
+
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.idle_connections = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get an idle connection for the given key (or None if there isn't one).
+
+        Arguments:
+        key -- The key identifying the host the connection goes to
+        """
+
+        with self.lock:
+            connections = self.idle_connections.get(key, [])
+
+            while connections:
+                connection, last_used = connections.pop()
+
+                if (time.time() - last_used) <= self.idle_timeout:
+                    return connection
+
+                connection.close()
+
+        return None
+
+    def put(self, key, connection):
+        """
+        Return a connection to the pool so that it can be re-used.
+
+        Arguments:
+        key -- The key identifying the host the connection goes to
+        connection -- The connection to keep
+        """
+
+        with self.lock:
+            connections = self.idle_connections.setdefault(key, [])
+
+            if len(connections) < self.max_idle_per_host:
+                connections.append((connection, time.time()))
+                return
+
+        connection.close()
+
+    def evict_idle(self):
+        """
+        Close the connections that have been idle for longer than the idle timeout.
+        """
+
+        with self.lock:
+            for key, connections in list(self.idle_connections.items()):
+                for connection, last_used in connections:
+                    if (time.time() - last_used) > self.idle_timeout:
+                        connection.close()
+
+                connections[:] = [(connection, last_used) for connection, last_used in connections if connection.sock is not None]
+
+                if not connections:
+                    del self.idle_connections[key]
+
+    def close(self):
+        """
+        Close all of the idle connections.
+        """
+
+        with self.lock:
+            for connections in self.idle_connections.values():
+                for connection, _ in connections:
+                    connection.close()
+
+            self.idle_connections = {}
+
+# This is the pool that is shared by everything in this process that retrieves feeds
+CONNECTION_POOL = ConnectionPool()
+
+class PooledHandlerMixin(object):
+    """
+    Opens requests using connections from a connection pool instead of a new connection for each
+    request. This replaces AbstractHTTPHandler.do_open() which always closes the connection.
+    """
+
+    def do_pooled_open(self, connection_class, req, **connection_args):
+        host = req.host
+
+        if not host:
+            raise URLError('no host given')
+
+        key = (req.type, host, req._tunnel_host, connection_class, connection_args.get('context', None))
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+
+        # Proxy-Authorization should not be sent to origin server
+        tunnel_headers = {}
+
+        if req._tunnel_host and "Proxy-Authorization" in headers:
+            tunnel_headers["Proxy-Authorization"] = headers.pop("Proxy-Authorization")
+
+        connection = self.pool.get(key)
+
+        # Retry once with a new connection if the server closed the idle one
+        while True:
+            reused = connection is not None
+
+            if connection is None:
+                connection = connection_class(host, connect_timeout=self.connect_timeout, read_timeout=self.read_timeout, **connection_args)
+                connection.response_class = PooledHTTPResponse
+                connection.set_debuglevel(self._debuglevel)
+
+                if req._tunnel_host:
+                    connection.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+
+            else:
+                connection.set_read_timeout(self.read_timeout)
+
+            try:
+                try:
+                    connection.request(req.get_method(), req.selector, req.data, headers,
+                                       encode_chunked=req.has_header('Transfer-encoding'))
+                except OSError as err:
+                    if reused:
+                        raise
+
+                    raise URLError(err)
+
+                response = connection.getresponse()
+                break
+
+            except (ConnectionError, http.client.BadStatusLine):
+                connection.close()
+
+                if not reused:
+                    raise
+
+                connection = None
+
+            except:
+                connection.close()
+                raise
+
+        response.release_callback = lambda reusable: self.release(key, connection, reusable)
+        response.url = req.get_full_url()
+        response.msg = response.reason
+
+        return response
+
+    def release(self, key, connection, reusable):
+        """
+        Return the connection to the pool if it can be re-used.
+        """
+
+        remember_session = getattr(connection, 'remember_session', None)
+
+        if remember_session is not None and connection.sock is not None:
+            remember_session()
+
+        if reusable:
+            self.pool.put(key, connection)
+        else:
+            connection.close()
+
+class PooledHTTPHandler(PooledHandlerMixin, urllib.request.HTTPHandler):
+    """
+    A urllib handler that makes HTTP requests over pooled connections with the given timeouts.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, pool=None, debuglevel=0):
+        urllib.request.HTTPHandler.__init__(self, debuglevel)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool = pool if pool is not None else CONNECTION_POOL
+
+    def http_open(self, req):
+        return self.do_pooled_open(TimeoutHTTPConnection, req)
+
+class PooledHTTPSHandler(PooledHandlerMixin, urllib.request.HTTPSHandler):
+    """
+    A urllib handler that makes HTTPS requests over pooled connections with the given timeouts.
+    The shared SSL context is used unless another one is provided.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, pool=None, debuglevel=0, context=None):
+        if context is None:
+            context = get_ssl_context()
+
+        urllib.request.HTTPSHandler.__init__(self, debuglevel, context)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool = pool if pool is not None else CONNECTION_POOL
+
+    def https_open(self, req):
+        return self.do_pooled_open(TimeoutHTTPSConnection, req, context=self._context)
+
+def get_handlers(connect_timeout=None, read_timeout=None, pool=None, ca_bundle=None):
+    """
+    Get the list of urllib handlers to use for retrieving feeds.
+
+    Arguments:
+    connect_timeout -- The number of seconds to wait for a connection to be established
+    read_timeout -- The number of seconds to wait for data from the server once connected
+    pool -- The connection pool to use (defaults to the pool shared by the process)
+    ca_bundle -- The path to a file of CA certificates for verifying HTTPS servers
+    """
+
+    return [
+        PooledHTTPHandler(connect_timeout, read_timeout, pool),
+        PooledHTTPSHandler(connect_timeout, read_timeout, pool, context=get_ssl_context(ca_bundle))
+    ]
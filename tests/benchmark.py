@@ -0,0 +1,487 @@
+"""
+Benchmarks for the syndication input.
+
+Run this from the tests directory:
+
+python benchmark.py [iterations]
+"""
+
+import sys
+import os
+import time
+import glob
+import tempfile
+import shutil
+import io
+from collections import OrderedDict
+
+sys.path.append( os.path.join("..", "src", "bin") )
+
+from syndication import SyndicationModularInput
+import html2text
+import feedparser
+from feedparser import datetimes
+from feedparser.encodings import convert_to_utf8
+from syndication_app import html_converter
+from syndication_app.conversion_store import ConversionStore
+from syndication_app.event_writer import StashNewWriter
+from syndication_app import event_writer
+
+# Dates in the formats that feeds use (RFC 822 and W3DTF mostly, with some of the others that
+# feedparser understands)
+DATE_STRINGS = [
+    'Sat, 07 Oct 2023 12:34:56 GMT',
+    'Mon, 2 Jan 2006 15:04:05 -0700',
+    'Tue, 10 Jun 2003 04:00:00 EST',
+    'Thu, 01 Jan 2004 19:48:21 GMT',
+    'Wed, 17 Dec 2003 12:00:00 +0000',
+    'Sat, 07 Oct 23 12:34 GMT',
+    'Fri, 14 Mar 2014 09:26:53 PDT',
+    '14 Mar 2014 09:26:53 +0100',
+    '2023-10-07T12:34:56Z',
+    '2023-10-07T12:34:56+02:00',
+    '2023-10-07T12:34:56.123456Z',
+    '2003-12-31T10:14:55-08:00',
+    '2004-02-28 18:14:55-08:00',
+    '2004-07-08 23:56:58',
+    '2023-10-07',
+    '20231007T123456Z',
+    'Sun Jan  4 16:29:06 PST 2004',
+    'Fri, 2006/09/15 08:19:53 EDT',
+]
+
+WEB_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web_files")
+
+def get_fixtures():
+    """
+    Get the paths of the feeds to benchmark against.
+    """
+
+    return sorted(glob.glob(os.path.join(WEB_FILES, "*.xml")))
+
+def time_per_entry(function, fixtures, iterations):
+    """
+    Run the function against each of the fixtures and return the average time per entry (in
+    microseconds) along with the entries from the last run.
+
+    Arguments:
+    function -- A function that takes the path of a feed and returns the list of entries
+    fixtures -- The paths of the feeds
+    iterations -- The number of times to run the function against each feed
+    """
+
+    entries = {}
+    entry_count = 0
+    started = time.perf_counter()
+
+    for _ in range(iterations):
+        for fixture in fixtures:
+            entries[fixture] = function(fixture)
+            entry_count += len(entries[fixture])
+
+    return (time.perf_counter() - started) * 1000000 / max(entry_count, 1), entries
+
+def get_feed_with_profile(html_processing):
+    """
+    Make a function that gets a feed using the given HTML processing profile.
+
+    Arguments:
+    html_processing -- The name of the profile
+    """
+
+    return lambda fixture: SyndicationModularInput.get_feed(fixture, html_processing=html_processing)
+
+def get_feed_sanitized_then_converted(fixture):
+    """
+    Get a feed by having feedparser resolve and sanitize the HTML and then converting the result
+    to text (which is how HTML was converted before the text profile processed it in one pass).
+    """
+
+    entries = []
+
+    for entry in SyndicationModularInput.get_feed(fixture, html_processing=html_converter.PROCESSING_SANITIZED):
+        for name, type_name in (('content.0.value', 'content.0.type'), ('summary', None), ('summary_detail.value', 'summary_detail.type')):
+            if entry.get(name, None) and (type_name is None or entry.get(type_name, 'text/html') == 'text/html'):
+                entry[name] = html2text.html2text(entry[name])
+
+        entries.append(entry)
+
+    return entries
+
+def benchmark_html_processing(iterations):
+    """
+    Compare the time per entry of each of the HTML processing profiles.
+    """
+
+    fixtures = get_fixtures()
+
+    print("HTML processing profiles (%i feeds, %i iterations)" % (len(fixtures), iterations))
+
+    baseline, baseline_entries = time_per_entry(get_feed_sanitized_then_converted, fixtures, iterations)
+    print("  %-30s %10.1f us/entry" % ("sanitized, then converted", baseline))
+
+    for html_processing in html_converter.PROCESSING_PROFILES:
+        elapsed, entries = time_per_entry(get_feed_with_profile(html_processing), fixtures, iterations)
+
+        if html_processing == html_converter.PROCESSING_TEXT:
+            same_output = "same text" if entries == baseline_entries else "DIFFERENT TEXT"
+        else:
+            same_output = ""
+
+        print("  %-30s %10.1f us/entry %+6.1f%% %s" % (html_processing, elapsed, (elapsed - baseline) * 100 / baseline, same_output))
+
+def benchmark_conversion_store(iterations):
+    """
+    Compare the time per entry of converting the entries on every poll with re-polling the same
+    feeds using the conversion store.
+    """
+
+    fixtures = get_fixtures()
+    tmp_dir = tempfile.mkdtemp(prefix="benchmark")
+
+    print("Conversion store (%i feeds, %i iterations)" % (len(fixtures), iterations))
+
+    try:
+        store = ConversionStore(os.path.join(tmp_dir, ConversionStore.FILE_NAME))
+
+        uncached, uncached_entries = time_per_entry(get_feed_with_profile(html_converter.PROCESSING_TEXT), fixtures, iterations)
+        print("  %-30s %10.1f us/entry" % ("without the store", uncached))
+
+        # Fill the store with the first poll
+        for fixture in fixtures:
+            SyndicationModularInput.get_feed(fixture, html_processing=html_converter.PROCESSING_TEXT, conversion_store=store)
+
+        cached, cached_entries = time_per_entry(lambda fixture: SyndicationModularInput.get_feed(fixture, html_processing=html_converter.PROCESSING_TEXT, conversion_store=store), fixtures, iterations)
+        same_output = "same text" if cached_entries == uncached_entries else "DIFFERENT TEXT"
+        print("  %-30s %10.1f us/entry %+6.1f%% %s" % ("re-polled with the store", cached, (cached - uncached) * 100 / uncached, same_output))
+
+        store.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def benchmark_html2text_scaling(iterations):
+    """
+    Time converting longer and longer documents to show that the time per paragraph stays the
+    same (the conversion is linear in the length of the document).
+    """
+
+    paragraph = '<p>Fixed a bug in the <a href="http://example.com/parser">parser</a> where&nbsp;long lines with <b>bold</b> text and <code>code</code> were wrapped badly.</p>\n'
+
+    print("html2text scaling (%i iterations)" % iterations)
+
+    for paragraphs in (1000, 4000, 16000):
+        html = paragraph * paragraphs
+        started = time.perf_counter()
+
+        for _ in range(max(iterations // 10, 1)):
+            html2text.html2text(html)
+
+        elapsed = (time.perf_counter() - started) * 1000000 / (max(iterations // 10, 1) * paragraphs)
+        print("  %-30s %10.1f us/paragraph" % ("%i paragraphs" % paragraphs, elapsed))
+
+def benchmark_parser_choice(iterations):
+    """
+    Compare parsing malformed feeds by trying the strict parser first (what happens when the
+    parser that works isn't known) with going straight to the loose parser.
+    """
+
+    # Break the fixtures near the end (the strict parser gets the furthest before failing)
+    documents = []
+
+    for fixture in get_fixtures():
+        with open(fixture, 'rb') as f:
+            data = f.read()
+
+        index = data.rindex(b'</title>')
+        documents.append(data[:index] + b' & ' + data[index:])
+
+    print("Parser choice for malformed feeds (%i feeds, %i iterations)" % (len(documents), iterations))
+
+    strict_first, strict_first_entries = time_per_entry(lambda data: feedparser.parse(data).entries, documents, iterations)
+    print("  %-30s %10.1f us/entry" % ("strict parser first", strict_first))
+
+    loose, loose_entries = time_per_entry(lambda data: feedparser.parse(data, parser='loose').entries, documents, iterations)
+    same_output = "same entries" if loose_entries == strict_first_entries else "DIFFERENT ENTRIES"
+    print("  %-30s %10.1f us/entry %+6.1f%% %s" % ("loose parser", loose, (loose - strict_first) * 100 / strict_first, same_output))
+
+def time_per_document(function, documents, iterations):
+    """
+    Run the function against each of the documents and return the average time per document (in
+    microseconds).
+
+    Arguments:
+    function -- A function that takes a document
+    documents -- The documents
+    iterations -- The number of times to run the function against each document
+    """
+
+    started = time.perf_counter()
+
+    for _ in range(iterations):
+        for document in documents:
+            function(document)
+
+    return (time.perf_counter() - started) * 1000000 / max(len(documents) * iterations, 1)
+
+def benchmark_encoding(iterations):
+    """
+    Compare converting feeds to UTF-8 with and without the encoding that worked last time (for
+    feeds that declare the wrong encoding) and with decoding and encoding UTF-8 feeds again.
+    """
+
+    # Make the documents long enough for the conversion to matter; the misdeclared ones have
+    # windows-1252 text near the end (so that decoding them as UTF-8 gets the furthest before failing)
+    documents = []
+    misdeclared = []
+
+    for fixture in get_fixtures():
+        with open(fixture, 'rb') as f:
+            data = f.read()
+
+        header, body = data.split(b'?>', 1)
+        data = header + b'?>' + body * 20
+        index = data.rindex(b'</title>')
+
+        documents.append(data[:index] + u' caf\xe9'.encode('utf-8') + data[index:])
+        misdeclared.append(data[:index] + u' caf\xe9'.encode('windows-1252') + data[index:])
+
+    print("Conversion to UTF-8 (%i feeds, %i iterations)" % (len(documents), iterations))
+
+    round_trip = time_per_document(lambda data: data.decode('utf-8').encode('utf-8'), documents, iterations)
+    print("  %-30s %10.1f us/feed" % ("UTF-8, decoded and encoded", round_trip))
+
+    passed_through = time_per_document(lambda data: convert_to_utf8({}, data, {}), documents, iterations)
+    print("  %-30s %10.1f us/feed %+6.1f%%" % ("UTF-8, checked", passed_through, (passed_through - round_trip) * 100 / round_trip))
+
+    hints = [feedparser.parse(data).encoding for data in misdeclared]
+
+    detected = time_per_document(lambda data: convert_to_utf8({}, data, {}), misdeclared, iterations)
+    print("  %-30s %10.1f us/feed" % ("misdeclared, detected", detected))
+
+    hinted = time_per_document(lambda index: convert_to_utf8({}, misdeclared[index], {}, hints[index]), range(len(misdeclared)), iterations)
+    print("  %-30s %10.1f us/feed %+6.1f%%" % ("misdeclared, encoding hint", hinted, (hinted - detected) * 100 / detected))
+
+def parse_date_with_each_handler(date_string):
+    """
+    Parse a date by trying each of feedparser's date handlers in order (which is how dates were
+    parsed before they were sorted by format and remembered).
+    """
+
+    for handler in datetimes._date_handlers:
+        try:
+            date9tuple = handler(date_string)
+        except (KeyError, OverflowError, ValueError, AttributeError):
+            continue
+
+        if date9tuple and len(date9tuple) == 9:
+            return date9tuple
+
+def benchmark_date_parsing(iterations):
+    """
+    Compare parsing dates by trying each handler in order with skipping the handlers that can't
+    parse the format and with remembering the dates that were already parsed (as when a feed is
+    polled again).
+    """
+
+    # Every date appears in a few entries of a feed
+    date_strings = DATE_STRINGS * 10
+
+    print("Date parsing (%i dates, %i iterations)" % (len(date_strings), iterations))
+
+    each_handler = time_per_document(parse_date_with_each_handler, date_strings, iterations)
+    print("  %-30s %10.1f us/date" % ("each handler in order", each_handler))
+
+    by_format = time_per_document(datetimes._parse_date_cached.__wrapped__, date_strings, iterations)
+    print("  %-30s %10.1f us/date %+6.1f%%" % ("handlers for the format", by_format, (by_format - each_handler) * 100 / each_handler))
+
+    datetimes._parse_date_cached.cache_clear()
+    remembered = time_per_document(datetimes._parse_date, date_strings, iterations)
+    same_output = "same dates" if [datetimes._parse_date(date) for date in date_strings] == [parse_date_with_each_handler(date) for date in date_strings] else "DIFFERENT DATES"
+    print("  %-30s %10.1f us/date %+6.1f%% %s" % ("remembered", remembered, (remembered - each_handler) * 100 / each_handler, same_output))
+
+def flatten_recursively(item, dictionary=None, name=None, sort=False):
+    """
+    Flatten an entry the way SyndicationModularInput.flatten() did before it was made iterative.
+    """
+
+    if dictionary is None:
+        dictionary = {}
+
+    if name is None:
+        name = ""
+
+    iterative_name = name
+
+    if len(iterative_name) > 0:
+        iterative_name = name + "."
+
+    if isinstance(item, dict):
+        for key in item:
+            flatten_recursively(item[key], dictionary, iterative_name + key)
+
+    elif item.__class__.__name__ == "struct_time":
+        dictionary[name] = time.strftime('%Y-%m-%dT%H:%M:%SZ', item)
+
+    elif not isinstance(item, str) and isinstance(item, (list, tuple)):
+        index = 0
+
+        for entry in item:
+            flatten_recursively(entry, dictionary, iterative_name + str(index))
+            index = index + 1
+
+    elif item in [True, False, None]:
+        dictionary[name] = item
+
+    else:
+        dictionary[name] = str(item)
+
+    if sort:
+        dictionary = OrderedDict(sorted(dictionary.items(), key=lambda x: x[0]))
+
+    return dictionary
+
+def benchmark_flatten(iterations):
+    """
+    Compare flattening the entries of the test feeds recursively with flattening them iteratively.
+    """
+
+    entries = []
+
+    for fixture in get_fixtures():
+        entries.extend(feedparser.parse(fixture).entries)
+
+    print("Flattening entries (%i entries, %i iterations)" % (len(entries), iterations))
+
+    recursive = time_per_document(lambda entry: flatten_recursively(entry, sort=True), entries, iterations * 10)
+    print("  %-30s %10.1f us/entry" % ("recursive", recursive))
+
+    iterative = time_per_document(lambda entry: SyndicationModularInput.flatten(entry, sort=True), entries, iterations * 10)
+    same_output = "same fields" if [SyndicationModularInput.flatten(entry, sort=True) for entry in entries] == [flatten_recursively(entry, sort=True) for entry in entries] else "DIFFERENT FIELDS"
+    print("  %-30s %10.1f us/entry %+6.1f%% %s" % ("iterative", iterative, (iterative - recursive) * 100 / recursive, same_output))
+
+def event_to_string_concatenated(writer, result):
+    """
+    Serialize an event the way EventWriter.event_to_string() did before it collected the fields in
+    a list (by adding each field to the end of the event).
+    """
+
+    event = time.strftime("%m/%d/%Y %H:%M:%S UTC", time.gmtime(result['_time']))
+
+    basic_fields = writer.get_basic_fields(result)
+    basic_fields["_time"] = result['_time']
+
+    for key in basic_fields:
+        event = event + ", %s=\"%s\"" % (key, basic_fields[key])
+
+    for key in result:
+        converted_key = writer.convert_special_fields(key)
+
+        if converted_key is None or len(converted_key) == 0 or converted_key.startswith("_"):
+            continue
+
+        values = result[key] if isinstance(result[key], list) else [result[key]]
+
+        for value in values:
+            value = str(value)
+
+            if len(value) > 0:
+                event = event + ", %s=\"%s\"" % (converted_key, value.replace('\\', '\\\\').replace('"', '\\"'))
+
+    return event
+
+def benchmark_event_serialization(iterations):
+    """
+    Compare serializing events for the stash by concatenating the fields with collecting them in a
+    list, for the entries of the test feeds and for wide entries (with many links, tags, etc.).
+    """
+
+    writer = StashNewWriter(index="main", source_name="benchmark")
+    entries = []
+
+    for fixture in get_fixtures():
+        for entry in feedparser.parse(fixture).entries:
+            result = SyndicationModularInput.flatten(entry, sort=True)
+            result['_time'] = 1646909100
+            entries.append(result)
+
+    wide_entry = OrderedDict([('_time', 1646909100)])
+
+    for index in range(300):
+        wide_entry['links.%i.href' % index] = 'http://example.com/%s/entry-%i' % ('a' * (index % 40), index)
+
+    for wide_fields in (entries, [wide_entry]):
+        print("Event serialization (%i entries with %i fields on average, %i iterations)" % (len(wide_fields), sum(map(len, wide_fields)) // len(wide_fields), iterations))
+
+        concatenated = time_per_document(lambda result: event_to_string_concatenated(writer, result), wide_fields, iterations * 10)
+        print("  %-30s %10.1f us/event" % ("concatenated", concatenated))
+
+        joined = time_per_document(writer.event_to_string, wide_fields, iterations * 10)
+        same_output = "same events" if [writer.event_to_string(result) for result in wide_fields] == [event_to_string_concatenated(writer, result) for result in wide_fields] else "DIFFERENT EVENTS"
+        print("  %-30s %10.1f us/event %+6.1f%% %s" % ("joined", joined, (joined - concatenated) * 100 / concatenated, same_output))
+
+def write_events_to_buffer(writer, events):
+    """
+    Write the events the way StashNewWriter.write_events() does but to a buffer in memory (so that
+    the disk doesn't skew the results) and return the number of characters written.
+    """
+
+    buffer = io.StringIO()
+
+    for event in events:
+        buffer.writelines(writer.serialize_event_parts(event))
+
+    return buffer.tell()
+
+def benchmark_output_format(iterations):
+    """
+    Compare the speed of flattening and writing entries and the size of the events when they are
+    written as key/value pairs (with the fields sorted) and as JSON objects (unsorted, as the input
+    does).
+    """
+
+    entries = []
+
+    for fixture in get_fixtures():
+        entries.extend(feedparser.parse(fixture).entries)
+
+    wide_entry = {'links': [{'href': 'http://example.com/%s/entry-%i' % ('a' * (index % 40), index)} for index in range(300)]}
+
+    for feed_entries in (entries, [wide_entry]):
+        print("Output format (%i entries with %i fields on average, %i iterations)" % (len(feed_entries), sum([len(SyndicationModularInput.flatten(entry)) for entry in feed_entries]) // len(feed_entries), iterations))
+
+        results = {}
+
+        for output_format in event_writer.OUTPUT_FORMATS:
+            writer = StashNewWriter(index="main", source_name="benchmark", sourcetype=SyndicationModularInput.DEFAULT_SOURCETYPES[output_format], output_format=output_format)
+            sort_fields = output_format == event_writer.OUTPUT_FORMAT_KV
+
+            def flatten(entry):
+                result = SyndicationModularInput.flatten(entry, sort=sort_fields)
+                result['_time'] = 1646909100
+                return result
+
+            elapsed = time_per_document(lambda entry: write_events_to_buffer(writer, [flatten(entry)]), feed_entries, iterations * 10)
+            size = write_events_to_buffer(writer, [flatten(entry) for entry in feed_entries]) // len(feed_entries)
+            results[output_format] = (elapsed, size)
+
+        kv_elapsed, kv_size = results[event_writer.OUTPUT_FORMAT_KV]
+
+        for output_format in event_writer.OUTPUT_FORMATS:
+            elapsed, size = results[output_format]
+            print("  %-30s %10.1f us/entry %+6.1f%% %8i bytes/event %+6.1f%%" % (output_format, elapsed, (elapsed - kv_elapsed) * 100 / kv_elapsed, size, (size - kv_size) * 100.0 / kv_size))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+    else:
+        iterations = 20
+
+    benchmark_html_processing(iterations)
+    benchmark_conversion_store(iterations)
+    benchmark_html2text_scaling(iterations)
+    benchmark_parser_choice(iterations)
+    benchmark_encoding(iterations)
+    benchmark_date_parsing(iterations)
+    benchmark_flatten(iterations)
+    benchmark_event_serialization(iterations)
+    benchmark_output_format(iterations)
@@ -6,9 +6,16 @@ except:
 import os
 import sys
 import base64
+import gzip
+import time
 
 class TestWebServerHandler(BaseHTTPRequestHandler):
     ''' Main class to present webpages and authentication. '''
+
+    # The path and the Authorization header of each request that was received (so that tests can
+    # check the requests that were made)
+    requests = []
+
     def do_HEAD(self):
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
@@ -57,6 +64,12 @@ class TestWebServerHandler(BaseHTTPRequestHandler):
         return self.wfile.write(self.str_to_bytes(s))
 
     def do_GET(self):
+
+        TestWebServerHandler.requests.append((self.path, self.get_header('Authorization')))
+
+        # Simulate a server that is slow to respond
+        if 'slow' in self.path:
+            time.sleep(2)
         
         # Handle an invalid authentication request
         if 'invalid_auth' in self.path:
@@ -66,6 +79,23 @@ class TestWebServerHandler(BaseHTTPRequestHandler):
         elif 'no_realm_auth' in self.path:
             self.do_no_realm_AUTHHEAD()
 
+        # Handle a request that supports conditional requests using an ETag
+        elif 'etag' in self.path:
+            etag = '"' + os.path.basename(self.path) + '"'
+
+            if self.get_header('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+            else:
+                self.send_response(200)
+                self.send_header('Content-type', 'text/html')
+                self.send_header('ETag', etag)
+                self.end_headers()
+
+                with open( os.path.join("web_files", os.path.basename(self.path)), "r") as webfile:
+                    self.wfile.write(self.read_bytes(webfile))
+
         # If a request without authentication required, then handle the file directly
         elif 'auth' not in self.path:
             self.do_HEAD()
@@ -83,6 +113,19 @@ class TestWebServerHandler(BaseHTTPRequestHandler):
                 self.do_AUTHHEAD()
                 self.write_string('no auth header received')
             elif self.str_to_bytes(self.get_header('Authorization')) == (self.str_to_bytes('Basic ') + encoded_password):
+
+                # Compress the response if requested and the client supports it
+                if 'gzip' in self.path and 'gzip' in (self.get_header('Accept-Encoding') or ''):
+                    with open( os.path.join("web_files", os.path.basename(self.path)), "r") as webfile:
+                        content = gzip.compress(bytes(self.read_bytes(webfile)))
+
+                    self.send_response(200)
+                    self.send_header('Content-type', 'text/html')
+                    self.send_header('Content-Encoding', 'gzip')
+                    self.end_headers()
+                    self.wfile.write(content)
+                    return
+
                 self.do_HEAD()
                 #self.write_string(self.get_header('Authorization'))
                 #self.write_string('authenticated!')
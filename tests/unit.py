@@ -4,12 +4,21 @@ import sys
 import os
 import errno
 import time
+import tempfile
+import shutil
+import threading
+import logging
+import socket
+import io
+import calendar
+import json
+import base64
 from datetime import datetime, timedelta
 
 try:
-    from urllib.request import HTTPBasicAuthHandler
+    from urllib.request import HTTPBasicAuthHandler, build_opener
 except:
-    from urllib2 import HTTPBasicAuthHandler
+    from urllib2 import HTTPBasicAuthHandler, build_opener
 
 try:
     from urlparse import urlparse
@@ -19,8 +28,18 @@ except:
 sys.path.append( os.path.join("..", "src", "bin") )
 
 from syndication import SyndicationModularInput
+import html2text
+from modular_input import ModularInputConfig
+from syndication_app.event_writer import StashNewWriter
+from syndication_app import event_writer
+from syndication_app.conversion_store import ConversionStore
+from syndication_app.http_client import ConnectionPool, PooledHTTPSHandler, get_ssl_context, get_handlers
 from syndication_app import feedparser
+from syndication_app.feedparser import datetimes
+from syndication_app.feedparser.encodings import convert_to_utf8
+from syndication_app.html_converter import html_to_text, html_to_plain_text, get_converter, ConversionCache, ConversionPool, RAW_HTML_ELEMENTS
 from unit_test_web_server import UnitTestWithWebServer
+from test_web_server import TestWebServerHandler
 
 class SyndicationAppTestCase(UnitTestWithWebServer):
     
@@ -59,6 +78,19 @@ class TestSyndicationImport(SyndicationAppTestCase):
         
         self.assertIsNotNone(latest_date)
     
+    def test_iter_feed(self):
+        feed_state = {}
+        entries = SyndicationModularInput.iter_feed("http://127.0.0.1:8888/atom_example.xml", feed_state=feed_state)
+
+        # The feed isn't retrieved until the entries are consumed
+        self.assertEqual(feed_state, {})
+
+        results = list(entries)
+
+        self.assertGreaterEqual(len(results), 1)
+        self.assertEqual(results[0]['title'], SyndicationModularInput.get_feed("http://127.0.0.1:8888/atom_example.xml")[0]['title'])
+        self.assertIsNotNone(feed_state['latest_date'])
+
     def test_import_filter_by_date(self):
         # First get the date of the last item
         results, latest_date = SyndicationModularInput.get_feed("http://127.0.0.1:8888/atom_example.xml", return_latest_date=True)
@@ -83,6 +115,25 @@ class TestSyndicationImport(SyndicationAppTestCase):
         
         self.assertGreaterEqual(len(results), 0)
         
+    def test_import_not_modified(self):
+        feed_state = {}
+        results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/etag/rss_example.xml", feed_state=feed_state)
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(feed_state['etag'], '"rss_example.xml"')
+        self.assertFalse(feed_state['not_modified'])
+
+        # Get the feed again and make sure that the server reports that it wasn't modified
+        results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/etag/rss_example.xml", feed_state=feed_state)
+
+        self.assertEqual(len(results), 0)
+        self.assertTrue(feed_state['not_modified'])
+        self.assertEqual(feed_state['etag'], '"rss_example.xml"')
+
+    def test_import_read_timeout(self):
+        with self.assertRaises(socket.timeout):
+            SyndicationModularInput.get_feed("http://127.0.0.1:8888/slow/rss_example.xml", read_timeout=0.5)
+
     def test_basic_auth_rss(self):
         
         username = 'admin'
@@ -92,6 +143,33 @@ class TestSyndicationImport(SyndicationAppTestCase):
         
         self.assertEqual(len(results), 2)
 
+    def test_basic_auth_rss_compressed(self):
+        # The server only compresses the feed if asked to, which feedparser does
+        results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/auth/gzip/rss_example.xml", username="admin", password="changeme")
+
+        self.assertEqual(len(results), 2)
+
+    def test_basic_auth_rss_cached_realm(self):
+        feed_url = "http://127.0.0.1:8888/auth/cached_realm/rss_example.xml"
+        feed_state = {}
+
+        results = SyndicationModularInput.get_feed(feed_url, username="admin", password="changeme", feed_state=feed_state)
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(feed_state['auth_type'], 'Basic')
+        self.assertEqual(feed_state['auth_realm'], 'Test')
+        self.assertEqual(SyndicationModularInput.get_cached_auth_info(feed_url), ('Test', 'Basic'))
+
+        # The realm from the checkpoint should be used even if it isn't cached in memory
+        del SyndicationModularInput.auth_info_cache[feed_url]
+        del TestWebServerHandler.requests[:]
+
+        results = SyndicationModularInput.get_feed(feed_url, username="admin", password="changeme", feed_state=feed_state)
+        self.assertEqual(len(results), 2)
+
+        # The credentials are sent with the first request so there is no 401 round-trip
+        self.assertEqual(TestWebServerHandler.requests, [("/auth/cached_realm/rss_example.xml", "Basic " + base64.b64encode(b"admin:changeme").decode('ascii'))])
+
     def test_cleanup_html_rss(self):  
         # https://lukemurphey.net/issues/2038
         results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/rss_with_html.xml", clean_html=True)
@@ -99,6 +177,39 @@ class TestSyndicationImport(SyndicationAppTestCase):
         self.assertEqual(len(results), 3)
         self.assertEqual(results[2]['content.0.value'][:120], "  1. **Introduction**\n\nIt seems that Google Chrome extensions have become quite the tool for banking\nmalware fraudsters.")
 
+    def test_html_processing_text(self):
+        results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/rss_with_script.xml", clean_html=False, html_processing="text")
+
+        # The script and style are removed, the link is made absolute and the rest is converted
+        self.assertEqual(results[0]['summary'], "Hello **world**, see [the docs](http://127.0.0.1:8888/docs/page).\n\nSecond paragraph\n\n")
+
+        for removed in ('<', 'alert', 'color', 'evil'):
+            self.assertNotIn(removed, results[0]['summary'])
+
+    def test_html_processing_raw(self):
+        results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/rss_with_html.xml", html_processing="raw")
+        sanitized = SyndicationModularInput.get_feed("http://127.0.0.1:8888/rss_with_html.xml", clean_html=False)
+
+        self.assertEqual(len(results), 3)
+        self.assertIn('<p', results[2]['content.0.value'])
+        self.assertEqual(results[2]['title'], sanitized[2]['title'])
+
+    def test_html_processing_plain_text(self):
+        results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/rss_with_html.xml", html_processing="plaintext")
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[2]['content.0.value'][:99], "Introduction\nIt seems that Google Chrome extensions have become quite the tool for banking malware ")
+
+    def test_conversion_pool(self):
+        conversion_pool = ConversionPool(1, batch_size=2)
+
+        try:
+            results = SyndicationModularInput.get_feed("http://127.0.0.1:8888/rss_with_html.xml", clean_html=True, conversion_pool=conversion_pool)
+        finally:
+            conversion_pool.close()
+
+        self.assertEqual(results, SyndicationModularInput.get_feed("http://127.0.0.1:8888/rss_with_html.xml", clean_html=True))
+
     def test_get_auth_handler(self):
         auth_handler = SyndicationModularInput.get_auth_handler("http://127.0.0.1:8888/auth/rss_example.xml", username="admin", password="changeme")   
         
@@ -115,6 +226,18 @@ class TestSyndicationImport(SyndicationAppTestCase):
         self.assertEqual(auth_realm, None)
         self.assertEqual(auth_type, None)
 
+    def test_make_auth_handler_basic_sends_credentials_first(self):
+        auth_handler = SyndicationModularInput.make_auth_handler("http://127.0.0.1:8888/auth/rss_example.xml", "admin", "changeme", "Test", "Basic")
+
+        self.assertIsInstance(auth_handler, HTTPBasicAuthHandler)
+        self.assertTrue(auth_handler.passwd.is_authenticated("http://127.0.0.1:8888/auth/rss_example.xml"))
+
+        # The credentials are sent with the first request instead of after a 401 response
+        del TestWebServerHandler.requests[:]
+        build_opener(auth_handler).open("http://127.0.0.1:8888/auth/rss_example.xml").read()
+
+        self.assertEqual(TestWebServerHandler.requests, [("/auth/rss_example.xml", "Basic " + base64.b64encode(b"admin:changeme").decode('ascii'))])
+
     def test_get_realm_and_auth_type_invalid(self):
         auth_realm, auth_type = SyndicationModularInput.get_realm_and_auth_type("http://127.0.0.1:8888/invalid_auth/rss_example.xml", username="admin", password="changeme")   
         
@@ -222,6 +345,51 @@ class TestSyndicationOffline(unittest.TestCase):
         d = SyndicationModularInput.flatten(d)
         self.assertEqual(d['time'], '2015-02-09T00:00:00Z')
 
+    def test_flatten_entry(self):
+        entry = SyndicationModularInput.fetch_feed(os.path.join("web_files", "rss_example.xml")).entries[0]
+        FeedParserDict = type(entry)
+
+        d = SyndicationModularInput.flatten(entry, sort=True)
+
+        self.assertEqual(d['title'], entry.title)
+        self.assertEqual(d['links.0.href'], entry.links[0].href)
+        self.assertEqual(list(d.keys()), sorted(d.keys()))
+
+        # FeedParserDicts return the value of another key for some keys
+        d = SyndicationModularInput.flatten(FeedParserDict([('url', 'old'), ('href', 'new'), ('tags', [FeedParserDict(term='news')]), ('category', 'old')]))
+
+        self.assertEqual(d['url'], 'new')
+        self.assertEqual(d['category'], 'news')
+        self.assertEqual(d['tags.0.term'], 'news')
+
+    def test_flatten_reuses_names(self):
+        entry = SyndicationModularInput.fetch_feed(os.path.join("web_files", "rss_example.xml")).entries[0]
+
+        SyndicationModularInput.flattened_names.clear()
+        d = SyndicationModularInput.flatten(entry)
+
+        # The names of list items are remembered by their index
+        self.assertEqual(SyndicationModularInput.flattened_names[('links', 0)], 'links.0')
+
+        # Flattening another entry with the same fields doesn't need any new names
+        flattened_names = dict(SyndicationModularInput.flattened_names)
+        original_get_flattened_name = SyndicationModularInput.__dict__['get_flattened_name']
+        names_made = []
+
+        def get_flattened_name(cls, name, key):
+            names_made.append((name, key))
+            return original_get_flattened_name.__func__(cls, name, key)
+
+        SyndicationModularInput.get_flattened_name = classmethod(get_flattened_name)
+
+        try:
+            self.assertEqual(SyndicationModularInput.flatten(entry), d)
+        finally:
+            SyndicationModularInput.get_flattened_name = original_get_flattened_name
+
+        self.assertEqual(names_made, [])
+        self.assertEqual(SyndicationModularInput.flattened_names, flattened_names)
+
     def test_get_proxy_handler_none(self):
         self.assertIsNone(SyndicationModularInput.get_proxy_handler(None))
 
@@ -243,6 +411,23 @@ class TestSyndicationOffline(unittest.TestCase):
 
         self.assertEqual(SyndicationModularInput.get_timestamp(event), datetime(2022, 3, 10, 10, 46))
     
+    def test_get_last_entry_timestamp(self):
+        self.assertEqual(SyndicationModularInput.get_last_entry_timestamp({'last_entry_timestamp': 1646909100}), 1646909100)
+        self.assertIsNone(SyndicationModularInput.get_last_entry_timestamp({'last_run': 1646909100}))
+
+        # Older checkpoints have the UTC time as if it was local time
+        self.assertEqual(SyndicationModularInput.get_last_entry_timestamp({'last_entry_date': time.mktime((2022, 3, 10, 10, 45, 0, 3, 69, -1))}), 1646909100)
+
+    def test_iter_feed_timestamps(self):
+        feed_state = {}
+        results = list(SyndicationModularInput.iter_feed(os.path.join("web_files", "atom_example.xml"), feed_state=feed_state))
+
+        self.assertEqual(results[0]['_time'], calendar.timegm(time.strptime(results[0]['updated_parsed'], '%Y-%m-%dT%H:%M:%SZ')))
+        self.assertEqual(feed_state['latest_timestamp'], max(result['_time'] for result in results))
+
+        # Entries that aren't later than the timestamp are skipped
+        self.assertEqual(len(list(SyndicationModularInput.iter_feed(os.path.join("web_files", "atom_example.xml"), include_later_than=feed_state['latest_timestamp']))), 0)
+
     def test_get_timestamp_default(self):
         event = {
             'noasdasd': 'Not a date!'
@@ -257,5 +442,558 @@ class TestSyndicationOffline(unittest.TestCase):
 
         self.assertIsNotNone(SyndicationModularInput.get_timestamp(event))
 
+class RecordingSyndicationModularInput(SyndicationModularInput):
+    """
+    A syndication input that records the stanzas that were run instead of retrieving the feeds.
+    """
+
+    def __init__(self):
+        SyndicationModularInput.__init__(self)
+        self.stanzas_run = []
+        self.release = threading.Event()
+        self.logger = logging.getLogger("RecordingSyndicationModularInput")
+
+    def run(self, stanza, cleaned_params, input_config):
+        self.stanzas_run.append(stanza)
+        self.release.wait(10)
+
+class TestSyndicationScheduling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="TestSyndicationScheduling")
+        self.syndication_input = RecordingSyndicationModularInput()
+
+    def tearDown(self):
+        self.syndication_input.release.set()
+        self.syndication_input.do_shutdown()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_input_config(self, configuration):
+        return ModularInputConfig("localhost", "https://127.0.0.1:8089", None, self.tmp_dir, configuration)
+
+    def make_conf(self, url, **kwargs):
+        conf = {
+            'url': url,
+            'interval': '1h',
+            'include_only_changed': '1',
+            'clean_html': '0'
+        }
+
+        conf.update(kwargs)
+        return conf
+
+    def test_dispatch_limits_connections_per_host(self):
+        input_config = self.make_input_config({
+            'syndication://one': self.make_conf("http://127.0.0.1:8888/rss_example.xml", max_connections_per_host='1'),
+            'syndication://two': self.make_conf("http://127.0.0.1:8888/atom_example.xml", max_connections_per_host='1'),
+            'syndication://three': self.make_conf("http://localhost:8888/atom_example.xml")
+        })
+
+        self.syndication_input.dispatch_stanzas(input_config)
+
+        self.assertEqual(len(self.syndication_input.running_stanzas), 2)
+        self.assertIn('syndication://three', self.syndication_input.running_stanzas)
+
+        # Running inputs don't get dispatched again
+        self.syndication_input.dispatch_stanzas(input_config)
+        self.assertEqual(len(self.syndication_input.running_stanzas), 2)
+
+        # The deferred input runs once the host is free
+        self.syndication_input.release.set()
+        self.syndication_input.wait_for_stanzas()
+        self.syndication_input.dispatch_stanzas(input_config)
+        self.syndication_input.wait_for_stanzas()
+
+        self.assertEqual(set(self.syndication_input.stanzas_run), set(input_config.configuration.keys()))
+
+    def test_enforce_deadline(self):
+        input_config = self.make_input_config({
+            'syndication://one': self.make_conf("http://127.0.0.1:8888/rss_example.xml", worker_threads='1'),
+            'syndication://two': self.make_conf("http://localhost:8888/atom_example.xml")
+        })
+
+        self.syndication_input.dispatch_stanzas(input_config)
+        self.assertEqual(len(self.syndication_input.running_stanzas), 2)
+
+        # The input waiting for the only worker thread gets cancelled; the running one is left alone
+        self.syndication_input.enforce_deadline(-1)
+
+        self.assertEqual(len(self.syndication_input.running_stanzas), 1)
+        self.assertEqual(len(self.syndication_input.overrun_stanzas), 1)
+
+    def test_get_worker_count(self):
+        stanzas = [
+            ('syndication://one', {'worker_threads': 2}),
+            ('syndication://two', {'worker_threads': 8}),
+            ('syndication://three', {})
+        ]
+
+        self.assertEqual(SyndicationModularInput.get_worker_count(stanzas), 8)
+        self.assertEqual(SyndicationModularInput.get_worker_count([]), SyndicationModularInput.DEFAULT_WORKER_THREADS)
+
+class FakeConnection(object):
+    """
+    Stands in for a HTTP connection in the connection pool tests.
+    """
+
+    def __init__(self):
+        self.sock = object()
+
+    def close(self):
+        self.sock = None
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_get_returns_idle_connection(self):
+        pool = ConnectionPool()
+        connection = FakeConnection()
+
+        self.assertIsNone(pool.get('host'))
+
+        pool.put('host', connection)
+        self.assertIs(pool.get('host'), connection)
+        self.assertIsNone(pool.get('host'))
+
+    def test_put_limits_idle_connections(self):
+        pool = ConnectionPool(max_idle_per_host=1)
+        first = FakeConnection()
+        second = FakeConnection()
+
+        pool.put('host', first)
+        pool.put('host', second)
+
+        self.assertIsNone(second.sock)
+        self.assertIs(pool.get('host'), first)
+
+    def test_evict_idle(self):
+        pool = ConnectionPool(idle_timeout=-1)
+        connection = FakeConnection()
+
+        pool.put('host', connection)
+        pool.evict_idle()
+
+        self.assertIsNone(connection.sock)
+        self.assertEqual(pool.idle_connections, {})
+
+class TestSSLContext(unittest.TestCase):
+
+    def test_context_is_shared(self):
+        self.assertIs(get_ssl_context(), get_ssl_context())
+        self.assertIs(PooledHTTPSHandler()._context, get_ssl_context())
+
+    def test_handlers_use_shared_context(self):
+        https_handler = get_handlers()[1]
+        self.assertIs(https_handler._context, get_ssl_context())
+
+class TestFeedStreaming(unittest.TestCase):
+
+    def parse_both(self, data):
+        buffered = feedparser.parse(data)
+
+        # Use a tiny chunk size so that tags and characters are split across chunks
+        chunk_size = feedparser.api.STREAM_CHUNK_SIZE
+        feedparser.api.STREAM_CHUNK_SIZE = 7
+
+        try:
+            streamed = feedparser.parse(io.BytesIO(data), stream=True)
+        finally:
+            feedparser.api.STREAM_CHUNK_SIZE = chunk_size
+
+        return buffered, streamed
+
+    def test_stream_matches_buffered(self):
+        for file_name in ['rss_example.xml', 'atom_example.xml', 'rss_with_html.xml']:
+            with open(os.path.join("web_files", file_name), 'rb') as f:
+                data = f.read()
+
+            buffered, streamed = self.parse_both(data)
+
+            self.assertFalse(streamed.bozo)
+            self.assertEqual(streamed.version, buffered.version)
+            self.assertEqual(streamed.feed, buffered.feed)
+            self.assertEqual(streamed.entries, buffered.entries)
+
+    def test_stream_malformed(self):
+        data = u'<?xml version="1.0"?><rss version="2.0"><channel><item><title>Caf\u00e9 & more</title></item></channel></rss>'.encode('utf-8')
+
+        buffered, streamed = self.parse_both(data)
+
+        # The loose parser ought to be used just like when the feed isn't streamed
+        self.assertTrue(streamed.bozo)
+        self.assertEqual(streamed.entries, buffered.entries)
+        self.assertEqual(streamed.entries[0].title, u'Caf\u00e9 & more')
+
+    def test_loose_parser(self):
+        data = u'<?xml version="1.0"?><rss version="2.0"><channel><item><title>Caf\u00e9 & more</title></item></channel></rss>'.encode('utf-8')
+
+        parsed = feedparser.parse(io.BytesIO(data), stream=True)
+        loose = feedparser.parse(io.BytesIO(data), stream=True, parser='loose')
+
+        self.assertEqual(parsed.parser, 'loose')
+        self.assertEqual(loose.parser, 'loose')
+        self.assertEqual(loose.entries, parsed.entries)
+        self.assertEqual(feedparser.parse(data.replace(b'&', b'and')).parser, 'strict')
+
+    def test_fetch_feed_remembers_parser(self):
+        tmp_dir = tempfile.mkdtemp(prefix="TestFeedStreaming")
+        feed_path = os.path.join(tmp_dir, "malformed.xml")
+
+        with open(feed_path, 'wb') as f:
+            f.write(b'<?xml version="1.0"?><rss version="2.0"><channel><item><title>This & that</title></item></channel></rss>')
+
+        try:
+            feed_state = {}
+
+            # The strict parser fails on the first poll
+            self.assertTrue(SyndicationModularInput.fetch_feed(feed_path, feed_state=feed_state).bozo)
+            self.assertEqual(feed_state['parser'], 'loose')
+
+            # The loose parser is used straight away on the next one
+            d = SyndicationModularInput.fetch_feed(feed_path, feed_state=feed_state)
+            self.assertFalse(d.bozo)
+            self.assertEqual(d.entries[0].title, 'This & that')
+
+            # The strict parser is tried again once the retry interval has passed
+            feed_state['strict_parser_tried'] -= SyndicationModularInput.STRICT_PARSER_RETRY_INTERVAL
+            self.assertTrue(SyndicationModularInput.fetch_feed(feed_path, feed_state=feed_state).bozo)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_encoding_hint(self):
+        # Declared as UTF-8 but actually in windows-1252
+        data = u'<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><item><title>Caf\xe9 €</title></item></channel></rss>'.encode('windows-1252')
+
+        detected = feedparser.parse(data)
+        hinted = feedparser.parse(data, encoding_hint=detected.encoding)
+
+        self.assertEqual(hinted.encoding, detected.encoding)
+        self.assertEqual(hinted.entries, detected.entries)
+        self.assertEqual(hinted.entries[0].title, u'Caf\xe9 €')
+
+        # A hint that doesn't work is skipped
+        self.assertEqual(feedparser.parse(data, encoding_hint='no-such-encoding').entries, detected.entries)
+
+    def test_utf8_passed_through(self):
+        data = u'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><item><title>Caf\xe9</title></item></channel></rss>'.encode('utf-8')
+        result = {}
+
+        # Documents that are already UTF-8 don't need to be converted
+        self.assertIs(convert_to_utf8({}, data, result), data)
+        self.assertEqual(result['encoding'], 'utf-8')
+
+        # The declaration is still updated when it declares something else
+        converted = convert_to_utf8({}, data.replace(b'UTF-8', b'us-ascii'), result)
+
+        self.assertEqual(converted, b"<?xml version='1.0' encoding='utf-8'?>" + data[data.index(b'?>') + 2:])
+        self.assertEqual(result['encoding'], 'utf-8')
+
+class TestDateParsing(unittest.TestCase):
+
+    def test_parse_date(self):
+        self.assertEqual(tuple(datetimes._parse_date('Sat, 07 Oct 2023 12:34:56 GMT'))[:6], (2023, 10, 7, 12, 34, 56))
+        self.assertEqual(tuple(datetimes._parse_date('2023-10-07T12:34:56+02:00'))[:6], (2023, 10, 7, 10, 34, 56))
+        self.assertEqual(tuple(datetimes._parse_date('Sun Jan  4 16:29:06 PST 2004'))[:6], (2004, 1, 5, 0, 29, 6))
+        self.assertIsNone(datetimes._parse_date('Not a date'))
+
+        # The result is remembered
+        self.assertIs(datetimes._parse_date('Sat, 07 Oct 2023 12:34:56 GMT'), datetimes._parse_date('Sat, 07 Oct 2023 12:34:56 GMT'))
+
+    def test_register_date_handler(self):
+        self.assertIsNone(datetimes._parse_date('Stardate 41153.7'))
+
+        def parse_stardate(date_string):
+            if date_string.startswith('Stardate'):
+                return time.gmtime(0)
+
+        datetimes.registerDateHandler(parse_stardate)
+
+        try:
+            # Dates that were remembered before the handler was registered are parsed again
+            self.assertEqual(datetimes._parse_date('Stardate 41153.7'), time.gmtime(0))
+        finally:
+            datetimes._date_handlers.remove(parse_stardate)
+            datetimes._parse_date_cached.cache_clear()
+
+class TestHTMLConverter(unittest.TestCase):
+
+    def test_html_to_text(self):
+        text = html_to_text('<p>Read <a href="/more">more</a></p><script>alert(1)</script>', 'http://example.com/blog/')
+        self.assertEqual(text, "Read [more](http://example.com/more)\n\n")
+
+    def test_html_to_text_drops_unsafe_links(self):
+        text = html_to_text('<a href="javascript:alert(1)">click</a>', 'http://example.com/')
+        self.assertNotIn("javascript", text)
+
+    def test_html_to_text_matches_sanitized(self):
+        html = '<p>a<applet>b</applet> <iframe src="x">c</iframe> d <img src="i.png" alt="i"></p>'
+        parsed = feedparser.parse(u'<rss version="2.0" xml:base="http://example.com/"><channel><item><description><![CDATA[%s]]></description></item></channel></rss>' % html)
+
+        # The result ought to be the same as when feedparser resolves and sanitizes the HTML first
+        self.assertEqual(html_to_text(html, parsed.entries[0].summary_detail.base), html2text.html2text(parsed.entries[0].summary))
+
+    def test_html_to_plain_text(self):
+        text = html_to_plain_text('<p>Read <b>more</b> &amp; <a href="/more">more</a></p><script>alert(1)</script><ul><li>one</li><li>two</li></ul>')
+        self.assertEqual(text, "Read more & more\none\ntwo")
+
+    def test_html_to_plain_text_no_markup(self):
+        self.assertEqual(html_to_plain_text('  Just\n  text '), "Just text")
+
+    def test_conversion_cache(self):
+        html = '<p>Read <a href="/more">more</a></p>'
+        parsed = feedparser.parse(u'<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" xml:base="http://example.com/"><channel><item><description><![CDATA[%s]]></description><content:encoded><![CDATA[%s]]></content:encoded></item></channel></rss>' % (html, html), raw_html_elements=RAW_HTML_ELEMENTS)
+        entry = parsed.entries[0]
+
+        conversion_cache = ConversionCache()
+        SyndicationModularInput.clean_entry_html(entry, conversion_cache=conversion_cache)
+
+        # The summary, summary_detail and content all have the same HTML so it is only converted once
+        self.assertEqual(conversion_cache.misses, 1)
+        self.assertEqual(conversion_cache.hits, 2)
+        self.assertEqual(entry['summary'], "Read [more](http://example.com/more)\n\n")
+        self.assertEqual(entry['summary_detail']['value'], entry['summary'])
+        self.assertEqual(entry['content'][0]['value'], entry['summary'])
+
+    def test_converter_reused(self):
+        # A document that leaves the converter in the middle of a list and a pre block
+        html_to_text('<ul><li><pre>unfinished', 'http://example.com/')
+
+        self.assertIs(get_converter(), get_converter())
+        self.assertEqual(html_to_text('<p>Read <a href="/more">more</a></p>', 'http://example.com/blog/'), "Read [more](http://example.com/more)\n\n")
+        self.assertEqual(html_to_text('<b>bold</b> &amp; <i>plain</i>', sanitize=False), html2text.html2text('<b>bold</b> &amp; <i>plain</i>'))
+
+    def test_converter_per_thread(self):
+        converters = []
+        thread = threading.Thread(target=lambda: converters.append(get_converter()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(converters[0], get_converter())
+
+class TestConversionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="TestConversionStore")
+        self.store = ConversionStore(os.path.join(self.tmp_dir, ConversionStore.FILE_NAME), max_entries=2)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_put(self):
+        key = ConversionStore.make_key(('text', '<b>a</b>', ''))
+
+        self.assertIsNone(self.store.get(key))
+        self.store.put(key, '**a**')
+        self.store.commit()
+
+        self.assertEqual(self.store.get(key), '**a**')
+        self.assertNotEqual(key, ConversionStore.make_key(('text', '<b>a</b>', 'http://example.com/')))
+
+    def test_evicts_least_recently_used(self):
+        for value in ['a', 'b']:
+            self.store.put(value, value)
+            self.store.commit()
+
+        # Use the first one so that the second is the least recently used
+        time.sleep(0.01)
+        self.store.get('a')
+        self.store.put('c', 'c')
+        self.store.commit()
+
+        self.assertEqual(self.store.get('a'), 'a')
+        self.assertIsNone(self.store.get('b'))
+        self.assertEqual(self.store.get('c'), 'c')
+
+    def test_get_feed_uses_store(self):
+        self.store.max_entries = 100
+        feed = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web_files", "rss_with_html.xml")
+
+        feed_state = {}
+        results = SyndicationModularInput.get_feed(feed, clean_html=True, feed_state=feed_state, conversion_store=self.store)
+        conversions = feed_state['html_conversions']
+
+        # Nothing ought to need to be converted on the next poll
+        self.assertEqual(SyndicationModularInput.get_feed(feed, clean_html=True, feed_state=feed_state, conversion_store=self.store), results)
+        self.assertEqual(feed_state['html_conversions'], 0)
+        self.assertEqual(feed_state['html_conversions_stored'], conversions)
+
+class TempDirStashNewWriter(StashNewWriter):
+    """
+    A stash writer that writes into a temporary directory instead of Splunk's directories (the
+    files are written in the "run" directory and moved into the "spool" directory).
+    """
+
+    def __init__(self, directory, *args, **kwargs):
+        StashNewWriter.__init__(self, *args, **kwargs)
+        self.directory = os.path.join(directory, "spool")
+        self.temp_directory = os.path.join(directory, "run")
+        self.file_count = 0
+
+        for path in (self.directory, self.temp_directory):
+            if not os.path.isdir(path):
+                os.mkdir(path)
+
+    def get_file_name(self):
+        self.file_count += 1
+        return os.path.join(self.directory, "stash_%i%s" % (self.file_count, self.file_extension))
+
+    def get_temp_file_name(self, stash_file):
+        return os.path.join(self.temp_directory, os.path.basename(stash_file) + self.TEMP_FILE_EXTENSION)
+
+class TestStashNewWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="TestStashNewWriter")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_file(self, file_name):
+        with open(file_name) as file_h:
+            return file_h.read()
+
+    def test_write_events_batched(self):
+        writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", sourcetype="syndication")
+        events = [{'title': 'Entry %i' % i} for i in range(5)]
+
+        stash_files = writer.write_events_batched(events)
+
+        self.assertEqual(len(stash_files), 1)
+        content = self.read_file(stash_files[0])
+        self.assertEqual(content.count(StashNewWriter.LINE_BREAKER), 5)
+        self.assertEqual(content.count('sourcetype="syndication"'), 5)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, "spool")), ["stash_1.stash_new"])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, "run")), [])
+
+    def test_write_events_batched_only_complete_files_in_spool(self):
+        writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", max_events_per_file=2)
+        spool_dir = os.path.join(self.tmp_dir, "spool")
+        run_dir = os.path.join(self.tmp_dir, "run")
+
+        def events():
+            for i in range(5):
+                # The files are written in the run directory and are only moved into the spool
+                # directory once they are all complete
+                self.assertEqual(len(os.listdir(run_dir)), (i + 1) // 2)
+                self.assertEqual(os.listdir(spool_dir), [])
+
+                yield {'title': 'Entry %i' % i}
+
+        stash_files = writer.write_events_batched(events())
+
+        self.assertEqual(os.listdir(run_dir), [])
+        self.assertEqual(sorted(os.listdir(spool_dir)), ["stash_1.stash_new", "stash_2.stash_new", "stash_3.stash_new"])
+        self.assertEqual(stash_files, [os.path.join(spool_dir, name) for name in sorted(os.listdir(spool_dir))])
+
+    def test_write_events_batched_max_events(self):
+        writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", max_events_per_file=2)
+        events = [{'title': 'Entry %i' % i} for i in range(5)]
+
+        stash_files = writer.write_events_batched(events)
+
+        self.assertEqual(len(stash_files), 3)
+        self.assertEqual(self.read_file(stash_files[0]).count(StashNewWriter.LINE_BREAKER), 2)
+        self.assertEqual(self.read_file(stash_files[2]).count(StashNewWriter.LINE_BREAKER), 1)
+
+    def test_write_events_batched_max_bytes(self):
+        writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", max_bytes_per_file=1)
+        events = [{'title': 'Entry %i' % i} for i in range(3)]
+
+        # Each file gets at least one event even if the event is larger than the limit
+        self.assertEqual(len(writer.write_events_batched(events)), 3)
+
+    def test_write_events_batched_failure_not_indexed(self):
+        spool_dir = os.path.join(self.tmp_dir, "spool")
+        run_dir = os.path.join(self.tmp_dir, "run")
+
+        def events(fail_after=None):
+            for i in range(5):
+                if i == fail_after:
+                    raise IOError("The connection was reset")
+
+                yield {'title': 'Entry %i' % i, '_time': 1646909100}
+
+        # Files with one event (as when not batching) and with several
+        for max_events_per_file in (1, 2):
+            writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", max_events_per_file=max_events_per_file)
+
+            # The events that were written before the failure aren't indexed
+            self.assertRaises(IOError, writer.write_events_batched, events(fail_after=3))
+            self.assertEqual(os.listdir(spool_dir), [])
+            self.assertEqual(os.listdir(run_dir), [])
+            self.assertEqual(writer.events_written, 0)
+
+            # So each entry is only indexed once when they are written again on the next run
+            stash_files = writer.write_events_batched(events())
+            content = ''.join([self.read_file(stash_file) for stash_file in stash_files])
+
+            self.assertEqual(writer.events_written, 5)
+
+            for i in range(5):
+                self.assertEqual(content.count('title="Entry %i"' % i), 1)
+
+            for stash_file in stash_files:
+                os.remove(stash_file)
+
+    def test_write_events_batched_max_bytes_encoded(self):
+        events = [{'title': u'\u00e9' * 200, '_time': 1646909100} for i in range(3)]
+        characters = len(StashNewWriter(index="main", source_name="test").serialize_event(events[0]))
+
+        # Two of the events fit in the limit if it were counted in characters but not in bytes
+        writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", max_bytes_per_file=(2 * characters) + 10)
+        stash_files = writer.write_events_batched(events)
+
+        self.assertEqual(len(stash_files), 3)
+
+        for stash_file in stash_files:
+            self.assertLessEqual(os.path.getsize(stash_file) - len(writer.get_header()), characters + 200)
+
+            with io.open(stash_file, encoding='utf-8') as file_h:
+                self.assertIn(u'\u00e9' * 200, file_h.read())
+
+    def test_event_to_string_timestamp(self):
+        writer = StashNewWriter(index="main", source_name="test")
+
+        event = writer.event_to_string({'title': 'Entry', '_time': 1646909100})
+
+        self.assertTrue(event.startswith('03/10/2022 10:45:00 UTC, _time="1646909100"'))
+        self.assertIn('title="Entry"', event)
+
+        # Naive datetimes are in UTC
+        self.assertEqual(writer.event_to_string({'title': 'Entry'}, datetime(2022, 3, 10, 10, 45)), event.replace(', orig_time="1646909100"', ''))
+
+    def test_event_to_string_escaping(self):
+        writer = StashNewWriter(index="main", source_name="test")
+
+        event = writer.event_to_string({'title': 'A "quoted" \\ title', 'tags': ['one', '', 'two'], 'host': 'example.com', 'date_hour': '10'}, 1646909100)
+
+        self.assertTrue(event.endswith(', title="A \\"quoted\\" \\\\ title", tags="one", tags="two", orig_host="example.com"'))
+
+    def test_write_events_batched_same_as_serialized(self):
+        writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", sourcetype="syndication")
+        events = [{'title': 'Entry "%i"' % i, 'links': ['http://example.com/%i' % i, ''], '_time': 1646909100} for i in range(3)]
+
+        stash_files = writer.write_events_batched(events)
+
+        self.assertTrue(self.read_file(stash_files[0]).endswith(''.join([writer.serialize_event(event) for event in events])))
+
+    def test_event_to_json(self):
+        writer = StashNewWriter(index="main", source_name="test")
+
+        event = writer.event_to_json({'title': 'A "quoted" title', 'tags': ['one', '', 'two'], 'host': 'example.com', 'summary': '', '_time': 1646909100})
+
+        self.assertTrue(event.startswith('{"timestamp":"03/10/2022 10:45:00 UTC",'))
+        self.assertEqual(json.loads(event), {'timestamp': '03/10/2022 10:45:00 UTC', 'title': 'A "quoted" title', 'tags': ['one', 'two'], 'orig_host': 'example.com', 'orig_time': '1646909100'})
+
+    def test_write_events_batched_json(self):
+        writer = TempDirStashNewWriter(self.tmp_dir, index="main", source_name="test", sourcetype="syndication_json", output_format=event_writer.OUTPUT_FORMAT_JSON)
+        events = [{'title': 'Entry %i' % i, '_time': 1646909100} for i in range(2)]
+
+        stash_files = writer.write_events_batched(events)
+
+        lines = self.read_file(stash_files[0]).split("\n")
+        self.assertEqual(lines[2], 'sourcetype="syndication_json"{"timestamp":"03/10/2022 10:45:00 UTC","title":"Entry 0","orig_time":"1646909100"}')
+        self.assertEqual(lines[4], lines[2].replace("Entry 0", "Entry 1"))
+
 if __name__ == '__main__':
     unittest.main()